@@ -1,6 +1,12 @@
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
 from spotify_manager import SpotifyManager
 from history_manager import HistoryManager
+from search_tracker import SearchTracker
+from live_analysis import LiveAnalysis
+from cover_engine import CoverEngine
+from warmup import PlaylistWarmer
+from token_manager import TokenManager
+from library_analytics import LibraryAnalytics
 from config import Config
 import webbrowser
 import threading
@@ -14,10 +20,31 @@ app = Flask(__name__)
 # Load Config
 app.config.from_object(Config)
 
+# jsonify() also serializes the compact TrackRecord used for tracks/matches
+from track_records import TrackJSONProvider
+app.json = TrackJSONProvider(app)
+
 # Initialize Session Interface
 from flask_session import Session
 Session(app)
 
+# Compression, ETags and hashed static URLs
+from response_optimizer import ResponseOptimizer
+response_optimizer = ResponseOptimizer(app)
+
+# Template bytecode cache + per-row fragment cache
+from template_cache import init_template_cache
+init_template_cache(app)
+
+# Queued structured logging (a listener thread writes; requests only enqueue)
+from log_config import get_logger, init_request_logging, sampled_dropped, setup_logging
+setup_logging()
+init_request_logging(app)
+log = get_logger(__name__)
+
+# Server-side cover rendering (process pool, JPEG under Spotify's 256 KB limit)
+cover_engine = CoverEngine()
+
 # --- OAUTH SETUP ---
 def create_spotify_oauth():
     """
@@ -29,13 +56,13 @@ def create_spotify_oauth():
     redirect_uri = app.config['SPOTIPY_REDIRECT_URI']
 
     # Debug Printing
-    if not client_id: print("DEBUG ERROR: Missing SPOTIPY_CLIENT_ID")
-    if not client_secret: print("DEBUG ERROR: Missing SPOTIPY_CLIENT_SECRET")
-    if not redirect_uri: print("DEBUG ERROR: Missing SPOTIPY_REDIRECT_URI")
+    if not client_id: log.error("Missing SPOTIPY_CLIENT_ID")
+    if not client_secret: log.error("Missing SPOTIPY_CLIENT_SECRET")
+    if not redirect_uri: log.error("Missing SPOTIPY_REDIRECT_URI")
 
     # Check for placeholders
     if client_id == "your_client_id_here" or client_secret == "your_client_secret_here":
-        print("CRITICAL ERROR: You have not updated the .env file with your real Spotify Credentials!")
+        log.critical("You have not updated the .env file with your real Spotify Credentials!")
         return None
 
     if not client_id or not client_secret or not redirect_uri:
@@ -49,6 +76,9 @@ def create_spotify_oauth():
     )
 
 history_mgr = HistoryManager()
+playlist_warmer = PlaylistWarmer(history_mgr)
+token_manager = TokenManager(create_spotify_oauth)
+library_analytics = LibraryAnalytics()
 
 def get_sp_manager():
     """
@@ -59,17 +89,15 @@ def get_sp_manager():
     if not token_info:
         return None
     
-    # Check if token is expired and refresh if needed
-    sp_oauth = create_spotify_oauth()
-    if sp_oauth and sp_oauth.is_token_expired(token_info):
-        try:
-            token_info = sp_oauth.refresh_access_token(token_info['refresh_token'])
-            session['token_info'] = token_info
-        except Exception as e:
-            print(f"CRITICAL: Error refreshing token in get_sp_manager: {type(e).__name__}: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
+    # Refresh is coalesced per user across threads/workers and done ahead of expiry
+    try:
+        fresh = token_manager.get_token(token_info)
+    except Exception as e:
+        log.error("Error refreshing token in get_sp_manager: %s: %s", type(e).__name__, e,
+                  exc_info=True, extra={'upstream': 'spotify-accounts'})
+        return None
+    if fresh is not token_info:
+        session['token_info'] = token_info = fresh
 
     sp = SpotifyManager()
     try:
@@ -137,6 +165,8 @@ def callback():
         token_info = sp_oauth.get_access_token(code)
         session['token_info'] = token_info
         session['visual_login_success'] = True # Flag for frontend animation if needed
+        # Warm playlist index, recent track lists and BPMs in the background
+        playlist_warmer.start(token_info)
         return redirect(url_for('home'))
     except Exception as e:
         flash(f"Error de login: {e}", "error")
@@ -164,16 +194,15 @@ def my_playlists():
     current_user_id = None
     
     try:
-        user = sp.sp.current_user()
         playlists = sp.get_user_playlists()
-        current_user_id = user['id']
+        current_user_id = sp.user['id']
             
     except spotipy.exceptions.SpotifyException as e:
         if e.http_status == 401:
             raise e
         flash(f"Error de Spotify: {e}", "error")
     except Exception as e:
-        print(f"DEBUG ERROR: {e}")
+        log.warning("Error loading playlists: %s", e, extra={'upstream': 'spotify'})
         flash(f"Error conectando con Spotify: {e}", "error")
     
     return render_template('playlists.html', page='playlists', playlists=playlists, current_user_id=current_user_id)
@@ -267,65 +296,21 @@ def playlist_edit(playlist_id):
     sp = get_sp_manager()
     try:
         # Get tracks
-        tracks = sp.get_playlist_tracks(playlist_id)
-        playlist_info = sp.sp.playlist(playlist_id)
+        playlist_info = sp.sp.playlist(playlist_id, fields=SpotifyManager.PLAYLIST_HEADER_FIELDS)
+        tracks = sp.get_playlist_tracks(playlist_id, snapshot_id=playlist_info.get('snapshot_id'))
         
-        results = []
-        # Prepare IDs for bulk feature fetch
-        track_ids = [t['id'] for t in tracks if t.get('id')]
-        # NOTE: Spotify Audio Features API is blocked (403). 
-        # BPM/Key will be fetched via Deezer in frontend or manual edit.
-        features = {} 
+        # NOTE: Spotify Audio Features API is blocked (403).
+        # BPM/Key are fetched lazily by review.html (/enrich) or edited manually.
+        # The cached records are used as matches directly; each group wraps one.
+        formatted_results = [{'query': f"{t['name']} - {t['artist']}", 'matches': [t]} for t in tracks]
 
-        for t in tracks:
-            # Default values since we can't bulk-fetch features anymore
-            bpm = 0
-            key_name = "?"
-
-            # Construct a match object that matches review.html expectation
-            track_obj = {
-                'id': t['id'],
-                'uri': t['uri'],
-                'name': t['name'],
-                'artist': t['artist'], 
-                'album': t['album'],
-                'image': t['image'], 
-                'bpm': bpm,
-                'key': key_name,
-                'preview_url': t['preview_url'],
-                'external_urls': {'spotify': f"https://open.spotify.com/track/{t['id']}"},
-                'artist_ids': []
-            }
-            results.append(track_obj) # Temporarily store to enrich
-
-
-        # Deezer BPM Enrichment for missing tracks
-        missing_bpm_tracks = [tr for tr in results if tr.get('bpm', 0) == 0]
-        if missing_bpm_tracks:
-            from concurrent.futures import ThreadPoolExecutor
-            def _repair(tr):
-                b = sp._fetch_deezer_bpm(tr['artist'], tr['name'])
-                if b > 0: tr['bpm'] = b
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                executor.map(_repair, missing_bpm_tracks)
-
-
-
-        # Final Formatting for review.html
-        formatted_results = []
-        for tr in results:
-            formatted_results.append({
-                'query': f"{tr['name']} - {tr['artist']}",
-                'matches': [tr] 
-            })
-            
         # Set session state for editing
         session['editing_playlist_id'] = playlist_id
         session['playlist_name'] = playlist_info['name']
         session['editing_mode'] = True
         
         # Render review.html with pre-filled results
-        return render_template('review.html', page='create', results=results, scrollable=True, editing=True)
+        return render_template('review.html', page='create', results=formatted_results, scrollable=True, editing=True)
         
     except Exception as e:
         flash(f"Error cargando editor: {e}", "error")
@@ -336,121 +321,185 @@ def playlist_edit(playlist_id):
 def playlist_detail(playlist_id):
     sp = get_sp_manager()
 
-    # Get tracks
-    tracks = sp.get_playlist_tracks(playlist_id)
-    
-    # NOTE: Spotify Audio Features API is blocked (403). 
-    # Vibe calculation is disabled. Tracks will be enriched via frontend analyzer/Deezer.
-    if tracks:
-        # Initialize running totals for vibe calculation
-        total_energy = 0
-        total_dance = 0
-        total_valence = 0
-        total_bpm = 0
-        count_features = 0
-
-        for t in tracks:
-            # Default values (Client-side analyzer will enrich these)
-            t['key_name'] = "?"
-            t['bpm'] = 0 
-            t['energy_val'] = 0
-            
-            # If we had feature data (we don't right now server-side), we would sum it here
-            # For now, these are 0
-        
-        # Default Vibe (Neutral baseline)
-        vibe = {
-            'energy': 50,
-            'danceability': 50,
-            'valence': 50,
-            'bpm': 0
-        }
-        
-        # Deezer BPM Enrichment for missing tracks
-        missing_bpm_tracks = [t for t in tracks if t.get('bpm', 0) == 0]
-        if missing_bpm_tracks:
-            from concurrent.futures import ThreadPoolExecutor
-            def _repair(t):
-                b = sp._fetch_deezer_bpm(t['artist'], t['name'])
-                if b > 0: t['bpm'] = b
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                executor.map(_repair, missing_bpm_tracks)
-            
-            # Re-calculate vibe avg_bpm and pseudo-stats
-            valid_bpms = [t['bpm'] for t in tracks if t.get('bpm', 0) > 0]
-            if valid_bpms:
-                avg_bpm = int(sum(valid_bpms) / len(valid_bpms))
-                vibe['bpm'] = avg_bpm
-                # Pseudo-logic: higher BPM usually correlates with higher energy
-                vibe['energy'] = min(95, max(40, int(avg_bpm * 0.6)))
-                # Pseudo-logic: danceability often peaks around 110-130 BPM
-                vibe['danceability'] = min(90, max(45, 100 - abs(120 - avg_bpm)))
-                vibe['valence'] = (vibe['energy'] + vibe['danceability']) // 2
-
-
-
-    # Get playlist info (for header)
+    # Get playlist info (for header); its snapshot_id keys the warmed track cache
     try:
-        playlist_info = sp.sp.playlist(playlist_id)
-        current_user_info = sp.sp.current_user()
-        current_user_id = current_user_info['id']
+        playlist_info = sp.sp.playlist(playlist_id, fields=SpotifyManager.PLAYLIST_HEADER_FIELDS)
+        current_user_id = sp.user['id']
         is_owner = (playlist_info['owner']['id'] == current_user_id)
-        print(f"DEBUG: Playlist Owner: {playlist_info['owner']['id']}, Current User: {current_user_id}, IS_OWNER: {is_owner}")
+        log.debug("Playlist owner %s, current user %s, is_owner=%s", playlist_info['owner']['id'],
+                  current_user_id, is_owner, extra={'playlist_id': playlist_id})
     except Exception as e:
-        print(f"DEBUG ERROR fetching info: {e}")
+        log.warning("Error fetching playlist info: %s", e, extra={'upstream': 'spotify', 'playlist_id': playlist_id})
         playlist_info = {'name': 'Playlist', 'owner': {'display_name': 'Usuario'}, 'images': [], 'external_urls': {'spotify': '#'}}
         is_owner = True # Fallback to true if we hit a weird error to at least show tools
 
+    # Large playlists are rendered client-side from /playlist/<id>/tracks, a page at a time
+    track_total = (playlist_info.get('tracks') or {}).get('total', 0)
+    if track_total > VIRTUALIZE_THRESHOLD:
+        search_results = session.pop('playlist_search_results', None)
+        # Stored aggregate if there is one; otherwise the dashboard fetches /playlist/<id>/vibe
+        agg = sp.playlist_vibe(playlist_id, playlist_info.get('snapshot_id'), build=False)
+        vibe = agg.summary() if agg else {'energy': 50, 'danceability': 50, 'valence': 50, 'bpm': 0}
+        return render_template('playlist_detail.html', page='playlists', tracks=[], track_total=track_total,
+                               virtualized=True, snapshot_id=playlist_info.get('snapshot_id'),
+                               playlist_info=playlist_info, playlist_id=playlist_id, search_results=search_results,
+                               is_owner=is_owner, vibe=vibe)
+
+    # Get tracks
+    snapshot_id = playlist_info.get('snapshot_id')
+    tracks = sp.get_playlist_tracks(playlist_id, snapshot_id=snapshot_id)
+
+    # Flag duplicates once here instead of a nested loop per row in the template
+    from collections import Counter
+    id_counts = Counter(t['id'] for t in tracks)
+    for t in tracks:
+        t['is_duplicate'] = id_counts[t['id']] > 1
+
+    # NOTE: Spotify Audio Features API is blocked (403).
+    # The vibe comes from the playlist's stored aggregate (running sums over known BPMs);
+    # only tracks it has no BPM for are looked up, and the ones found are folded back in.
+    for t in tracks:
+        t['bpm'] = sp.cached_bpm(t['artist'], t['name'], t['isrc']) or 0
+    agg = sp.playlist_vibe(playlist_id, snapshot_id, tracks)
+    for t in tracks:
+        t['bpm'] = t['bpm'] or agg.bpm_of(t['id'])
+
+    missing_bpm_tracks = [t for t in tracks if not t['bpm']]
+    if missing_bpm_tracks:
+        from concurrent.futures import ThreadPoolExecutor
+        def _repair(t):
+            b = sp.fetch_bpm(t['artist'], t['name'], t.get('duration_ms'), isrc=t['isrc'])
+            if b > 0: t['bpm'] = b
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            executor.map(_repair, missing_bpm_tracks)
+
+        found = {t['id']: t['bpm'] for t in missing_bpm_tracks if t['bpm']}
+        if found:
+            agg = sp.update_playlist_vibe(playlist_id, lambda agg: [agg.enrich(i, b) for i, b in found.items()]) or agg
+    vibe = agg.summary()
+
     search_results = session.pop('playlist_search_results', None) # Get flash-like results
 
-    return render_template('playlist_detail.html', page='playlists', tracks=tracks, playlist_info=playlist_info, playlist_id=playlist_id, search_results=search_results, is_owner=is_owner, vibe=vibe)
+    return render_template('playlist_detail.html', page='playlists', tracks=tracks, track_total=len(tracks), virtualized=False, snapshot_id=snapshot_id, playlist_info=playlist_info, playlist_id=playlist_id, search_results=search_results, is_owner=is_owner, vibe=vibe)
+
+# Above this many tracks, playlist_detail pages and virtualizes the list client-side
+VIRTUALIZE_THRESHOLD = 250
+TRACK_PAGE_SIZE = 100
+
+@app.route('/playlist/<playlist_id>/tracks', methods=['GET'])
+@login_required
+def playlist_tracks_page(playlist_id):
+    """
+    Página de canciones en JSON: ?cursor=<offset>&limit=<n>&snapshot=<snapshot_id>.
+    Solo incluye el BPM que ya está en caché; el resto lo pide la página con /enrich
+    para las filas visibles.
+    """
+    try:
+        offset = max(0, int(request.args.get('cursor', 0)))
+        limit = min(TRACK_PAGE_SIZE, max(1, int(request.args.get('limit', TRACK_PAGE_SIZE))))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Cursor inválido'}), 400
 
-@app.route('/playlist/new/search-ajax', methods=['POST'])
-def new_playlist_search_ajax():
-    query = request.form.get('query')
     sp = get_sp_manager()
-    if not sp:
+    try:
+        tracks, total = sp.get_playlist_page(playlist_id, offset, limit, snapshot_id=request.args.get('snapshot'))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    for t in tracks:
+        t['bpm'] = sp.cached_bpm(t['artist'], t['name'], t['isrc']) or 0
+    next_cursor = offset + len(tracks) if offset + len(tracks) < total else None
+    return jsonify({'success': True, 'tracks': tracks, 'offset': offset, 'total': total, 'next_cursor': next_cursor})
+
+@app.route('/playlist/<playlist_id>/vibe', methods=['GET'])
+@login_required
+def playlist_vibe(playlist_id):
+    """
+    Resumen de vibra (medias, percentiles e histograma de BPM) sin la lista de
+    canciones: ?snapshot=<snapshot_id>. Se mantiene al añadir, quitar o enriquecer.
+    """
+    sp = get_sp_manager()
+    try:
+        agg = sp.playlist_vibe(playlist_id, request.args.get('snapshot') or None)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'vibe': agg.summary()})
+
+search_tracker = SearchTracker()
+
+def _typeahead_search(scope):
+    """
+    Búsqueda typeahead "latest-wins": cada petición trae un `seq` creciente y
+    el id aleatorio de la página (`page`); si llega una más nueva del mismo
+    cliente (sesión + página), las antiguas se saltan sus llamadas a Spotify.
+    """
+    query = request.values.get('query')
+    if not query:
         return jsonify({'results': []})
 
-    if query:
-        # Search for this single query, return 10 results
-        results = sp.search_tracks([query], limit=10)
-        
-        flat_results = []
-        if results and results[0]['matches']:
-            flat_results = results[0]['matches']
-            # NOTE: Spotify Audio Features API blocked. 
-            # We skip enrichment here and let the client-side analyzer handle it.
-            for r in flat_results:
-                r['bpm'] = 0
-                r['key'] = "?"
-            
-        return jsonify({'results': flat_results})
-    
-    return jsonify({'results': []})
+    ticket = None
+    try:
+        seq = int(request.values.get('seq', ''))
+    except ValueError:
+        seq = None
+    if seq is not None:
+        client_id = getattr(session, 'sid', None) or session.setdefault('search_client_id', os.urandom(8).hex())
+        ticket = search_tracker.begin(SearchTracker.client_key(client_id, scope, request.values.get('page')), seq)
+
+    def superseded():
+        if ticket and ticket.is_superseded():
+            search_tracker.mark_superseded()
+            return True
+        return False
+
+    # Check before get_sp_manager too: it costs a /me round-trip
+    if superseded():
+        return jsonify({'results': [], 'superseded': True})
 
-@app.route('/playlist/<playlist_id>/search-ajax', methods=['POST'])
-def playlist_search_ajax(playlist_id):
-    query = request.form.get('query')
     sp = get_sp_manager()
     if not sp:
         return jsonify({'results': []})
 
-    if query:
-        # Set to exactly 10 per user request
-        results = sp.search_tracks([query], limit=10)
-        
-        flat_results = []
-        if results and results[0]['matches']:
-            flat_results = results[0]['matches']
-            # NOTE: Spotify Audio Features API blocked.
-            for r in flat_results:
-                r['bpm'] = 0
-                r['key'] = "?"
-            
-        return jsonify({'results': flat_results})
-    
-    return jsonify({'results': []})
+    # Set to exactly 10 per user request
+    results = sp.search_tracks([query], limit=10, should_cancel=superseded if ticket else None, allow_prefix=True)
+    if results and results[0].get('cancelled'):
+        return jsonify({'results': [], 'superseded': True})
+
+    flat_results = []
+    if results and results[0]['matches']:
+        flat_results = results[0]['matches']
+        # NOTE: Spotify Audio Features API blocked.
+        # We skip enrichment here and let the client-side analyzer handle it.
+        for r in flat_results:
+            r['bpm'] = 0
+            r['key'] = "?"
+
+    return jsonify({'results': flat_results})
+
+@app.route('/playlist/new/search-ajax', methods=['GET', 'POST'])
+def new_playlist_search_ajax():
+    return _typeahead_search('new')
+
+@app.route('/playlist/<playlist_id>/search-ajax', methods=['GET', 'POST'])
+def playlist_search_ajax(playlist_id):
+    return _typeahead_search(playlist_id)
+
+@app.route('/previews', methods=['POST'])
+def resolve_previews():
+    """
+    Resuelve previews de Deezer bajo demanda (filas visibles o al pulsar play).
+    Body: {"tracks": [{"id", "artist", "name"}, ...]} (máx. 50 por lote)
+    """
+    if not session.get('token_info'):
+        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+
+    tracks = (request.get_json(silent=True) or {}).get('tracks', [])
+    if not isinstance(tracks, list):
+        return jsonify({'success': False, 'error': 'Formato inválido'}), 400
+
+    tracks = [t for t in tracks[:50] if isinstance(t, dict)]
+    previews = SpotifyManager().resolve_previews(tracks)
+    return jsonify({'success': True, 'previews': previews})
 
 @app.route('/playlist/<playlist_id>/add', methods=['POST'])
 @login_required
@@ -492,6 +541,19 @@ def playlist_remove_track(playlist_id):
         
     return redirect(url_for('playlist_detail', playlist_id=playlist_id))
 
+@app.route('/playlist/<playlist_id>/batch', methods=['POST'])
+@login_required
+def playlist_batch(playlist_id):
+    """Cola de altas/bajas acumulada en el cliente; se aplica en orden y en lotes"""
+    ops = (request.get_json(silent=True) or {}).get('ops', [])
+    ops = [o for o in ops if isinstance(o, dict) and o.get('op') in ('add', 'remove') and o.get('uri')]
+    if not ops:
+        return jsonify({'success': False, 'error': 'No ops provided'}), 400
+
+    sp = get_sp_manager()
+    results = sp.apply_track_mutations(playlist_id, ops)
+    return jsonify({'success': all(r['success'] for r in results), 'results': results})
+
 
 @app.route('/logout')
 def logout():
@@ -499,23 +561,39 @@ def logout():
     flash("Sesión cerrada.", "success")
     return redirect(url_for('home'))
 
+@app.route('/cover/render', methods=['POST'])
+@login_required
+def cover_render():
+    """Renderiza una portada (collage/gradient/minimal) y devuelve el JPEG como data URL"""
+    data = request.get_json(silent=True) or {}
+    try:
+        image_b64 = cover_engine.render_b64(data.get('mode', 'collage'), data.get('images', [])[:4],
+                                            data.get('text', ''), data.get('hue'))
+        return jsonify({'success': True, 'image': f"data:image/jpeg;base64,{image_b64}", 'bytes': len(image_b64)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
 @app.route('/playlist/<playlist_id>/save-cover', methods=['POST'])
 @login_required
 def save_playlist_cover(playlist_id):
-    image_b64 = request.json.get('image') 
-    
-    if image_b64:
-        if "," in image_b64:
-            image_b64 = image_b64.split(",")[1]
-            
-        sp = get_sp_manager()
+    data = request.get_json(silent=True) or {}
+    sp = get_sp_manager()
 
-        try:
-            success = sp.upload_playlist_cover(playlist_id, image_b64)
-            return jsonify({'success': success})
-        except Exception as e:
-            return jsonify({'success': False, 'error': str(e)}), 400
-    return jsonify({'success': False, 'error': 'No image provided'}), 400
+    try:
+        if data.get('image'):
+            # Client image: re-encode so it fits the upload limit
+            image_b64 = cover_engine.compress_b64(data['image'])
+        elif data.get('mode'):
+            # Render on the server; the browser only sends the design choice
+            image_b64 = cover_engine.render_b64(data['mode'], data.get('images', [])[:4],
+                                                data.get('text', ''), data.get('hue'))
+        else:
+            return jsonify({'success': False, 'error': 'No image provided'}), 400
+
+        success = sp.upload_playlist_cover(playlist_id, image_b64)
+        return jsonify({'success': success})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/playlist/<playlist_id>/reorder', methods=['POST'])
 @login_required
@@ -538,81 +616,64 @@ def playlist_recommendations(playlist_id):
     sp = get_sp_manager()
         
     try:
-        tracks = sp.get_playlist_tracks(playlist_id)
-        if not tracks:
+        # Only the first 5 ids are needed: cached from the last load, or one tiny fields-projected page
+        seed_ids = sp.get_seed_track_ids(playlist_id, 5) # Max 5 seeds
+        if not seed_ids:
             return jsonify({'results': []})
-            
-        seed_ids = [t['id'] for t in tracks[:5]] # Max 5 seeds
+
         recs = sp.get_recommendations(seed_ids, limit=12)
         return jsonify({'results': recs})
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/analytics/library', methods=['GET'])
+@login_required
+def analytics_library():
+    """
+    Distribución de BPM, tonalidades (Camelot), energía y comparación entre
+    todas las playlists del usuario. Cacheado por sus snapshots; ?refresh=1 recalcula.
+    Con la biblioteca en frío responde parcial (`pending` > 0) mientras sigue cargando.
+    """
+    sp = get_sp_manager()
+    try:
+        result = library_analytics.library(sp, refresh=request.args.get('refresh') == '1')
+    except Exception as e:
+        log.warning("Library analytics error: %s", e, exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'analytics': result})
+
 @app.route('/analyze-live', methods=['POST'])
 def analyze_live():
-    songs_raw = request.form.get('songs', '')
-    # Limit input to prevent DDoS/Timeouts
-    song_list = [s.strip() for s in songs_raw.split('\n') if s.strip()]
-    if len(song_list) > 50:
-        song_list = song_list[:50]
-        # Optionally warn? For live analysis, silent truncation is usually fine UX.
+    # Limit input to prevent DDoS/Timeouts (work is incremental, so 200 lines is cheap)
+    song_list = LiveAnalysis.split_lines(request.form.get('songs', ''))
 
     sp_manager = get_sp_manager()
     if not song_list or not sp_manager:
         return jsonify({'success': False})
 
     try:
-        
-        # Take a sample for live analysis (first 6 songs to be fast)
-        sample = song_list[:6]
-        search_results = sp_manager.search_tracks(sample, limit=1)
-        
-        track_ids = []
-        actual_artist_ids = []
-        for res in search_results:
-            if res['matches']:
-                match = res['matches'][0]
-                track_ids.append(match['id'])
-                actual_artist_ids.extend(match['artist_ids'])
-
-        if not track_ids:
-            return jsonify({'success': False})
-
-        # NOTE: Spotify Audio Features API is blocked.
-        # Smart Analyze "Vibe" stats are disabled.
-        avg_energy = 0
-        avg_val = 0
-        avg_dance = 0
-            
-        # Simple Emotion Mapping
-        emotion = "Neutral"
-        if avg_val > 0.6 and avg_energy > 0.6: emotion = "Euphoric / Happy"
-        elif avg_val > 0.6: emotion = "Chill / Positive"
-        elif avg_val < 0.4 and avg_energy > 0.6: emotion = "Dark / Intense"
-        elif avg_val < 0.4: emotion = "Sad / Melancholic"
-
-        # Top Genres
-        from collections import Counter
-        top_genres = [g for g, c in Counter(genres).most_common(3)]
-
-        return jsonify({
-            'success': True,
-            'energy': int(avg_energy * 100),
-            'valence': int(avg_val * 100),
-            'dance': int(avg_dance * 100),
-            'emotion': emotion,
-            'genres': top_genres
-        })
+        # Per-session state keyed by line: only new/changed lines hit Spotify/Deezer
+        analysis = LiveAnalysis(session.get('live_analysis'))
+        new_count = analysis.update(sp_manager, song_list)
+        session['live_analysis'] = analysis.state
+
+        summary = analysis.summary(song_list)
+        summary['analyzed'] = new_count
+        return jsonify(summary)
             
     except Exception as e:
-        print(f"Live Analysis Error: {e}")
+        log.error("Live analysis error: %s", e, exc_info=True)
         
     return jsonify({'success': False})
 
-@app.route('/recommend-from-ids', methods=['POST'])
+@app.route('/recommend-from-ids', methods=['GET', 'POST'])
 @login_required
 def recommend_from_ids():
-    track_ids = request.json.get('track_ids', [])
+    if request.method == 'GET':
+        # GET form (?ids=a,b,c) lets the browser revalidate with ETags
+        track_ids = [i for i in request.args.get('ids', '').split(',') if i]
+    else:
+        track_ids = request.json.get('track_ids', [])
     if not track_ids:
         return jsonify({'results': []})
         
@@ -624,6 +685,104 @@ def recommend_from_ids():
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+# Low-priority enrichment of alternate matches (bounded across all requests): at most
+# BACKGROUND_MAX_PENDING searches queued or running; beyond that, new ones are skipped
+from concurrent.futures import ThreadPoolExecutor
+background_enricher = ThreadPoolExecutor(max_workers=2)
+BACKGROUND_MAX_PENDING = 8
+_background_slots = threading.BoundedSemaphore(BACKGROUND_MAX_PENDING)
+
+def _warm_bpm_cache(sp_manager, tracks):
+    """Rellena la caché de BPM para las alternativas; /enrich las sirve luego al instante"""
+    try:
+        for artist, name, duration_ms, isrc in tracks:
+            try:
+                sp_manager.fetch_bpm(artist, name, duration_ms, isrc=isrc)
+            except Exception as e:
+                log.warning("Background enrichment error: %s", e)
+    finally:
+        _background_slots.release()
+
+def warm_bpm_cache_later(sp_manager, tracks):
+    """Encola el calentamiento si hay hueco (devuelve False si la cola está llena)"""
+    if not _background_slots.acquire(blocking=False):
+        log.debug("Background enrichment queue full, skipping %d tracks", len(tracks))
+        return False
+    background_enricher.submit(_warm_bpm_cache, sp_manager, tracks)
+    return True
+
+@app.route('/enrich', methods=['POST'])
+@login_required
+def enrich_tracks():
+    """
+    BPM bajo demanda para las alternativas que la página muestra o selecciona.
+    Con "cached_only" solo se devuelve lo que ya está en caché (la pasada en
+    segundo plano del navegador; el servidor ya las está calentando).
+    """
+    data = request.get_json(silent=True) or {}
+    tracks = [t for t in data.get('tracks', [])[:50] if t.get('id') and t.get('artist') and t.get('name')]
+    sp = get_sp_manager()
+
+    if data.get('cached_only'):
+        bpms = {}
+        for t in tracks:
+            bpm = sp.cached_bpm(t['artist'], t['name'], t.get('isrc'))
+            if bpm is not None:
+                bpms[t['id']] = bpm
+    else:
+        def _bpm(t):
+            try:
+                return t['id'], sp.fetch_bpm(t['artist'], t['name'], int(t.get('duration_ms') or 0) or None,
+                                             isrc=t.get('isrc'))
+            except Exception:
+                return t['id'], 0
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            bpms = dict(executor.map(_bpm, tracks))
+    features = sp.bpm_reports.features([t['id'] for t in tracks])
+    if data.get('playlist_id'):
+        def _apply(agg):
+            for track_id, bpm in bpms.items():
+                if bpm and not agg.bpm_of(track_id):
+                    agg.enrich(track_id, bpm, **features.get(track_id, {}))
+        sp.update_playlist_vibe(data['playlist_id'], _apply)
+    return jsonify({'success': True, 'bpms': bpms, 'features': features})
+
+@app.route('/bpm-report', methods=['POST'])
+@login_required
+def bpm_report():
+    """
+    Resultados del analizador del navegador para pistas sin BPM.
+    Body: {"reports": [{"id", "bpm", "energy", "danceability"}, ...]} (máx. 50 por lote).
+    Se aceptan cuando varios clientes coinciden; entonces pasan a la caché de BPM.
+    Con "playlist_id", los BPM que acaban de aceptarse completan el resumen de
+    vibra de esa playlist (compartido: nunca con los valores de un solo cliente).
+    """
+    data = request.get_json(silent=True) or {}
+    reports = data.get('reports', [])
+    if not isinstance(reports, list):
+        return jsonify({'success': False, 'error': 'Formato inválido'}), 400
+
+    sp = get_sp_manager()
+    # One vote per Spotify account, however many sessions it has open
+    client_id = sp.bpm_reports.client_for(sp.user)
+    if not client_id:
+        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+    accepted = sp.bpm_reports.add_reports(client_id, reports[:50])
+    if accepted:
+        try:
+            sp.bpm_reports.publish(sp.enrichment, sp.get_tracks_bulk(list(accepted)), accepted)
+        except Exception as e:
+            log.warning("BPM report publish error: %s", e)
+    if data.get('playlist_id') and accepted:
+        # Only agreed results reach the shared aggregate; a single client's values never do
+        def _apply(agg):
+            for track_id, result in accepted.items():
+                if not agg.bpm_of(track_id):
+                    agg.enrich(track_id, result['bpm'], result['energy'], result['danceability'])
+        sp.update_playlist_vibe(data['playlist_id'], _apply)
+    return jsonify({'success': True, 'accepted': list(accepted)})
+
 @app.route('/search', methods=['GET', 'POST'])
 def search_phase():
     if request.method == 'GET':
@@ -660,48 +819,39 @@ def search_phase():
             flash("Lista vacía.", "error")
             return redirect(url_for('home'))
         # 3. Buscar en Spotify
-        # UPDATED: Limit set to exactly 10 as requested
-        results = sp_manager.search_tracks(song_list, limit=10)
+        # Links/URIs are resolved in bulk; only free-text lines are searched (10 results each)
+        results = sp_manager.resolve_song_lines(song_list, limit=10)
 
 
-        # BPM ENRICHMENT: Using Deezer API
+        # BPM ENRICHMENT (tiered)
         # Note: Spotify Audio Features API is restricted to approved apps (returns 403)
-        # We use Deezer as primary BPM source with local analyzer as fallback
-        all_ids = []
+        # Only the top match of each group is enriched before rendering; alternates are
+        # enriched by a low-priority background pass and on demand through /enrich.
         for res in results:
             for match in res['matches']:
-                all_ids.append(match['id'])
                 match['bpm'] = 0  # Initialize
                 match['key'] = "?"
-        
-        if all_ids:
-            print(f"DEBUG: Processing {len(all_ids)} tracks for BPM via Deezer...")
-            
-            # Deezer BPM Enrichment
-            missing_bpm_matches = []
-            for res in results:
-                for match in res['matches']:
-                    if not match.get('bpm') or match['bpm'] == 0:
-                        missing_bpm_matches.append(match)
-            
-            if missing_bpm_matches:
-                from concurrent.futures import ThreadPoolExecutor
-                def _fetch_bpm_fallback(match):
-                    bpm = sp_manager._fetch_deezer_bpm(match['artist'], match['name'])
-                    if bpm > 0:
-                        match['bpm'] = bpm
-                
-                with ThreadPoolExecutor(max_workers=10) as executor:
-                    executor.map(_fetch_bpm_fallback, missing_bpm_matches)
-                
-                final_bpm_count = sum(1 for res in results for m in res['matches'] if m.get('bpm', 0) > 0)
-                print(f"DEBUG: Enriched {final_bpm_count} tracks with BPM from Deezer")
 
+        top_matches = [res['matches'][0] for res in results if res['matches']]
+        if top_matches:
+            from concurrent.futures import ThreadPoolExecutor
+            def _fetch_bpm_fallback(match):
+                bpm = sp_manager.fetch_bpm(match['artist'], match['name'], match.get('duration_ms'), isrc=match.get('isrc'))
+                if bpm > 0:
+                    match['bpm'] = bpm
+
+            with ThreadPoolExecutor(max_workers=10) as executor:
+                executor.map(_fetch_bpm_fallback, top_matches)
 
+        alternates = [m for res in results for m in res['matches'][1:]]
+        if alternates:
+            warm_bpm_cache_later(sp_manager, [(m['artist'], m['name'], m.get('duration_ms'), m.get('isrc'))
+                                              for m in alternates])
 
         return render_template('review.html', page='create', results=results, scrollable=True)
 
     except Exception as e:
+        log.error("Search phase error: %s", e, exc_info=True)
         flash(f"Error: {str(e)}", "error")
         return redirect(url_for('home'))
 
@@ -760,12 +910,11 @@ def create_phase():
             # Upload Custom Cover if present (Only for new playlists for now, or add support for edit)
             cover_b64 = form_data.get('cover_image')
             if cover_b64:
-                if "," in cover_b64:
-                    cover_b64 = cover_b64.split(",")[1]
                 try:
+                    cover_b64 = cover_engine.compress_b64(cover_b64)
                     sp_manager.upload_playlist_cover(result['playlist_id'], cover_b64)
                 except Exception as e:
-                    print(f"Cover upload failed: {e}") 
+                    log.warning("Cover upload failed: %s", e, extra={'upstream': 'spotify'})
 
             link = result['playlist_url']
             flash(f"Playlist creada con éxito ({result['total_added']} tracks). <a href='{link}' target='_blank' class='underline'>Abrir</a>", "success")
@@ -776,6 +925,29 @@ def create_phase():
         flash(f"Error creando playlist: {e}", "error")
         return redirect(url_for('home'))
 
+@app.route('/debug/stats')
+def debug_stats():
+    """Métricas internas: bytes enviados por endpoint, etc."""
+    if not session.get('token_info') and not app.config['DEBUG']:
+        return jsonify({'error': 'No autenticado'}), 401
+    return jsonify({
+        'wire': response_optimizer.stats(),
+        'template_fragments': app.jinja_env.fragment_cache.stats(),
+        'search_cache': SpotifyManager._search_cache.stats(),
+        'search_prefix_hits': SpotifyManager.prefix_hits,
+        'typeahead': search_tracker.stats(),
+        'covers': cover_engine.stats(),
+        'enrichment': SpotifyManager().enrichment.stats(),
+        'bpm_reports': SpotifyManager().bpm_reports.stats(),
+        'spotify_conditional': SpotifyManager._get_spotify_session().stats(),
+        'oauth_tokens': token_manager.stats(),
+        'warmup': playlist_warmer.stats(),
+        'playlist_tracks_cache': SpotifyManager._tracks_cache.stats(),
+        'recommendations': SpotifyManager._recs_cache.stats(),
+        'library_analytics': library_analytics.stats(),
+        'log_sampled_out': sampled_dropped()
+    })
+
 def open_browser():
     time.sleep(1.5)
     webbrowser.open("http://127.0.0.1:5000")
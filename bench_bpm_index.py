@@ -0,0 +1,83 @@
+"""
+Benchmark del índice offline ISRC → BPM (bpm_index.py): tiempo de construcción
+desde un volcado CSV sintético, tamaño del fichero y latencia de búsqueda con
+mmap frente a la caché de BPM en proceso (TTLCache) que usa el pipeline.
+
+    python bench_bpm_index.py               # 100k y 1M ISRCs
+    python bench_bpm_index.py --sizes 5000000
+"""
+import argparse
+import os
+import random
+import shutil
+import string
+import tempfile
+import time
+
+from bpm_index import BPMIndex, build_index
+from cache_manager import TTLCache
+
+LOOKUPS = 200_000
+
+
+def make_dump(path, n, seed=7):
+    """Volcado CSV con `n` ISRCs aleatorios (orden aleatorio, como los volcados reales)"""
+    rng = random.Random(seed)
+    alphabet = string.ascii_uppercase + string.digits
+    isrcs = []
+    with open(path, 'w') as f:
+        f.write("isrc,tempo,key,mode\n")
+        for _ in range(n):
+            isrc = ''.join(rng.choices(string.ascii_uppercase, k=2)) + ''.join(rng.choices(alphabet, k=3)) \
+                + ''.join(rng.choices(string.digits, k=7))
+            isrcs.append(isrc)
+            f.write(f"{isrc},{rng.uniform(60, 200):.1f},{rng.randrange(12)},{rng.randrange(2)}\n")
+    return isrcs
+
+
+def bench(n, directory):
+    dump = os.path.join(directory, f"dump_{n}.csv")
+    output = os.path.join(directory, f"index_{n}.bin")
+    isrcs = make_dump(dump, n)
+
+    start = time.perf_counter()
+    stats = build_index([dump], output)
+    build_s = time.perf_counter() - start
+
+    index = BPMIndex(output)
+    rng = random.Random(1)
+    hits = [rng.choice(isrcs) for _ in range(LOOKUPS // 2)]
+    misses = [f"ZZ{i:010d}" for i in range(LOOKUPS // 2)]
+
+    def timed(fn, keys):
+        start = time.perf_counter()
+        for k in keys:
+            fn(k)
+        return (time.perf_counter() - start) / len(keys) * 1e6
+
+    hit_us = timed(index.get, hits)
+    miss_us = timed(index.get, misses)
+
+    cache = TTLCache(maxsize=n, ttl=3600)
+    for isrc in isrcs[:min(n, 100_000)]:
+        cache.set(isrc, 120)
+    cache_us = timed(cache.get, hits[:min(len(hits), 100_000)])
+
+    size_mb = os.path.getsize(output) / 1e6
+    print(f"{n:>10,}{stats['records']:>10,}{build_s:>10.2f}{n / build_s:>12,.0f}{size_mb:>10.1f}"
+          f"{hit_us:>10.2f}{miss_us:>10.2f}{cache_us:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench_bpm_index_')
+    try:
+        print(f"{'ISRCs':>10}{'records':>10}{'build s':>10}{'rows/s':>12}{'MB':>10}"
+              f"{'hit µs':>10}{'miss µs':>10}{'TTLCache µs':>12}")
+        for n in args.sizes:
+            bench(n, directory)
+    finally:
+        shutil.rmtree(directory)
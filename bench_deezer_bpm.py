@@ -0,0 +1,173 @@
+"""
+Benchmark de _fetch_deezer_bpm: búsqueda secuencial (antigua) vs candidatos
+clasificados y en paralelo (actual), sobre respuestas grabadas de Deezer.
+
+    python bench_deezer_bpm.py --record       # graba respuestas reales (necesita red)
+    python bench_deezer_bpm.py --synthesize   # genera una grabación sintética
+    python bench_deezer_bpm.py                # reproduce la grabación
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+
+from spotify_manager import SpotifyManager
+
+RECORDING = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_deezer_recording.json')
+
+# (artist, track, duration_ms); synthetic cases also carry the expected BPM
+CASES = [
+    ("Ed Sheeran", "Shape of You (Official Video)", 233712),
+    ("Lana Del Rey", "Honeymoon - Remastered", 350000),
+    ("The Weeknd", "Blinding Lights [Single Version]", 200040),
+    ("Dua Lipa", "Levitating (feat. DaBaby)", 203064),
+    ("Daft Punk", "One More Time", 320357),
+    ("Bad Bunny", "Tití Me Preguntó", 243716),
+    ("Rosalía", "DESPECHÁ", 157018),
+    ("Queen", "Bohemian Rhapsody - Remastered 2011", 354320),
+    ("Karol G", "PROVENZA", 210200),
+    ("Arctic Monkeys", "Do I Wanna Know?", 272394),
+]
+
+
+class _Response:
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class RecordingSession:
+    """Sesión real que guarda cada respuesta y su latencia"""
+
+    def __init__(self, session):
+        self.session = session
+        self.responses = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, timeout=None):
+        start = time.perf_counter()
+        data = self.session.get(url, timeout=timeout).json()
+        with self._lock:
+            self.responses[url] = {'data': data, 'latency': time.perf_counter() - start}
+        return _Response(data)
+
+
+class ReplaySession:
+    """Sirve las respuestas grabadas, respetando su latencia"""
+
+    def __init__(self, responses, speed=1.0):
+        self.responses = responses
+        self.speed = speed
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, timeout=None):
+        with self._lock:
+            self.calls += 1
+        entry = self.responses.get(url, {'data': {'data': []}, 'latency': 0.1})
+        time.sleep(entry['latency'] / self.speed)
+        return _Response(entry['data'])
+
+
+def legacy_lookup(sm, artist_name, track_name, duration_ms=None):
+    """Algoritmo anterior: candidatos en orden de búsqueda, detalle uno a uno"""
+    session = sm._get_deezer_session()
+    clean_track = sm._clean_track_name(track_name)
+    d_resp = session.get(f"https://api.deezer.com/search?q={artist_name} {clean_track}&limit=5", timeout=3.0).json()
+    for item in d_resp.get('data') or []:
+        bpm = session.get(f"https://api.deezer.com/track/{item['id']}", timeout=2.5).json().get('bpm', 0)
+        if bpm and bpm > 0: return int(float(bpm))
+    d_resp_alt = session.get(f"https://api.deezer.com/search?q={clean_track}&limit=10", timeout=3.0).json()
+    for item in d_resp_alt.get('data') or []:
+        if artist_name.lower() in item['artist']['name'].lower() or item['artist']['name'].lower() in artist_name.lower():
+            bpm = session.get(f"https://api.deezer.com/track/{item['id']}", timeout=2.5).json().get('bpm', 0)
+            if bpm and bpm > 0: return int(float(bpm))
+    return 0
+
+
+def ranked_lookup(sm, artist_name, track_name, duration_ms=None):
+    return sm._fetch_deezer_bpm(artist_name, track_name, duration_ms)
+
+
+def record():
+    import requests
+    sm = SpotifyManager()
+    recorder = RecordingSession(requests.Session())
+    sm._deezer_session = recorder
+    for artist, track, duration_ms in CASES:
+        legacy_lookup(sm, artist, track)
+        ranked_lookup(sm, artist, track, duration_ms)
+    return {'cases': CASES, 'responses': recorder.responses}
+
+
+def synthesize(n=200, seed=42):
+    """Grabación sintética: el bueno está en una posición aleatoria, con ruido de otros artistas"""
+    rnd = random.Random(seed)
+    sm = SpotifyManager()
+    cases, responses = [], {}
+    next_id = [1]
+
+    def track(artist, duration, bpm):
+        tid = next_id[0]
+        next_id[0] += 1
+        responses[f"https://api.deezer.com/track/{tid}"] = {'data': {'id': tid, 'bpm': bpm}, 'latency': rnd.uniform(0.08, 0.35)}
+        return {'id': tid, 'artist': {'name': artist}, 'duration': duration}
+
+    for i in range(n):
+        artist, name, duration = f"Artist {i}", f"Song {i}", rnd.randint(150, 300)
+        bpm = rnd.randint(80, 170)
+        cases.append((artist, name, duration * 1000, bpm))
+        good = track(artist, duration, bpm)
+        noise = [track(f"Cover Band {rnd.randint(0, 99)}", duration + rnd.randint(-60, 60), rnd.choice([0, 0, 120]))
+                 for _ in range(4)]
+        combined = noise[:]
+        combined.insert(rnd.randint(0, 4), good)
+        clean = sm._clean_track_name(name)
+        responses[f"https://api.deezer.com/search?q={artist} {clean}&limit=5"] = {'data': {'data': combined}, 'latency': rnd.uniform(0.1, 0.4)}
+        responses[f"https://api.deezer.com/search?q={clean}&limit=10"] = {'data': {'data': noise}, 'latency': rnd.uniform(0.1, 0.4)}
+    return {'cases': cases, 'responses': responses}
+
+
+def replay(recording, speed):
+    print(f"{'algorithm':<12}{'tracks':>8}{'found':>8}{'correct':>9}{'calls/track':>14}{'avg ms':>10}{'p90 ms':>10}")
+    print("-" * 71)
+    for label, fn in (('sequential', legacy_lookup), ('ranked', ranked_lookup)):
+        sm = SpotifyManager()
+        session = ReplaySession(recording['responses'], speed)
+        sm._deezer_session = session
+        latencies, found, correct = [], 0, 0
+        for artist, track, duration_ms, *expected in recording['cases']:
+            start = time.perf_counter()
+            bpm = fn(sm, artist, track, duration_ms)
+            latencies.append((time.perf_counter() - start) * 1000 * speed)
+            found += 1 if bpm else 0
+            correct += 1 if expected and bpm == expected[0] else 0
+        latencies.sort()
+        n = len(latencies)
+        has_expected = all(len(c) > 3 for c in recording['cases'])
+        print(f"{label:<12}{n:>8}{found:>8}{correct if has_expected else '-':>9}{session.calls / n:>14.2f}"
+              f"{sum(latencies) / n:>10.1f}{latencies[int(n * 0.9) - 1]:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--record', action='store_true', help="grabar respuestas reales de Deezer")
+    parser.add_argument('--synthesize', action='store_true', help="generar una grabación sintética")
+    parser.add_argument('--speed', type=float, default=10.0, help="acelerar la reproducción (latencias / speed)")
+    args = parser.parse_args()
+
+    if args.record or args.synthesize:
+        data = record() if args.record else synthesize()
+        with open(RECORDING, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        print(f"Grabadas {len(data['responses'])} respuestas en {RECORDING}")
+
+    if not os.path.exists(RECORDING):
+        print("No hay grabación: ejecuta con --record o --synthesize")
+    else:
+        with open(RECORDING, encoding='utf-8') as f:
+            replay(json.load(f), args.speed)
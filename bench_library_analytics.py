@@ -0,0 +1,77 @@
+"""
+Benchmark de la analítica de biblioteca (library_analytics.py) con bibliotecas
+sintéticas: construir las columnas NumPy desde los VibeAggregate (solo en
+frío, luego van en caché por snapshot), el análisis vectorizado completo y,
+como referencia, lo mismo con bucles de Python (resumen por playlist con
+VibeAggregate.summary y distribución global con sorted/Counter).
+
+    python bench_library_analytics.py               # 10k, 50k y 200k pistas
+    python bench_library_analytics.py --tracks 500000 --playlists 1000
+"""
+import argparse
+import random
+import time
+from collections import Counter
+
+from library_analytics import KEYS, analyze, playlist_columns
+from vibe import VibeAggregate
+
+
+def make_library(n_tracks, n_playlists, seed=7):
+    """Agregados por playlist; ~30% de las pistas repetidas en varias playlists, 80% con BPM y 60% con tonalidad"""
+    rng = random.Random(seed)
+    pool = [f"{i:022d}" for i in range(int(n_tracks * 0.7))]
+    library = []
+    for p in range(n_playlists):
+        agg, keys = VibeAggregate(snapshot_id="s"), {}
+        for _ in range(n_tracks // n_playlists):
+            track_id = rng.choice(pool)
+            agg.add(track_id, rng.randint(60, 200) if rng.random() < 0.8 else 0)
+            if rng.random() < 0.1:
+                agg.enrich(track_id, energy=rng.randint(0, 100), danceability=rng.randint(0, 100))
+            if rng.random() < 0.6:
+                keys[track_id] = rng.randrange(len(KEYS))
+        library.append(({'id': f"p{p}", 'name': f"Playlist {p}"}, agg, keys))
+    return library
+
+
+def python_loops(library):
+    """Referencia con bucles: resúmenes por playlist y distribución global"""
+    per_playlist = [agg.summary() for _, agg, _ in library]
+    bpm, keys = {}, {}
+    for _, agg, playlist_keys in library:
+        for track_id, member in agg.members.items():
+            bpm[track_id] = max(bpm.get(track_id, 0), member[1])
+        keys.update(playlist_keys)
+    known = sorted(b for b in bpm.values() if b)
+    percentiles = [known[int(p / 100 * (len(known) - 1))] for p in (10, 25, 50, 75, 90)] if known else []
+    return per_playlist, percentiles, Counter(keys.values())
+
+
+def timed(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tracks', type=int, nargs='+', default=[10_000, 50_000, 200_000])
+    parser.add_argument('--playlists', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'pistas':>8} {'playlists':>9} {'columnas (frío)':>16} {'análisis NumPy':>15} {'bucles Python':>14}")
+    for n in args.tracks:
+        library = make_library(n, args.playlists)
+        build_ms, columns = timed(lambda: [(meta, playlist_columns(agg, keys)) for meta, agg, keys in library], 3)
+        analyze_ms, result = timed(lambda: analyze(columns))
+        loops_ms, _ = timed(lambda: python_loops(library), 3)
+        print(f"{n:>8} {args.playlists:>9} {build_ms:>13.1f} ms {analyze_ms:>12.1f} ms {loops_ms:>11.1f} ms"
+              f"   ({result['tracks']} pistas únicas)")
+
+
+if __name__ == "__main__":
+    main()
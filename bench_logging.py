@@ -0,0 +1,81 @@
+"""
+Benchmark del coste de logging en el hilo de la petición: print (antiguo),
+logging síncrono a stdout y la cola de log_config (activo, DEBUG desactivado
+por nivel y DEBUG muestreado). Cada caso corre en su propio proceso con stdout
+en un pipe que el padre vacía despacio, como un colector de logs con carga.
+
+    python bench_logging.py
+    python bench_logging.py --calls 20000 --drain-kbps 2000
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+CASES = ('baseline', 'print', 'logging-sync', 'queued', 'queued-debug-off', 'queued-debug-sampled')
+
+CHILD = r'''
+import logging, sys, time
+case, calls = sys.argv[1], int(sys.argv[2])
+line = "Error searching for %r: %s"
+args = ("Daft Punk - One More Time", "HTTPSConnectionPool: Read timed out")
+
+if case == 'baseline':
+    emit = lambda: None  # Loop and timer overhead only
+elif case == 'print':
+    emit = lambda: print(f"Error searching for {args[0]!r}: {args[1]}")
+elif case == 'logging-sync':
+    handler = logging.StreamHandler(sys.stdout)
+    log = logging.getLogger('bench')
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    emit = lambda: log.warning(line, *args, extra={'upstream': 'spotify'})
+else:
+    from log_config import get_logger, setup_logging, shutdown_logging
+    level = 'DEBUG' if case == 'queued-debug-sampled' else 'INFO'
+    setup_logging(level=level, sample_rate=0.01, fmt='json')
+    log = get_logger('bench')
+    if case == 'queued':
+        emit = lambda: log.warning(line, *args, extra={'upstream': 'spotify'})
+    else:
+        emit = lambda: log.debug(line, *args, extra={'upstream': 'spotify'})
+
+worst = 0.0
+start = time.perf_counter()
+for _ in range(calls):
+    t = time.perf_counter()
+    emit()
+    worst = max(worst, time.perf_counter() - t)
+elapsed = time.perf_counter() - start
+sys.stderr.write(f"{elapsed / calls * 1e6:.2f} {worst * 1e3:.2f}\n")
+'''
+
+
+def run_case(case, calls, drain_kbps):
+    proc = subprocess.Popen([sys.executable, '-c', CHILD, case, str(calls)],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # Slow consumer: 4 KB at a time at roughly `drain_kbps`
+    chunk, delay = 4096, 4096 / (drain_kbps * 1024)
+    received = 0
+    while True:
+        data = proc.stdout.read1(chunk) if hasattr(proc.stdout, 'read1') else proc.stdout.read(chunk)
+        if not data:
+            break
+        received += len(data)
+        time.sleep(delay)
+    per_call_us, worst_ms = proc.stderr.read().decode().split()
+    proc.wait()
+    return float(per_call_us), float(worst_ms), received
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--drain-kbps', type=int, default=1000, help="velocidad del consumidor de stdout")
+    args = parser.parse_args()
+
+    print(f"{'case':<22}{'µs/call':>10}{'worst ms':>10}{'KB out':>10}")
+    for case in CASES:
+        per_call, worst, received = run_case(case, args.calls, args.drain_kbps)
+        print(f"{case:<22}{per_call:>10.2f}{worst:>10.2f}{received / 1024:>10.0f}")
@@ -0,0 +1,52 @@
+import time
+
+from app import app
+
+
+def make_tracks(n):
+    return [{
+        'id': f"track{i:06d}", 'uri': f"spotify:track:track{i:06d}",
+        'name': f"Song {i}", 'artist': f"Artist {i % 300}", 'album': f"Album {i % 500}",
+        'image': f"https://i.scdn.co/image/{i:040d}", 'preview_url': None,
+        'bpm': 90 + i % 60, 'key': '?', 'is_duplicate': False
+    } for i in range(n)]
+
+
+def render_detail(tracks):
+    from flask import render_template
+    playlist_info = {'name': 'Bench', 'owner': {'display_name': 'bench'}, 'images': [], 'external_urls': {'spotify': '#'}}
+    vibe = {'energy': 50, 'danceability': 50, 'valence': 50, 'bpm': 120}
+    return render_template('playlist_detail.html', page='playlists', tracks=tracks, track_total=len(tracks),
+                           virtualized=False, snapshot_id='bench-snapshot', playlist_info=playlist_info,
+                           playlist_id='bench', search_results=None, is_owner=True, vibe=vibe)
+
+
+def render_review(tracks):
+    from flask import render_template
+    results = [{'query': f"{t['name']} - {t['artist']}", 'matches': [t]} for t in tracks]
+    return render_template('review.html', page='create', results=results, scrollable=True)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def bench_render():
+    print(f"{'template':<22}{'tracks':>8}{'cold ms':>10}{'warm ms':>10}{'1 changed ms':>14}")
+    print("-" * 64)
+    with app.test_request_context():
+        for name, fn in (('playlist_detail.html', render_detail), ('review.html', render_review)):
+            for n in (100, 500, 1000, 2000):
+                tracks = make_tracks(n)
+                app.jinja_env.fragment_cache.clear()
+                cold = timed(fn, tracks)
+                warm = timed(fn, tracks)
+                tracks[n // 2]['bpm'] = 0  # One row re-enriched
+                changed = timed(fn, tracks)
+                print(f"{name:<22}{n:>8}{cold:>10.1f}{warm:>10.1f}{changed:>14.1f}")
+
+
+if __name__ == "__main__":
+    bench_render()
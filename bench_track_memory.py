@@ -0,0 +1,113 @@
+"""
+Benchmark de memoria: capas de dicts por pista (antiguo) vs TrackRecord
+(__slots__ + cadenas internadas), desde las páginas de la API hasta los
+grupos que recibe review.html. Cada caso corre en su propio proceso para
+medir el pico de RSS.
+
+    python bench_track_memory.py
+"""
+import json
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+SIZES = (1000, 10000)
+ARTISTS = 400
+ALBUMS = 900
+
+
+def make_pages(n):
+    """Páginas de playlist_items como JSON (cada json.loads crea cadenas nuevas, como la API)"""
+    pages = []
+    for start in range(0, n, 100):
+        items = []
+        for i in range(start, min(n, start + 100)):
+            artist, album = i % ARTISTS, i % ALBUMS
+            items.append({'track': {
+                'id': f"{i:022d}", 'uri': f"spotify:track:{i:022d}", 'name': f"Song {i}",
+                'preview_url': None, 'duration_ms': 180000 + i,
+                'artists': [{'id': f"artist{artist:016d}", 'name': f"Artist {artist}"}],
+                'album': {'name': f"Album {album}", 'images': [
+                    {'url': f"https://i.scdn.co/image/ab67616d0000b273{album:024x}", 'width': 640, 'height': 640},
+                    {'url': f"https://i.scdn.co/image/ab67616d00001e02{album:024x}", 'width': 300, 'height': 300},
+                    {'url': f"https://i.scdn.co/image/ab67616d00004851{album:024x}", 'width': 64, 'height': 64}]}
+            }})
+        pages.append(json.dumps({'items': items, 'total': n}))
+    return pages
+
+
+def legacy_pipeline(pages):
+    """get_playlist_tracks + caché + playlist_edit tal y como estaban (dicts en cada capa)"""
+    all_items = []
+    for page in pages:
+        all_items.extend(json.loads(page)['items'])
+    tracks = []
+    for item in all_items:
+        t = item['track']
+        tracks.append({
+            'id': t['id'], 'name': t['name'], 'artist': t['artists'][0]['name'],
+            'album': t['album']['name'], 'image': t['album']['images'][0]['url'], 'uri': t['uri'],
+            'preview_url': t['preview_url'], 'duration_ms': t.get('duration_ms')
+        })
+    cached = [dict(t) for t in tracks]
+    tracks = [dict(t) for t in cached]
+    results = [{
+        'id': t['id'], 'uri': t['uri'], 'name': t['name'], 'artist': t['artist'], 'album': t['album'],
+        'image': t['image'], 'bpm': 0, 'key': '?', 'preview_url': t['preview_url'],
+        'external_urls': {'spotify': f"https://open.spotify.com/track/{t['id']}"},
+        'artist_ids': [], 'duration_ms': t.get('duration_ms')
+    } for t in tracks]
+    formatted_results = [{'query': f"{tr['name']} - {tr['artist']}", 'matches': [tr]} for tr in results]
+    return cached, all_items, tracks, results, formatted_results
+
+
+def records_pipeline(pages):
+    """get_playlist_tracks + caché + playlist_edit actuales (TrackRecord de punta a punta)"""
+    from track_records import TrackCollection
+    tracks = TrackCollection()
+    for page in pages:
+        tracks.extend(TrackCollection.from_playlist_items(json.loads(page)['items']))
+    cached = tracks.copy()
+    tracks = cached.copy()
+    formatted_results = [{'query': f"{t['name']} - {t['artist']}", 'matches': [t]} for t in tracks]
+    return cached, tracks, formatted_results
+
+
+def child(mode, n):
+    import track_records  # noqa: F401  (same imports in both modes)
+    pages = make_pages(n)
+    fn = legacy_pipeline if mode == 'dicts' else records_pipeline
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    kept = fn(pages)
+    elapsed = (time.perf_counter() - start) * 1000
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    del kept
+
+    tracemalloc.start()
+    kept = fn(pages)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(json.dumps({'rss_kb': peak_rss - base_rss, 'retained': retained, 'peak': peak, 'ms': elapsed}))
+
+
+def main():
+    print(f"{'records':<10}{'tracks':>8}{'peak RSS MB':>13}{'retained MB':>13}{'alloc peak MB':>15}{'build ms':>10}")
+    print("-" * 69)
+    for n in SIZES:
+        for mode in ('dicts', 'slots'):
+            out = subprocess.run([sys.executable, __file__, '--child', mode, str(n)],
+                                 capture_output=True, text=True, check=True).stdout
+            r = json.loads(out)
+            print(f"{mode:<10}{n:>8}{r['rss_kb'] / 1024:>13.1f}{r['retained'] / 2**20:>13.1f}"
+                  f"{r['peak'] / 2**20:>15.1f}{r['ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
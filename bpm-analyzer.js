@@ -1,125 +1,115 @@
 /**
- * BPM Analyzer v4: Professional Autocorrelation & Energy Envelope
- * High-precision tempo detection focusing on rhythmic energy repetition.
- * Optimized against "octave errors" (half/double tempo) using lag weightings.
+ * BPM Analyzer v5: Autocorrelation & Energy Envelope in a Web Worker
+ * Previews are decoded and downmixed to mono 11 kHz with OfflineAudioContext;
+ * the analysis itself (bpm-worker.js) runs off the main thread.
+ * Results are reported to /bpm-report so one analysis serves later visitors.
  */
 
+const ANALYSIS_RATE = 11025; // Rhythm only needs the low band
+
 class BPMAnalyzer {
-    constructor() {
-        this.audioCtx = new (window.AudioContext || window.webkitAudioContext)();
+    constructor(workerUrl) {
+        this.workerUrl = workerUrl;
+        this.worker = null;
+        this.pending = new Map();
+        this.nextId = 0;
+    }
+
+    getWorker() {
+        if (!this.worker) {
+            this.worker = new Worker(this.workerUrl);
+            this.worker.onmessage = (event) => {
+                const { id, result } = event.data;
+                const resolve = this.pending.get(id);
+                this.pending.delete(id);
+                if (resolve) resolve(result);
+            };
+        }
+        return this.worker;
     }
 
     async analyzeFromUrl(url) {
         try {
             const response = await fetch(url);
             const arrayBuffer = await response.arrayBuffer();
-            const audioBuffer = await this.audioCtx.decodeAudioData(arrayBuffer);
-            return this.calculateBPM(audioBuffer);
+            const pcm = await this.decodeMono(arrayBuffer);
+            return await this.analyzePcm(pcm, ANALYSIS_RATE);
         } catch (e) {
             console.error("BPM analysis failed:", e);
             return null;
         }
     }
 
-    calculateBPM(buffer) {
-        const data = buffer.getChannelData(0);
-        const sampleRate = buffer.sampleRate;
-
-        // 1. Decimate and Filter (Downsample for performance)
-        // We only need the rhythm, so we can work with 22kHz or even 11kHz.
-        const decimatedData = this.getEnergyEnvelope(data, sampleRate);
-
-        // 2. Autocorrelation (Find the periodicities)
-        const bpm = this.autocorrelate(decimatedData, 100); // 100 is the sample rate of our envelope
-
-        return bpm;
-    }
-
     /**
-     * Converts raw PCM to an Energy Envelope at 100Hz resolution.
+     * Decodes at ANALYSIS_RATE and renders a mono mixdown, both on the audio thread.
      */
-    getEnergyEnvelope(data, sampleRate) {
-        const winSize = Math.floor(sampleRate / 100); // 10ms windows for 100Hz envelope
-        const envelope = [];
-
-        for (let i = 0; i < data.length; i += winSize) {
-            let sum = 0;
-            const end = Math.min(i + winSize, data.length);
-            for (let j = i; j < end; j++) {
-                sum += data[j] * data[j]; // Power
-            }
-            envelope.push(Math.sqrt(sum / winSize));
+    async decodeMono(arrayBuffer) {
+        const OfflineCtx = window.OfflineAudioContext || window.webkitOfflineAudioContext;
+        const decoded = await new OfflineCtx(1, 1, ANALYSIS_RATE).decodeAudioData(arrayBuffer);
+        if (decoded.numberOfChannels === 1 && decoded.sampleRate === ANALYSIS_RATE) {
+            return decoded.getChannelData(0);
         }
-        return envelope;
+        const ctx = new OfflineCtx(1, Math.ceil(decoded.duration * ANALYSIS_RATE), ANALYSIS_RATE);
+        const source = ctx.createBufferSource();
+        source.buffer = decoded;
+        source.connect(ctx.destination);
+        source.start();
+        return (await ctx.startRendering()).getChannelData(0);
     }
 
-    /**
-     * Finds the most likely lag (tempo) using autocorrelation.
-     */
-    autocorrelate(envelope, envSampleRate) {
-        const minBpm = 60;
-        const maxBpm = 200;
-        const minLag = Math.floor((60 * envSampleRate) / maxBpm); // ~30 samples for 200 BPM
-        const maxLag = Math.floor((60 * envSampleRate) / minBpm);  // ~100 samples for 60 BPM
-
-        let bestLag = -1;
-        let maxCorr = -1;
-        const results = [];
-
-        for (let lag = minLag; lag <= maxLag; lag++) {
-            let corr = 0;
-            let count = 0;
-            for (let i = 0; i < envelope.length - lag; i++) {
-                corr += envelope[i] * envelope[i + lag];
-                count++;
-            }
-            corr /= count;
-
-            results.push({ lag, corr });
-            if (corr > maxCorr) {
-                maxCorr = corr;
-                bestLag = lag;
-            }
-        }
-
-        if (bestLag === -1) return null;
-
-        // Convert lag to BPM
-        let bpm = (60 * envSampleRate) / bestLag;
-
-        // Basic Octave correction
-        return {
-            bpm: Math.round(bpm),
-            energy: this.calculateEnergy(envelope),
-            danceability: this.calculateDanceability(results, maxCorr)
-        };
+    analyzePcm(pcm, sampleRate) {
+        return new Promise((resolve) => {
+            const id = this.nextId++;
+            this.pending.set(id, resolve);
+            // Transfer a copy of the samples: no structured clone of the buffer
+            const copy = new Float32Array(pcm);
+            this.getWorker().postMessage({ id, pcm: copy, sampleRate }, [copy.buffer]);
+        });
     }
+}
 
-    calculateEnergy(envelope) {
-        if (!envelope.length) return 0;
-        const sum = envelope.reduce((a, b) => a + b, 0);
-        const avg = sum / envelope.length;
-        // Normalize to 0-100 range (empirical scaling based on square law energy)
-        return Math.min(100, Math.round(avg * 150));
-    }
+// Global instance (the page passes the worker's hashed URL on the script tag)
+const analyzerScript = document.currentScript;
+window.bpmAnalyzer = new BPMAnalyzer(
+    (analyzerScript && analyzerScript.dataset.worker) ||
+    (analyzerScript ? analyzerScript.src.replace('bpm-analyzer.js', 'bpm-worker.js') : 'bpm-worker.js'));
+
+// Results are shared with the server in small batches
+const bpmReportQueue = [];
+let bpmReportTimer = null;
+
+function reportAnalysis(trackId, analysis) {
+    if (!trackId || !analysis || !analysis.bpm) return;
+    bpmReportQueue.push({ id: trackId, bpm: analysis.bpm, energy: analysis.energy, danceability: analysis.danceability });
+    clearTimeout(bpmReportTimer);
+    bpmReportTimer = setTimeout(flushBpmReports, bpmReportQueue.length >= 50 ? 0 : 2000);
+}
 
-    calculateDanceability(results, maxCorr) {
-        if (!results.length) return 0;
-        // Danceability is related to how dominant the "peak" is compared to the average correlation
-        const avgCorr = results.reduce((a, b) => a + b.corr, 0) / results.length;
-        const ratio = maxCorr / (avgCorr || 1);
-        // Map ratio to 0-100 (empirical scaling)
-        return Math.min(100, Math.round((ratio - 1) * 40));
-    }
+function flushBpmReports() {
+    const batch = bpmReportQueue.splice(0, 50);
+    if (!batch.length) return;
+    fetch('/bpm-report', {
+        method: 'POST',
+        keepalive: true,
+        headers: { 'Content-Type': 'application/json', 'X-Requested-With': 'XMLHttpRequest' },
+        body: JSON.stringify({ reports: batch, playlist_id: window.currentPlaylistId || null })
+    }).then(() => {
+        // The playlist's vibe summary now includes these tracks
+        if (window.updateVibeDashboard) window.updateVibeDashboard();
+    }).catch(err => console.error(err));
+    if (bpmReportQueue.length) bpmReportTimer = setTimeout(flushBpmReports, 0);
 }
 
-// Global instance
-window.bpmAnalyzer = new BPMAnalyzer();
+window.addEventListener('pagehide', flushBpmReports);
 
 async function analyzeSingleElement(card) {
     const val = card.textContent.trim();
     if (val === '--' || val === '0' || card.getAttribute('data-recalculate') === 'true') {
-        const previewUrl = card.getAttribute('data-preview');
+        let previewUrl = card.getAttribute('data-preview');
+        if ((!previewUrl || previewUrl === 'None') && window.resolvePreviewFor) {
+            // Previews are resolved lazily; fetch this row's one only when it needs analysis
+            previewUrl = await window.resolvePreviewFor(card);
+        }
         if (previewUrl && previewUrl !== 'None' && previewUrl !== '') {
             card.innerHTML = '<span class="animate-pulse">...</span>';
             const analysis = await window.bpmAnalyzer.analyzeFromUrl(previewUrl);
@@ -134,6 +124,7 @@ async function analyzeSingleElement(card) {
                     row.setAttribute('data-energy', analysis.energy);
                     row.setAttribute('data-dance', analysis.danceability);
                     row.setAttribute('data-bpm', analysis.bpm);
+                    reportAnalysis(row.dataset.id, analysis);
                 }
 
                 // Update x2 element if exists
@@ -150,15 +141,13 @@ async function analyzeSingleElement(card) {
 }
 
 async function autoDetectMissingBPM() {
-    console.log("Starting Vibe Analysis (Precision v4) - Parallel...");
+    console.log("Starting Vibe Analysis (Precision v5) - Worker...");
     const cards = Array.from(document.querySelectorAll('[id^="main-bpm-"]'));
 
     const batchSize = 7;
     for (let i = 0; i < cards.length; i += batchSize) {
         const batch = cards.slice(i, i + batchSize);
         await Promise.all(batch.map(card => analyzeSingleElement(card)));
-        // Update dashboard incrementally after each batch
-        if (window.updateVibeDashboard) window.updateVibeDashboard();
     }
 }
 
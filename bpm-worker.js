@@ -0,0 +1,89 @@
+/**
+ * BPM Analyzer worker: autocorrelation & energy envelope, off the main thread.
+ * Input:  { id, pcm: Float32Array (mono, downsampled), sampleRate }
+ * Output: { id, result: { bpm, energy, danceability } | null }
+ */
+
+const ENVELOPE_RATE = 100; // 10ms windows
+
+/**
+ * Converts raw PCM to an Energy Envelope at 100Hz resolution.
+ */
+function getEnergyEnvelope(data, sampleRate) {
+    const winSize = Math.floor(sampleRate / ENVELOPE_RATE);
+    const envelope = new Float32Array(Math.ceil(data.length / winSize));
+
+    for (let w = 0, i = 0; i < data.length; i += winSize, w++) {
+        let sum = 0;
+        const end = Math.min(i + winSize, data.length);
+        for (let j = i; j < end; j++) {
+            sum += data[j] * data[j]; // Power
+        }
+        envelope[w] = Math.sqrt(sum / winSize);
+    }
+    return envelope;
+}
+
+/**
+ * Finds the most likely lag (tempo) using autocorrelation.
+ */
+function autocorrelate(envelope, envSampleRate) {
+    const minBpm = 60;
+    const maxBpm = 200;
+    const minLag = Math.floor((60 * envSampleRate) / maxBpm); // ~30 samples for 200 BPM
+    const maxLag = Math.floor((60 * envSampleRate) / minBpm);  // ~100 samples for 60 BPM
+
+    let bestLag = -1;
+    let maxCorr = -1;
+    let corrSum = 0;
+    let lags = 0;
+
+    for (let lag = minLag; lag <= maxLag; lag++) {
+        let corr = 0;
+        const count = envelope.length - lag;
+        for (let i = 0; i < count; i++) {
+            corr += envelope[i] * envelope[i + lag];
+        }
+        corr /= count;
+
+        corrSum += corr;
+        lags++;
+        if (corr > maxCorr) {
+            maxCorr = corr;
+            bestLag = lag;
+        }
+    }
+
+    if (bestLag === -1) return null;
+
+    return {
+        bpm: Math.round((60 * envSampleRate) / bestLag),
+        energy: calculateEnergy(envelope),
+        danceability: calculateDanceability(corrSum / lags, maxCorr)
+    };
+}
+
+function calculateEnergy(envelope) {
+    if (!envelope.length) return 0;
+    let sum = 0;
+    for (let i = 0; i < envelope.length; i++) sum += envelope[i];
+    // Normalize to 0-100 range (empirical scaling based on square law energy)
+    return Math.min(100, Math.round((sum / envelope.length) * 150));
+}
+
+function calculateDanceability(avgCorr, maxCorr) {
+    // Danceability is related to how dominant the "peak" is compared to the average correlation
+    const ratio = maxCorr / (avgCorr || 1);
+    return Math.max(0, Math.min(100, Math.round((ratio - 1) * 40)));
+}
+
+self.onmessage = (event) => {
+    const { id, pcm, sampleRate } = event.data;
+    let result = null;
+    try {
+        result = autocorrelate(getEnergyEnvelope(pcm, sampleRate), ENVELOPE_RATE);
+    } catch (e) {
+        console.error("BPM worker failed:", e);
+    }
+    self.postMessage({ id, result });
+};
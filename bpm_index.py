@@ -0,0 +1,293 @@
+"""
+Índice offline ISRC → BPM/tonalidad: un fichero binario ordenado que se lee con
+mmap y búsqueda binaria. Todos los workers de gunicorn comparten sus páginas
+(caché de páginas del sistema), así que no ocupa memoria por proceso.
+
+    python bpm_index.py build dump1.csv dump2.jsonl -o bpm_index.bin
+    python bpm_index.py get bpm_index.bin GBAHT1901299
+
+Los volcados CSV/JSONL necesitan `isrc` y `bpm` (o `tempo`); `key` (0-11 o
+nombre de nota, "Am" para menor) y `mode` (1 mayor, 0 menor) son opcionales.
+El fichero se sustituye de forma atómica (os.replace) y los lectores cambian
+al nuevo en su siguiente comprobación, sin reiniciar.
+"""
+import argparse
+import csv
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+from log_config import get_logger
+
+log = get_logger(__name__)
+
+MAGIC = b'BPMIDX01'
+HEADER = struct.Struct('<8sI4x')          # magic, record count
+RECORD = struct.Struct('<12sHB1x')       # isrc, bpm x 10, key (pitch | MINOR), padding
+ISRC_LEN = 12
+NO_KEY = 0xFF
+MINOR = 0x10
+NOTES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+FLATS = {'Db': 'C#', 'Eb': 'D#', 'Gb': 'F#', 'Ab': 'G#', 'Bb': 'A#'}
+ISRC_RE = re.compile(r'^[A-Z0-9]{12}$')
+RUN_SIZE = 500_000  # Records per sorted run while building (bounds the importer's memory)
+
+
+def normalize_isrc(isrc):
+    """ISRC en mayúsculas y sin guiones como bytes de 12, o None si no es válido"""
+    isrc = str(isrc or '').replace('-', '').strip().upper()
+    return isrc.encode('ascii') if ISRC_RE.match(isrc) else None
+
+
+def encode_key(key, mode=None):
+    """Tonalidad a un byte: clase de altura (0-11) | MINOR; NO_KEY si se desconoce"""
+    if key is None or key == '':
+        return NO_KEY
+    minor = str(mode).strip() in ('0', 'minor')
+    try:
+        pitch = int(key)
+    except (TypeError, ValueError):
+        name = str(key).strip()
+        if name.endswith('m'):
+            name, minor = name[:-1], True
+        name = FLATS.get(name, name)
+        if name not in NOTES:
+            return NO_KEY
+        pitch = NOTES.index(name)
+    if not 0 <= pitch <= 11:
+        return NO_KEY
+    return pitch | (MINOR if minor else 0)
+
+
+def decode_key(code):
+    if code == NO_KEY:
+        return None
+    return NOTES[code & 0x0F] + ('m' if code & MINOR else '')
+
+
+def read_dump(path):
+    """Filas (isrc, bpm, key, mode) de un volcado CSV o JSONL, en streaming"""
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.endswith(('.jsonl', '.ndjson', '.json')):
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                yield row.get('isrc'), row.get('bpm', row.get('tempo')), row.get('key'), row.get('mode')
+        else:
+            for row in csv.DictReader(f):
+                row = {k.strip().lower(): v for k, v in row.items() if k}
+                yield row.get('isrc'), row.get('bpm') or row.get('tempo'), row.get('key'), row.get('mode')
+
+
+def _pack_rows(rows, stats):
+    for isrc, bpm, key, mode in rows:
+        isrc = normalize_isrc(isrc)
+        try:
+            bpm10 = int(round(float(bpm) * 10))
+        except (TypeError, ValueError):
+            bpm10 = 0
+        if not isrc or not 0 < bpm10 <= 0xFFFF:
+            stats['rejected'] += 1
+            continue
+        stats['rows'] += 1
+        yield isrc, RECORD.pack(isrc, bpm10, encode_key(key, mode))
+
+
+def _write_run(records, directory):
+    """Un tramo ordenado (ya sin ISRC repetidos) a un fichero temporal"""
+    fd, path = tempfile.mkstemp(suffix='.run', dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        for isrc in sorted(records):
+            f.write(records[isrc])
+    return path
+
+
+def _iter_run(path, run_index):
+    with open(path, 'rb') as f:
+        while True:
+            record = f.read(RECORD.size)
+            if not record:
+                return
+            # Later runs (later rows in the dumps) sort first on ties: last value wins
+            yield record[:ISRC_LEN], -run_index, record
+
+
+def build_index(sources, output, run_size=RUN_SIZE):
+    """
+    Construye el índice desde volcados CSV/JSONL con ordenación externa (tramos
+    ordenados + mezcla), así la memoria no depende del tamaño de los volcados.
+    Escribe a un temporal junto a `output` y lo publica con os.replace.
+    """
+    stats = {'rows': 0, 'rejected': 0, 'records': 0}
+    directory = os.path.dirname(os.path.abspath(output))
+    runs = []
+    try:
+        pending = {}
+        for source in sources:
+            for isrc, record in _pack_rows(read_dump(source), stats):
+                pending[isrc] = record
+                if len(pending) >= run_size:
+                    runs.append(_write_run(pending, directory))
+                    pending = {}
+        if pending or not runs:
+            runs.append(_write_run(pending, directory))
+
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, 0))
+                last = None
+                for isrc, _, record in heapq.merge(*(_iter_run(p, i) for i, p in enumerate(runs))):
+                    if isrc != last:
+                        f.write(record)
+                        stats['records'] += 1
+                        last = isrc
+                f.seek(0)
+                f.write(HEADER.pack(MAGIC, stats['records']))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, output)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    finally:
+        for path in runs:
+            os.unlink(path)
+    return stats
+
+
+class _Snapshot:
+    """Un fichero de índice mapeado en memoria (solo lectura)"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            self.identity = (st.st_ino, st.st_mtime_ns, st.st_size)
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if st.st_size else None
+        if self.map is None or st.st_size < HEADER.size:
+            raise ValueError(f"BPM index {path} is empty")
+        magic, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or st.st_size != HEADER.size + self.count * RECORD.size:
+            raise ValueError(f"BPM index {path} is corrupt or from another version")
+
+    def find(self, isrc):
+        """(bpm, key) por búsqueda binaria sobre los registros de tamaño fijo"""
+        data, size, base = self.map, RECORD.size, HEADER.size
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = base + mid * size
+            current = data[offset:offset + ISRC_LEN]
+            if current < isrc:
+                lo = mid + 1
+            elif current > isrc:
+                hi = mid
+            else:
+                _, bpm10, key = RECORD.unpack_from(data, offset)
+                return bpm10 / 10, decode_key(key)
+        return None
+
+
+class BPMIndex:
+    """
+    Lector del índice. Cada CHECK_INTERVAL segundos mira si el fichero ha sido
+    sustituido y, si es así, mapea el nuevo; las búsquedas en curso siguen con
+    el anterior (se libera cuando nadie lo usa).
+    """
+    CHECK_INTERVAL = 5.0
+
+    def __init__(self, path):
+        self.path = path
+        self._snapshot = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.reloads = 0
+        self._refresh()
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self._snapshot = None
+            return
+        current = self._snapshot
+        if current and current.identity == (st.st_ino, st.st_mtime_ns, st.st_size):
+            return
+        try:
+            self._snapshot = _Snapshot(self.path)
+            self.reloads += 1 if current else 0
+        except (OSError, ValueError) as e:
+            log.error("BPM index load error: %s", e)
+
+    def _current(self):
+        now = time.monotonic()
+        if now >= self._next_check and self._lock.acquire(blocking=False):
+            try:
+                self._next_check = now + self.CHECK_INTERVAL
+                self._refresh()
+            finally:
+                self._lock.release()
+        return self._snapshot
+
+    def get(self, isrc):
+        """(bpm, key) del ISRC, o None si no está en el índice"""
+        snapshot = self._current()
+        key = normalize_isrc(isrc)
+        if snapshot is None or key is None:
+            return None
+        self.lookups += 1
+        found = snapshot.find(key)
+        if found:
+            self.hits += 1
+        return found
+
+    def bpm(self, isrc):
+        """BPM entero como las fuentes online (0 si no está)"""
+        found = self.get(isrc)
+        return int(round(found[0])) if found else 0
+
+    def __len__(self):
+        snapshot = self._current()
+        return snapshot.count if snapshot else 0
+
+    def stats(self):
+        return {
+            'records': len(self),
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'reloads': self.reloads
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="construir el índice a partir de volcados CSV/JSONL")
+    build.add_argument('dumps', nargs='+')
+    build.add_argument('-o', '--output', default='bpm_index.bin')
+    get = commands.add_parser('get', help="consultar ISRCs")
+    get.add_argument('index')
+    get.add_argument('isrcs', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        result = build_index(args.dumps, args.output)
+        print(f"{result['records']} ISRCs ({result['rows']} filas, {result['rejected']} descartadas) "
+              f"→ {args.output} en {time.perf_counter() - start:.1f}s")
+    else:
+        index = BPMIndex(args.index)
+        for isrc in args.isrcs:
+            print(isrc, index.get(isrc))
+        sys.exit(0 if len(index) else 1)
@@ -0,0 +1,146 @@
+import hashlib
+import re
+import threading
+import time
+
+from cache_manager import TTLCache, TwoTierCache
+from enrichment import EnrichmentPipeline, EnrichmentSource
+
+TRACK_ID_RE = re.compile(r'^[A-Za-z0-9]{22}$')
+
+
+class BPMReportStore:
+    """
+    Resultados del analizador del navegador (BPM, energía, bailabilidad) por track ID.
+    Un informe aislado no vale: se acepta cuando MIN_AGREEING clientes distintos
+    coinciden (±TOLERANCE BPM). Lo aceptado alimenta la caché de enriquecimiento,
+    así un análisis sirve a todas las cargas posteriores.
+    """
+    MIN_BPM, MAX_BPM = 60, 200      # Rango del autocorrelador de bpm-analyzer.js
+    TOLERANCE = 2
+    MIN_AGREEING = 3
+    MAX_REPORTS_PER_TRACK = 10
+    MAX_REPORTS_PER_CLIENT = 500    # Por hora
+    ACCEPTED_TTL = 30 * 24 * 3600
+
+    def __init__(self):
+        self.cache = TwoTierCache('bpm-reports', maxsize=20000, ttl=self.ACCEPTED_TTL, shared_threshold=50000)
+        self._client_counts = TTLCache(maxsize=10000, ttl=3600)
+        self._lock = threading.Lock()
+        self.received = 0
+        self.rejected = 0
+        self.accepted = 0
+
+    @staticmethod
+    def client_for(user):
+        """
+        Identidad de quien informa: la cuenta de Spotify, no la sesión (varias
+        sesiones del mismo usuario cuentan como un solo cliente). None sin usuario.
+        """
+        user_id = (user or {}).get('id')
+        return f"user:{hashlib.sha256(user_id.encode()).hexdigest()[:16]}" if user_id else None
+
+    @classmethod
+    def validate(cls, report):
+        """Normaliza un informe del cliente; None si no es válido"""
+        if not isinstance(report, dict) or not TRACK_ID_RE.match(str(report.get('id', ''))):
+            return None
+        try:
+            bpm = float(report.get('bpm'))
+            energy = int(report.get('energy') or 0)
+            danceability = int(report.get('danceability') or 0)
+        except (TypeError, ValueError):
+            return None
+        if not cls.MIN_BPM <= bpm <= cls.MAX_BPM or not 0 <= energy <= 100 or not 0 <= danceability <= 100:
+            return None
+        return {'id': report['id'], 'bpm': int(round(bpm)), 'energy': energy, 'danceability': danceability}
+
+    @classmethod
+    def agreement(cls, reports):
+        """Resultado del grupo más grande de informes que coinciden, si llega a MIN_AGREEING"""
+        best = []
+        for r in reports:
+            group = [o for o in reports if abs(o['bpm'] - r['bpm']) <= cls.TOLERANCE]
+            if len(group) > len(best):
+                best = group
+        if len(best) < cls.MIN_AGREEING:
+            return None
+        bpms = sorted(o['bpm'] for o in best)
+        return {
+            'bpm': bpms[len(bpms) // 2],
+            'energy': round(sum(o['energy'] for o in best) / len(best)),
+            'danceability': round(sum(o['danceability'] for o in best) / len(best))
+        }
+
+    def add_reports(self, client_id, reports):
+        """
+        Registra los informes de un cliente (uno por pista y cliente).
+        Devuelve {track_id: resultado} de las pistas que acaban de alcanzar el acuerdo.
+        """
+        newly_accepted = {}
+        with self._lock:
+            budget = self.MAX_REPORTS_PER_CLIENT - self._client_counts.get(client_id, 0)
+            for raw in reports:
+                self.received += 1
+                report = self.validate(raw)
+                if report is None or budget <= 0 or self.cache.get(f"a:{report['id']}") is not None:
+                    self.rejected += 1
+                    continue
+                budget -= 1
+                key = f"r:{report['id']}"
+                stored = [r for r in self.cache.get(key) or [] if r['client'] != client_id]
+                stored.append(dict(report, client=client_id, ts=int(time.time())))
+                stored = stored[-self.MAX_REPORTS_PER_TRACK:]
+
+                result = self.agreement(stored)
+                if result:
+                    self.cache.set(f"a:{report['id']}", result)
+                    self.cache.delete(key)
+                    newly_accepted[report['id']] = result
+                    self.accepted += 1
+                else:
+                    self.cache.set(key, stored, ttl=7 * 24 * 3600)
+            self._client_counts.set(client_id, self.MAX_REPORTS_PER_CLIENT - budget)
+        return newly_accepted
+
+    def publish(self, pipeline, tracks, accepted):
+        """
+        Lleva los BPM aceptados a la caché de enriquecimiento, con las claves
+        artista|título que usan las vistas (artista principal y todos los artistas).
+        `tracks`: {track_id: TrackRecord} resueltos con get_tracks_bulk.
+        """
+        for track_id, result in accepted.items():
+            t = tracks.get(track_id)
+            if not t:
+                continue
+            for artist in {t['artist'].split(', ')[0], t['artist']}:
+                key = pipeline.cache_key(artist, t['name'])
+                self.cache.set(f"k:{key}", result['bpm'])
+                if not pipeline.cache.get(key):  # Never overwrite a BPM from an upstream source
+                    pipeline.cache.set(key, result['bpm'], ttl=pipeline.HIT_TTL)
+
+    def features(self, track_ids):
+        """Energía/bailabilidad aceptadas: {track_id: {...}}"""
+        found = {}
+        for track_id in track_ids:
+            result = self.cache.get(f"a:{track_id}")
+            if result:
+                found[track_id] = {'energy': result['energy'], 'danceability': result['danceability']}
+        return found
+
+    def stats(self):
+        return {'received': self.received, 'rejected': self.rejected, 'accepted': self.accepted}
+
+
+class ReportedSource(EnrichmentSource):
+    """BPM acordado por los analizadores de los clientes (sin red: solo la caché de informes)"""
+    name = 'reported'
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
+    def fetch(self, artist, name, duration_ms=None):
+        # None, not 0, without a report: a local miss says nothing about the track, and counting
+        # it as an answer would cache "not found" while the real sources are down
+        return self.store.cache.get(f"k:{EnrichmentPipeline.cache_key(artist, name)}") or None
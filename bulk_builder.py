@@ -0,0 +1,282 @@
+"""
+Constructor de playlists masivo, sin navegador: convierte un setlist de miles
+de líneas ("Artista - Canción", enlaces o URIs de Spotify) en una playlist.
+
+    python bulk_builder.py setlist.txt --name "Festival 2026"
+    python bulk_builder.py setlist.txt --playlist-id <id>     # añadir a una existente
+    python bulk_builder.py setlist.txt --name "Prueba" --dry-run
+
+Las líneas se leen en streaming y se resuelven por bloques con paralelismo
+acotado (--workers); cada bloque se enriquece con BPM y se añade a la playlist.
+El progreso queda en un checkpoint JSONL (por defecto <entrada>.checkpoint.jsonl):
+si la ejecución se corta, el mismo comando continúa sin volver a buscar nada.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from spotify_manager import SpotifyManager
+
+ADD_BATCH = 100  # Spotify accepts up to 100 URIs per add call
+
+
+def read_lines(stream):
+    """Líneas no vacías y sin repetir, en orden, sin cargar el fichero entero"""
+    seen = set()
+    for raw in stream:
+        line = raw.strip()
+        if line and line not in seen:
+            seen.add(line)
+            yield line
+
+
+class Checkpoint:
+    """
+    Registro JSONL de solo-añadir:
+      {"line": ..., "tracks": [{"uri", "id", "name", "artist", "bpm"}, ...]}  por línea resuelta
+      {"playlist_id": ..., "added": N}  tras cada alta (N: URIs ya en la playlist, en orden)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lines = {}
+        self.uris = []
+        self.playlist_id = None
+        self.added = 0
+        self._seen_uris = set()
+        torn = False
+        if os.path.exists(path):
+            self._load()
+            with open(path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    torn = f.read(1) != b'\n'
+        self._file = open(path, 'a', encoding='utf-8')
+        if torn:
+            self._file.write('\n')  # Keep the next record off the torn line
+
+    def _load(self):
+        with open(self.path, encoding='utf-8') as f:
+            for raw in f:
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    continue  # Torn line from an interrupted write
+                if 'line' in record:
+                    self._remember(record['line'], record['tracks'])
+                elif 'playlist_id' in record:
+                    self.playlist_id, self.added = record['playlist_id'], record['added']
+
+    def _remember(self, line, tracks):
+        self.lines[line] = tracks
+        for t in tracks:
+            if t['uri'] not in self._seen_uris:
+                self._seen_uris.add(t['uri'])
+                self.uris.append(t['uri'])
+
+    def record_lines(self, resolved):
+        for line, tracks in resolved:
+            self._remember(line, tracks)
+            self._file.write(json.dumps({'line': line, 'tracks': tracks}, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def record_added(self, playlist_id, added):
+        self.playlist_id, self.added = playlist_id, added
+        self._file.write(json.dumps({'playlist_id': playlist_id, 'added': added}) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class BulkBuilder:
+    """Resuelve, enriquece y añade a la playlist bloque a bloque, anotando cada paso en el checkpoint"""
+
+    def __init__(self, manager, checkpoint, workers=8, chunk_size=100, enrich=True, out=sys.stdout):
+        self.manager = manager
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.enrich = enrich
+        self.out = out
+        self.resolved = 0
+        self.found = 0
+        self.with_bpm = 0
+        self.skipped = 0
+        self.failed = 0
+
+    @staticmethod
+    def _compact(match):
+        return {'uri': match['uri'], 'id': match['id'], 'name': match['name'], 'artist': match['artist'],
+                'duration_ms': match.get('duration_ms'), 'isrc': match.get('isrc'), 'bpm': 0}
+
+    def resolve_chunk(self, lines):
+        """
+        [(línea, [pistas])]: la mejor coincidencia por línea; álbumes y playlists,
+        todas sus pistas. None en vez de la lista si la búsqueda falló (se reintenta).
+        """
+        parsed = [self.manager.parse_spotify_link(l) for l in lines]
+        # Tracks and free text map 1:1 to results; album/playlist links expand to many
+        single = [l for l, p in zip(lines, parsed) if not p or p[0] == 'track']
+        results = {}
+        if single:
+            for line, res in zip(single, self.manager.resolve_song_lines(single, limit=1, max_workers=self.workers)):
+                if res.get('error'):
+                    results[line] = None
+                else:
+                    results[line] = [self._compact(res['matches'][0])] if res['matches'] else []
+        for line, p in zip(lines, parsed):
+            if p and p[0] != 'track':
+                expanded = self.manager.resolve_song_lines([line], max_workers=self.workers)
+                if any(r.get('error') for r in expanded):
+                    results[line] = None
+                else:
+                    results[line] = [self._compact(r['matches'][0]) for r in expanded if r['matches']]
+
+        if self.enrich:
+            tracks = [t for line in lines for t in results[line] or []]
+
+            def _bpm(t):
+                try:
+                    t['bpm'] = self.manager.fetch_bpm(t['artist'], t['name'], t['duration_ms'], isrc=t['isrc']) or 0
+                except Exception as e:
+                    print(f"BPM error ({t['artist']} - {t['name']}): {e}", file=self.out)
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(_bpm, tracks))
+        return [(line, results[line]) for line in lines]
+
+    def flush_playlist(self, name, dry_run=False):
+        """Añade a la playlist las URIs resueltas que aún no están (crea la playlist la primera vez)"""
+        cp = self.checkpoint
+        while not dry_run and cp.added < len(cp.uris):
+            batch = cp.uris[cp.added:cp.added + ADD_BATCH]
+            result = self.manager.create_playlist_with_tracks(name, batch, playlist_id=cp.playlist_id)
+            cp.record_added(result['playlist_id'], cp.added + len(batch))
+
+    def run(self, lines, name, total=None, dry_run=False):
+        cp = self.checkpoint
+        start = time.perf_counter()
+        # Resume: URIs resolved before the interruption but never added go first
+        self.flush_playlist(name, dry_run)
+
+        chunk = []
+        for line in lines:
+            if line in cp.lines:
+                self.skipped += 1
+                continue
+            chunk.append(line)
+            if len(chunk) >= self.chunk_size:
+                self._process(chunk, name, dry_run, start, total)
+                chunk = []
+        if chunk:
+            self._process(chunk, name, dry_run, start, total)
+        return time.perf_counter() - start
+
+    def _process(self, chunk, name, dry_run, start, total):
+        try:
+            resolved = self.resolve_chunk(chunk)
+        except Exception as e:
+            # One bad chunk must not end a run of thousands of lines
+            print(f"[bulk] Error en un bloque de {len(chunk)} líneas ({chunk[0]!r}...): {e}", file=self.out)
+            resolved = [(line, None) for line in chunk]
+        # Failed lines stay out of the checkpoint ("no match" is recorded as []), so a rerun retries them
+        self.failed += sum(1 for _, tracks in resolved if tracks is None)
+        resolved = [(line, tracks) for line, tracks in resolved if tracks is not None]
+        self.checkpoint.record_lines(resolved)
+        self.resolved += len(chunk)
+        self.found += sum(1 for _, tracks in resolved if tracks)
+        self.with_bpm += sum(1 for _, tracks in resolved for t in tracks if t['bpm'])
+        self.flush_playlist(name, dry_run)
+        self.report(start, total)
+
+    def report(self, start, total=None):
+        elapsed = time.perf_counter() - start
+        rate = self.resolved / elapsed if elapsed else 0.0
+        done = self.skipped + self.resolved
+        progress = f"{done}/{total} ({done * 100 // total}%)" if total else f"{done}"
+        eta = f" · ETA {int((total - done) / rate)}s" if total and rate else ""
+        print(f"[bulk] {progress} líneas · {self.found} encontradas · {self.with_bpm} con BPM · "
+              f"{self.checkpoint.added} añadidas · {rate:.1f} líneas/s{eta}", file=self.out, flush=True)
+
+
+def _count_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return sum(1 for _ in read_lines(f))
+
+
+def _authenticate(token_cache):
+    """SpotifyManager autenticado con las credenciales de .env (la primera vez pide pegar la URL de vuelta)"""
+    from spotipy.oauth2 import SpotifyOAuth
+    from config import Config
+    if not Config.SPOTIPY_CLIENT_ID or not Config.SPOTIPY_CLIENT_SECRET or not Config.SPOTIPY_REDIRECT_URI:
+        raise SystemExit("Faltan SPOTIPY_CLIENT_ID / SPOTIPY_CLIENT_SECRET / SPOTIPY_REDIRECT_URI en .env")
+    sp_oauth = SpotifyOAuth(
+        client_id=Config.SPOTIPY_CLIENT_ID,
+        client_secret=Config.SPOTIPY_CLIENT_SECRET,
+        redirect_uri=Config.SPOTIPY_REDIRECT_URI,
+        scope="playlist-modify-public playlist-modify-private playlist-read-private",
+        cache_path=token_cache,
+        open_browser=False
+    )
+    manager = SpotifyManager()
+    manager.authenticate_with_oauth(sp_oauth)
+    return manager
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help="fichero con una canción por línea ('-' para stdin)")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--name', help="crear una playlist nueva con este nombre")
+    target.add_argument('--playlist-id', help="añadir a esta playlist existente")
+    parser.add_argument('--checkpoint', help="fichero de checkpoint (por defecto <input>.checkpoint.jsonl)")
+    parser.add_argument('--workers', type=int, default=8, help="peticiones simultáneas a Spotify/Deezer (8)")
+    parser.add_argument('--chunk', type=int, default=100, help="líneas por bloque y por checkpoint (100)")
+    parser.add_argument('--no-bpm', action='store_true', help="no enriquecer con BPM")
+    parser.add_argument('--dry-run', action='store_true', help="solo resolver, sin tocar playlists")
+    parser.add_argument('--token-cache', default='.bulk_builder_token', help="caché del token OAuth")
+    args = parser.parse_args(argv)
+
+    if args.input == '-' and not args.checkpoint:
+        parser.error("con stdin hace falta --checkpoint")
+    checkpoint_path = args.checkpoint or f"{args.input}.checkpoint.jsonl"
+    checkpoint = Checkpoint(checkpoint_path)
+    if args.playlist_id and checkpoint.playlist_id not in (None, args.playlist_id):
+        parser.error(f"el checkpoint pertenece a otra playlist ({checkpoint.playlist_id})")
+    checkpoint.playlist_id = checkpoint.playlist_id or args.playlist_id
+    if checkpoint.lines:
+        print(f"[bulk] Reanudando: {len(checkpoint.lines)} líneas ya resueltas, "
+              f"{checkpoint.added} canciones ya añadidas ({checkpoint_path})")
+
+    manager = _authenticate(args.token_cache)
+    builder = BulkBuilder(manager, checkpoint, workers=max(1, args.workers), chunk_size=max(1, args.chunk),
+                          enrich=not args.no_bpm)
+    stream = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    total = None if args.input == '-' else _count_lines(args.input)
+    try:
+        elapsed = builder.run(read_lines(stream), args.name, total=total, dry_run=args.dry_run)
+    except KeyboardInterrupt:
+        print(f"\n[bulk] Interrumpido. Vuelve a lanzar el mismo comando para continuar ({checkpoint_path})")
+        return 130
+    finally:
+        checkpoint.close()
+        if stream is not sys.stdin:
+            stream.close()
+
+    rate = builder.resolved / elapsed if elapsed else 0.0
+    print(f"[bulk] Terminado en {elapsed:.1f}s ({rate:.1f} líneas/s): {builder.resolved} resueltas ahora, "
+          f"{builder.skipped} del checkpoint, {builder.found} encontradas, {builder.with_bpm} con BPM"
+          f"{f', {builder.failed} con error (se reintentan al relanzar)' if builder.failed else ''}.")
+    if checkpoint.playlist_id and not args.dry_run:
+        print(f"[bulk] Playlist: https://open.spotify.com/playlist/{checkpoint.playlist_id} "
+              f"({checkpoint.added} canciones añadidas)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import threading
+import time
+from collections import OrderedDict
+
+from log_config import get_logger
+
+log = get_logger(__name__)
+
+
+class TTLCache:
+    """
+    Caché LRU en memoria con expiración por entrada.
+    Thread-safe: los hilos de enriquecimiento comparten la misma instancia.
+    """
+    MISSING = object()
+
+    def __init__(self, maxsize=1000, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, self.MISSING)
+            if entry is self.MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __contains__(self, key):
+        return self.get(key, self.MISSING) is not self.MISSING
+
+    def set(self, key, value, ttl=None):
+        """Guarda un valor. `ttl` (segundos) sobreescribe el TTL por defecto."""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def keys(self):
+        """Snapshot de las claves vigentes (más recientes al final)"""
+        now = time.time()
+        with self._lock:
+            return [k for k, (_, expires_at) in self._data.items() if expires_at > now]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0
+        }
+
+
+_shared_backends = {}
+
+
+def get_shared_backend(namespace, threshold=5000, default_timeout=3600):
+    """
+    Backend compartido por todos los workers de gunicorn.
+    Redis si hay REDIS_URL; si no, caché en disco (cachelib, como Flask-Session).
+    """
+    if namespace in _shared_backends:
+        return _shared_backends[namespace]
+
+    import os
+    redis_url = os.environ.get('REDIS_URL')
+    if redis_url:
+        import redis
+        from cachelib import RedisCache
+        backend = RedisCache(host=redis.from_url(redis_url), key_prefix=f"spotitool:{namespace}:",
+                             default_timeout=default_timeout)
+    else:
+        import tempfile
+        from cachelib import FileSystemCache
+        base_dir = os.environ.get('SHARED_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'spotitool-cache')
+        backend = FileSystemCache(os.path.join(base_dir, namespace), threshold=threshold,
+                                  default_timeout=default_timeout)
+
+    _shared_backends[namespace] = backend
+    return backend
+
+
+class TwoTierCache:
+    """
+    Caché de dos niveles: LRU en proceso (rápido) + backend compartido entre workers.
+    Los aciertos del nivel compartido se promocionan al LRU local por PROMOTE_TTL
+    como mucho: el backend no dice cuánto le queda a la entrada, y con el TTL
+    completo una entrada corta (un error recordado 60 s) duraría horas en cada worker.
+    """
+    PROMOTE_TTL = 60
+
+    def __init__(self, namespace, maxsize=1000, ttl=3600, shared_threshold=5000):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.shared_threshold = shared_threshold
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._shared = None
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        if self._shared is None:
+            self._shared = get_shared_backend(self.namespace, self.shared_threshold, self.ttl)
+        return self._shared
+
+    def get(self, key, default=None):
+        value = self.local.get(key, TTLCache.MISSING)
+        if value is not TTLCache.MISSING:
+            return value
+        try:
+            value = self.shared.get(key)
+        except Exception as e:
+            log.warning("Shared cache error (%s): %s", self.namespace, e)
+            value = None
+        if value is None:
+            self.misses += 1
+            return default
+        self.shared_hits += 1
+        self.local.set(key, value, ttl=min(self.ttl, self.PROMOTE_TTL))
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.local.set(key, value, ttl=ttl)
+        try:
+            self.shared.set(key, value, timeout=ttl if ttl is not None else self.ttl)
+        except Exception as e:
+            log.warning("Shared cache error (%s): %s", self.namespace, e)
+
+    def delete(self, key):
+        self.local.delete(key)
+        try:
+            self.shared.delete(key)
+        except Exception as e:
+            log.warning("Shared cache error (%s): %s", self.namespace, e)
+
+    def stats(self):
+        local_hits = self.local.hits
+        total = local_hits + self.shared_hits + self.misses
+        return {
+            'local_size': len(self.local),
+            'local_hits': local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': round((local_hits + self.shared_hits) / total, 3) if total else 0.0
+        }
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import zlib
+
+import requests
+from urllib3.util.retry import Retry
+
+from cache_manager import TTLCache, TwoTierCache
+
+
+class ConditionalSession(requests.Session):
+    """
+    Sesión HTTP para spotipy con peticiones condicionales (ETag / If-None-Match).
+    Guarda cuerpo + ETag de las lecturas cacheables por usuario; si Spotify
+    responde 304, sirve la copia guardada. Compartida por todo el proceso:
+    el usuario sale del token de cada petición, no de la sesión.
+    """
+    # Reads whose payload is per user and that Spotify answers with ETags
+    CACHEABLE_RE = re.compile(r'^https://api\.spotify\.com/v1/(me/?|me/playlists|users/[^/]+/playlists'
+                              r'|playlists/[A-Za-z0-9]+(/tracks|/items)?)$')
+    ME_RE = re.compile(r'/v1/me/?$')
+    MAX_BODY = 512 * 1024
+
+    def __init__(self, retries=3, status_retries=3, backoff_factor=0.3,
+                 status_forcelist=(429, 500, 502, 503, 504)):
+        super().__init__()
+        # Same retry policy spotipy mounts on the sessions it builds itself
+        retry = Retry(total=retries, connect=None, read=False,
+                      allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+                      status=status_retries, backoff_factor=backoff_factor, status_forcelist=status_forcelist)
+        adapter = requests.adapters.HTTPAdapter(max_retries=retry, pool_maxsize=20)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+        self.store = TwoTierCache('spotify-etags', maxsize=500, ttl=24 * 3600, shared_threshold=5000)
+        self._token_users = TTLCache(maxsize=5000, ttl=3600)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.conditional = 0
+        self.not_modified = 0
+        self.bytes_received = 0
+        self.bytes_saved = 0
+        self.latency_saved = 0.0
+
+    def _user_key(self, headers):
+        """Usuario dueño del token (tras su primer /me), o el hash del token mientras tanto"""
+        token = (headers or {}).get('Authorization', '')
+        token_hash = hashlib.sha256(token.encode()).hexdigest()[:32]
+        return self._token_users.get(token_hash) or token_hash, token_hash
+
+    @staticmethod
+    def _cache_key(user_key, url, params):
+        query = '&'.join(f"{k}={v}" for k, v in sorted((params or {}).items()))
+        return f"{user_key}:{url}?{query}"
+
+    def request(self, method, url, params=None, headers=None, **kwargs):
+        # Paging URLs (sp.next) carry their query string inline
+        if method.upper() != 'GET' or not self.CACHEABLE_RE.match(url.split('?')[0]):
+            return super().request(method, url, params=params, headers=headers, **kwargs)
+
+        user_key, token_hash = self._user_key(headers)
+        key = self._cache_key(user_key, url, params)
+        stored = self.store.get(key)
+        headers = dict(headers or {})
+        if stored:
+            headers['If-None-Match'] = stored['etag']
+
+        start = time.perf_counter()
+        response = super().request(method, url, params=params, headers=headers, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.requests += 1
+            self.conditional += 1 if stored else 0
+            self.bytes_received += len(response.content or b'')
+
+        if response.status_code == 304 and stored:
+            body = zlib.decompress(stored['body'])
+            with self._lock:
+                self.not_modified += 1
+                self.bytes_saved += len(body)
+                self.latency_saved += max(0.0, stored['latency'] - elapsed)
+            response.status_code = 200
+            response.reason = 'OK (revalidated)'
+            response._content = body
+            response.encoding = 'utf-8'
+            response.headers['Content-Type'] = 'application/json; charset=utf-8'
+            return response
+
+        etag = response.headers.get('ETag')
+        if response.status_code == 200 and etag and len(response.content) <= self.MAX_BODY:
+            if self.ME_RE.search(url) and user_key == token_hash:
+                user_key = self._remember_user(token_hash, response) or user_key
+                key = self._cache_key(user_key, url, params)
+            self.store.set(key, {'etag': etag, 'body': zlib.compress(response.content, 1), 'latency': elapsed})
+        return response
+
+    def _remember_user(self, token_hash, response):
+        """Asocia el token a su usuario: las entradas sobreviven al refresco del token"""
+        try:
+            user_id = json.loads(response.content).get('id')
+        except ValueError:
+            return None
+        if not user_id:
+            return None
+        self._token_users.set(token_hash, f"user:{user_id}")
+        return f"user:{user_id}"
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'conditional': self.conditional,
+            'not_modified': self.not_modified,
+            'hit_rate': round(self.not_modified / self.requests, 3) if self.requests else None,
+            'kb_received': round(self.bytes_received / 1024, 1),
+            'kb_saved': round(self.bytes_saved / 1024, 1),
+            'latency_saved_ms': round(self.latency_saved * 1000, 1)
+        }
@@ -25,6 +25,16 @@ class Config:
     SPOTIPY_CLIENT_SECRET = os.environ.get('SPOTIPY_CLIENT_SECRET')
     SPOTIPY_REDIRECT_URI = os.environ.get('SPOTIPY_REDIRECT_URI')
 
+    # Jinja bytecode cache (compiled templates survive worker restarts)
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
+
+    # Shared cache tier for all gunicorn workers (Redis if REDIS_URL, else disk)
+    REDIS_URL = os.environ.get('REDIS_URL')
+    SHARED_CACHE_DIR = os.environ.get('SHARED_CACHE_DIR')
+
+    # Offline ISRC -> BPM index built with bpm_index.py (memory-mapped, shared by all workers)
+    BPM_INDEX_PATH = os.environ.get('BPM_INDEX_PATH')
+
     # Debug toggle
     DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
 
@@ -0,0 +1,235 @@
+import base64
+import io
+import random
+import re
+from urllib.parse import urlsplit
+
+import requests
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageFont, ImageOps
+
+from log_config import get_logger
+
+log = get_logger(__name__)
+
+COVER_SIZE = 640
+# Spotify rejects cover uploads whose base64 payload is over 256 KB
+MAX_COVER_B64_BYTES = 256 * 1024
+MIN_QUALITY, MAX_QUALITY = 30, 92
+
+# Client images are decoded in full: refuse anything bigger than a 4096 x 4096 image
+MAX_IMAGE_PIXELS = 4096 * 4096
+MAX_THUMBNAIL_BYTES = 2 * 1024 * 1024
+
+# Collage URLs come from the client: only Spotify's image CDN is fetched (no SSRF)
+_COVER_HOSTS = {'i.scdn.co', 'mosaic.scdn.co'}
+_COVER_HOST_RE = re.compile(r'^image-cdn-[a-z0-9-]+\.spotifycdn\.com$')
+
+# i.scdn.co album art: 640px / 300px / 64px variants share the hash after this prefix
+_SCDN_SIZE_RE = re.compile(r'(ab67616d0000)(b273|1e02|4851)')
+
+
+def thumbnail_url(url, size=300):
+    """Variante reducida de una portada de i.scdn.co (si el formato es conocido)"""
+    code = {640: 'b273', 300: '1e02', 64: '4851'}.get(size, '1e02')
+    return _SCDN_SIZE_RE.sub(lambda m: m.group(1) + code, url or '')
+
+
+def is_cover_url(url):
+    """True si es una imagen https del CDN de Spotify (las únicas que el servidor descarga)"""
+    try:
+        parts = urlsplit(url or '')
+        host, port = parts.hostname, parts.port
+    except ValueError:
+        return False
+    if parts.scheme != 'https' or not host or port not in (None, 443) or parts.username or parts.password:
+        return False
+    return host in _COVER_HOSTS or bool(_COVER_HOST_RE.match(host))
+
+
+def open_image(data):
+    """Abre una imagen comprobando antes sus dimensiones (evita "decompression bombs")"""
+    img = Image.open(io.BytesIO(data))
+    if img.width * img.height > MAX_IMAGE_PIXELS:
+        raise ValueError(f"Imagen demasiado grande ({img.width}x{img.height})")
+    return img
+
+
+def b64_size(n_bytes):
+    return 4 * ((n_bytes + 2) // 3)
+
+
+def encode_jpeg(img, max_b64_bytes=MAX_COVER_B64_BYTES):
+    """
+    Codifica en JPEG con la mayor calidad cuyo base64 cabe en el límite
+    (búsqueda binaria sobre la calidad). Si ni la mínima cabe, reduce tamaño;
+    ValueError si ni siquiera a 64 px cabe.
+    """
+    img = img.convert('RGB')
+    while True:
+        best = None
+        lo, hi = MIN_QUALITY, MAX_QUALITY
+        while lo <= hi:
+            q = (lo + hi) // 2
+            buf = io.BytesIO()
+            img.save(buf, 'JPEG', quality=q, optimize=True, progressive=True)
+            data = buf.getvalue()
+            if b64_size(len(data)) <= max_b64_bytes:
+                best = data
+                lo = q + 1
+            else:
+                hi = q - 1
+        if best is not None:
+            return best
+        if img.width <= 64:
+            raise ValueError("La portada no cabe en el límite de tamaño de Spotify")
+        img = img.resize((img.width * 3 // 4, img.height * 3 // 4), Image.LANCZOS)
+
+
+def _font(size):
+    for name in ('DejaVuSans-Bold.ttf', 'Arial Bold.ttf', 'arialbd.ttf'):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+def _text_overlay(img, text):
+    """Oscurece ligeramente y centra el título (equivalente al overlay del canvas)"""
+    text = (text or '').strip()
+    if not text:
+        return img
+    size = img.width
+    img = Image.blend(img, Image.new('RGB', img.size, (0, 0, 0)), 0.3)
+
+    font_size = 80 * size // COVER_SIZE
+    font = _font(font_size)
+    measure = ImageDraw.Draw(img)
+    width = measure.textlength(text, font=font)
+    max_width = size * 580 // COVER_SIZE
+    if width > max_width:
+        font = _font(max(12, int(font_size * max_width / width)))
+
+    shadow = Image.new('L', img.size, 0)
+    ImageDraw.Draw(shadow).text((size // 2, size // 2 + 10), text, font=font, fill=200, anchor='mm')
+    img.paste((0, 0, 0), mask=shadow.filter(ImageFilter.GaussianBlur(15)))
+    ImageDraw.Draw(img).text((size // 2, size // 2), text, font=font, fill='white', anchor='mm')
+    return img
+
+
+def render_collage(images, text='', size=COVER_SIZE):
+    """Collage 1-4 portadas (misma disposición que el generador del navegador). Devuelve JPEG"""
+    tiles = []
+    for data in images[:4]:
+        try:
+            tiles.append(open_image(data).convert('RGB'))
+        except Exception:
+            continue
+    if not tiles:
+        return render_gradient(text=text, size=size)
+
+    half = size // 2
+    layouts = {
+        1: [(0, 0, size, size)],
+        2: [(0, 0, half, size), (half, 0, half, size)],
+        3: [(0, 0, half, size), (half, 0, half, half), (half, half, half, half)],
+        4: [(0, 0, half, half), (half, 0, half, half), (0, half, half, half), (half, half, half, half)],
+    }
+    canvas = Image.new('RGB', (size, size), (18, 18, 18))
+    for tile, (x, y, w, h) in zip(tiles, layouts[len(tiles)]):
+        canvas.paste(ImageOps.fit(tile, (w, h), Image.LANCZOS), (x, y))
+    return encode_jpeg(_text_overlay(canvas, text))
+
+
+def render_gradient(text='', size=COVER_SIZE, hue=None, solid=None):
+    """Degradado diagonal de dos tonos (o color plano si `solid`). Devuelve JPEG"""
+    if solid:
+        img = Image.new('RGB', (size, size), solid)
+    else:
+        h1 = random.randint(0, 359) if hue is None else int(hue) % 360
+        h2 = (h1 + 40 + random.randint(0, 100)) % 360
+        c1 = Image.new('HSV', (1, 1), (h1 * 255 // 360, 204, 230)).convert('RGB').getpixel((0, 0))
+        c2 = Image.new('HSV', (1, 1), (h2 * 255 // 360, 204, 150)).convert('RGB').getpixel((0, 0))
+        # Máscara diagonal: 0 en la esquina superior izquierda, 255 en la inferior derecha
+        vertical = Image.linear_gradient('L').resize((size, size))
+        ramp = ImageChops.add(vertical, vertical.transpose(Image.Transpose.TRANSPOSE), scale=2)
+        img = Image.composite(Image.new('RGB', (size, size), c2), Image.new('RGB', (size, size), c1), ramp)
+    return encode_jpeg(_text_overlay(img, text))
+
+
+def recompress(image_b64):
+    """Recodifica una imagen (base64 del cliente) como JPEG cuadrado dentro del límite"""
+    img = open_image(base64.b64decode(image_b64)).convert('RGB')
+    if img.width > COVER_SIZE or img.height > COVER_SIZE:
+        img = ImageOps.fit(img, (COVER_SIZE, COVER_SIZE), Image.LANCZOS)
+    return encode_jpeg(img)
+
+
+class CoverEngine:
+    """
+    Genera portadas en el servidor: descarga miniaturas (300px) en hilos y
+    renderiza/codifica en un pool de procesos para no bloquear el worker web.
+    """
+    _pool = None
+
+    def __init__(self, max_workers=2, timeout=20):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.rendered = 0
+        self.bytes_out = 0
+
+    @property
+    def pool(self):
+        if CoverEngine._pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            CoverEngine._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return CoverEngine._pool
+
+    def fetch_thumbnails(self, urls):
+        from concurrent.futures import ThreadPoolExecutor
+
+        def fetch(url):
+            try:
+                # No redirects: a CDN URL must not bounce the server somewhere else
+                with requests.get(url, timeout=5, stream=True, allow_redirects=False) as resp:
+                    if resp.status_code != 200:
+                        return None
+                    data = resp.raw.read(MAX_THUMBNAIL_BYTES + 1, decode_content=True)
+                    return data if len(data) <= MAX_THUMBNAIL_BYTES else None
+            except Exception as e:
+                log.warning("Cover thumbnail error: %s", e, extra={'upstream': 'spotify'})
+                return None
+
+        urls = [thumbnail_url(u) for u in urls if isinstance(u, str) and is_cover_url(u)][:4]
+        if not urls:
+            return []
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            return [data for data in executor.map(fetch, urls) if data]
+
+    def _run(self, fn, *args):
+        data = self.pool.submit(fn, *args).result(timeout=self.timeout)
+        self.rendered += 1
+        self.bytes_out += len(data)
+        return data
+
+    def render(self, mode='collage', image_urls=None, text='', hue=None):
+        """Devuelve el JPEG (bytes) de la portada pedida"""
+        if mode == 'collage':
+            return self._run(render_collage, self.fetch_thumbnails(image_urls or []), text)
+        if mode == 'minimal':
+            return self._run(render_gradient, text, COVER_SIZE, None, (13, 13, 13))
+        return self._run(render_gradient, text, COVER_SIZE, hue)
+
+    def render_b64(self, *args, **kwargs):
+        return base64.b64encode(self.render(*args, **kwargs)).decode('ascii')
+
+    def compress_b64(self, image_b64):
+        """Recomprime una imagen del cliente para que quepa en el límite de Spotify"""
+        if "," in image_b64:
+            image_b64 = image_b64.split(",")[1]
+        if len(image_b64) <= MAX_COVER_B64_BYTES and image_b64.startswith('/9j/'):
+            return image_b64  # Ya es un JPEG que cabe
+        return base64.b64encode(self._run(recompress, image_b64)).decode('ascii')
+
+    def stats(self):
+        return {'rendered': self.rendered, 'bytes_out': self.bytes_out}
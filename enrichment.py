@@ -0,0 +1,272 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import requests
+
+from cache_manager import TwoTierCache
+from log_config import get_logger
+
+log = get_logger(__name__)
+
+
+class SourceUnavailable(Exception):
+    """La fuente respondió con error (cuota, 5xx, JSON inválido...)"""
+
+
+class EnrichmentSource:
+    """
+    Fuente de BPM. Las subclases implementan `fetch(artist, name)`, que devuelve
+    el BPM (0 si no lo encuentra, None si no puede opinar) y lanza excepción si la fuente falla.
+    Lleva latencias, tasa de acierto y un circuit breaker por fuente.
+    """
+    name = 'source'
+    FAILURE_THRESHOLD = 5       # Fallos seguidos para abrir el circuito
+    COOLDOWN = 60               # Segundos con el circuito abierto
+    DEFAULT_P90 = 1.0           # Hasta tener muestras suficientes
+    MIN_SAMPLES = 10
+
+    def __init__(self):
+        self.latencies = deque(maxlen=200)
+        self.calls = 0
+        self.hits = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.open_until = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def fetch(self, artist, name, duration_ms=None):
+        raise NotImplementedError
+
+    def available(self):
+        """Circuito cerrado, o semiabierto tras el cooldown y sin una prueba en curso"""
+        return time.time() >= self.open_until and not self._probing
+
+    def _admit(self):
+        """Reserva la llamada: con el circuito semiabierto solo pasa una (la prueba)"""
+        with self._lock:
+            if not self.open_until:
+                return True
+            if time.time() < self.open_until or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def call(self, artist, name, duration_ms=None):
+        """BPM, 0 si la fuente no lo tiene, o None si la fuente ha fallado (o no se ha llamado)"""
+        if not self._admit():
+            return None
+        start = time.perf_counter()
+        try:
+            bpm = self.fetch(artist, name, duration_ms)
+        except Exception as e:
+            with self._lock:
+                self._probing = False
+                self.calls += 1
+                self.errors += 1
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= self.FAILURE_THRESHOLD:
+                    self.open_until = time.time() + self.COOLDOWN
+                    log.warning("Enrichment: circuit open for %s (%s)", self.name, e, extra={'upstream': self.name})
+            return None
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._probing = False
+            self.calls += 1
+            self.latencies.append(elapsed)
+            self.consecutive_failures = 0
+            self.open_until = 0
+            if bpm:
+                self.hits += 1
+        return bpm
+
+    def p90(self):
+        if len(self.latencies) < self.MIN_SAMPLES:
+            return self.DEFAULT_P90
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.9) - 1]
+
+    def hit_rate(self):
+        return self.hits / self.calls if self.calls else None
+
+    def stats(self):
+        ordered = sorted(self.latencies)
+        return {
+            'calls': self.calls,
+            'hits': self.hits,
+            'errors': self.errors,
+            'hit_rate': round(self.hit_rate(), 3) if self.calls else None,
+            'p50_ms': round(ordered[len(ordered) // 2] * 1000, 1) if ordered else None,
+            'p90_ms': round(self.p90() * 1000, 1),
+            'circuit_open': time.time() < self.open_until
+        }
+
+
+class DeezerSource(EnrichmentSource):
+    """BPM de Deezer (búsqueda + detalle), vía SpotifyManager._deezer_bpm_lookup"""
+    name = 'deezer'
+
+    def __init__(self, manager):
+        super().__init__()
+        self.manager = manager
+
+    def fetch(self, artist, name, duration_ms=None):
+        return self.manager._deezer_bpm_lookup(artist, name, duration_ms)
+
+
+class AudioDBSource(EnrichmentSource):
+    """BPM de TheAudioDB (clave pública de pruebas '2'; ver test_audiodb.py)"""
+    name = 'audiodb'
+    URL = "https://www.theaudiodb.com/api/v1/json/2/searchtrack.php"
+
+    def __init__(self):
+        super().__init__()
+        self.session = requests.Session()
+
+    def fetch(self, artist, name, duration_ms=None):
+        resp = self.session.get(self.URL, params={'s': artist, 't': name}, timeout=3.0)
+        if resp.status_code != 200:
+            raise SourceUnavailable(f"HTTP {resp.status_code}")
+        for t in resp.json().get('track') or []:
+            bpm = t.get('intBPM')
+            if bpm and float(bpm) > 0:
+                return int(float(bpm))
+        return 0
+
+
+class EnrichmentPipeline:
+    """
+    Consulta fuentes de BPM ordenadas por tasa de acierto y latencia.
+    Si la primaria tarda más que su p90, lanza una petición "hedged" a la
+    siguiente y se queda con la primera respuesta válida. Resultados en caché.
+    """
+    HIT_TTL = 7 * 24 * 3600
+    MISS_TTL = 3600
+
+    def __init__(self, sources, max_workers=32, index=None):
+        self.sources = list(sources)
+        self.index = index  # Offline ISRC index (bpm_index.BPMIndex), checked before anything else
+        self.cache = TwoTierCache('bpm', maxsize=20000, ttl=self.HIT_TTL, shared_threshold=50000)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.coalesced = 0
+        self._inflight = {}  # cache key -> Future of the lookup in progress
+        self._lock = threading.Lock()
+
+    def add_source(self, source, first=False):
+        if first:
+            self.sources.insert(0, source)
+        else:
+            self.sources.append(source)
+
+    def ranked(self):
+        """Fuentes disponibles; con muestras suficientes, las que más aciertan (y antes) primero"""
+        available = [s for s in self.sources if s.available()]
+
+        def score(source):
+            if source.calls < source.MIN_SAMPLES:
+                return (0, self.sources.index(source))  # Sin datos: orden de registro
+            return (-source.hit_rate(), source.p90())
+        return sorted(available, key=score)
+
+    @staticmethod
+    def cache_key(artist, name):
+        return f"{(artist or '').casefold().strip()}|{(name or '').casefold().strip()}"
+
+    def _offline(self, isrc):
+        """BPM del índice offline (0 si no hay índice, ISRC o entrada)"""
+        if not isrc or self.index is None:
+            return 0
+        return self.index.bpm(isrc)
+
+    def peek(self, artist, name, isrc=None):
+        """Valor en caché (o en el índice offline) sin consultar ninguna fuente (None si no está)"""
+        bpm = self._offline(isrc)
+        if bpm:
+            return bpm
+        if not artist or not name:
+            return None
+        return self.cache.get(self.cache_key(artist, name))
+
+    def lookup(self, artist, name, duration_ms=None, isrc=None):
+        """
+        BPM de una pista (0 si ninguna fuente lo tiene). La duración ayuda a elegir
+        candidato; con `isrc`, el índice offline responde sin red.
+        """
+        bpm = self._offline(isrc)
+        if bpm:
+            return bpm
+        if not artist or not name:
+            return 0
+        key = self.cache_key(artist, name)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        # Single flight: concurrent lookups of the same track wait for the one in progress
+        with self._lock:
+            inflight = self._inflight.get(key)
+            owner = inflight is None
+            if owner:
+                inflight = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return inflight.result()
+
+        try:
+            bpm, answered = self._lookup_hedged(artist, name, duration_ms)
+            if answered:
+                # Solo cacheamos "no encontrado" si alguna fuente respondió de verdad
+                self.cache.set(key, bpm, ttl=self.HIT_TTL if bpm else self.MISS_TTL)
+            inflight.set_result(bpm)
+            return bpm
+        except BaseException as e:
+            inflight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _lookup_hedged(self, artist, name, duration_ms=None):
+        queue = self.ranked()
+        pending = {}
+        hedged = set()
+        answered = False
+        while queue or pending:
+            if queue:
+                source = queue.pop(0)
+                future = self.executor.submit(source.call, artist, name, duration_ms)
+                if pending:
+                    hedged.add(future)
+                    with self._lock:
+                        self.hedges += 1
+                pending[future] = source
+
+            # Esperar a la fuente más reciente hasta su p90; si no contesta, hedge
+            timeout = source.p90() if queue else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                bpm = future.result()
+                answered = answered or bpm is not None
+                if bpm:
+                    if future in hedged:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return bpm, True
+        return 0, answered
+
+    def stats(self):
+        return {
+            'sources': {s.name: s.stats() for s in self.sources},
+            'order': [s.name for s in self.ranked()],
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'coalesced': self.coalesced,
+            'cache': self.cache.stats(),
+            'offline_index': self.index.stats() if self.index is not None else None
+        }
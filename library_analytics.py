@@ -0,0 +1,387 @@
+"""
+Analítica de toda la biblioteca de un usuario: distribución de BPM, tonalidades
+(nombre y rueda Camelot), perfil de energía y comparación entre playlists.
+
+Las pistas enriquecidas de cada playlist (su VibeAggregate, más la tonalidad
+del índice offline) se guardan como columnas NumPy por snapshot; el análisis
+concatena las columnas y lo calcula todo en una pasada vectorizada. El
+resultado se cachea por el conjunto de snapshot_ids: mientras ninguna playlist
+cambie, la siguiente petición no toca ni una pista.
+
+Una biblioteca fría (cientos de playlists sin columnas) se carga en un pool de
+fondo: la petición espera como mucho DEADLINE segundos y devuelve lo que haya,
+con `pending` > 0, sin cachearlo; las siguientes recogen las columnas ya listas.
+"""
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+
+from bpm_index import MINOR, NO_KEY, NOTES, encode_key
+from cache_manager import TwoTierCache
+from log_config import get_logger
+from vibe import VibeAggregate
+
+log = get_logger(__name__)
+
+KEYS = NOTES + [note + 'm' for note in NOTES]  # Key index: pitch class, +12 for minor
+NO_VALUE = -1
+PERCENTILES = (10, 25, 50, 75, 90)
+FEATURE_STEP = 10  # Energy/danceability histogram bins (0-100)
+
+
+def camelot(key_index):
+    """Código Camelot ('8B', '8A'...) de un índice de KEYS"""
+    pitch, minor = key_index % 12, key_index >= 12
+    # Majors walk the circle of fifths from C = 8B; a minor shares the number of its relative major
+    number = (7 * ((pitch + 3) % 12 if minor else pitch) + 7) % 12 + 1
+    return f"{number}{'A' if minor else 'B'}"
+
+
+CAMELOT = [camelot(i) for i in range(len(KEYS))]
+CAMELOT_WHEEL = [f"{n}{mode}" for n in range(1, 13) for mode in 'AB']
+
+
+def key_index(name):
+    """Índice en KEYS de un nombre de tonalidad ('F#', 'Am'...), NO_VALUE si se desconoce"""
+    code = encode_key(name)
+    if code == NO_KEY:
+        return NO_VALUE
+    return (code & 0x0F) + (12 if code & MINOR else 0)
+
+
+def track_hashes(track_ids):
+    """
+    Ids de pista como enteros de 64 bits (FNV-1a sobre los bytes, vectorizado),
+    estables entre procesos: ordenar enteros es mucho más rápido que cadenas.
+    """
+    raw = np.array([str(t).encode() for t in track_ids] or [b''], dtype=bytes)
+    width = max(raw.dtype.itemsize, 1)
+    data = raw.view(np.uint8).reshape(len(raw), width).astype(np.uint64)
+    hashes = np.full(len(raw), 0xcbf29ce484222325, dtype=np.uint64)
+    for column in data.T:  # Shorter ids are NUL-padded by NumPy
+        hashes = (hashes ^ column) * np.uint64(0x100000001b3)
+    return hashes[:len(track_ids)]
+
+
+def playlist_columns(agg, keys=None):
+    """
+    Columnas NumPy de una playlist a partir de su VibeAggregate (una fila por
+    pista distinta): id (track_hashes), apariciones, BPM, tonalidad, energía y
+    bailabilidad. `keys` ({track_id: índice en KEYS}) es opcional; -1 marca lo desconocido.
+    """
+    keys = keys or {}
+    ids, rows = list(agg.members), list(agg.members.values())
+    count, bpm, energy, dance = zip(*rows) if rows else ((), (), (), ())
+    return {
+        'ids': track_hashes(ids),
+        'count': np.array(count, dtype=np.int32),
+        'bpm': np.array([b or 0 for b in bpm], dtype=np.float32),
+        'key': np.array([keys.get(i, NO_VALUE) for i in ids], dtype=np.int8),
+        'energy': np.array([NO_VALUE if e is None else e for e in energy], dtype=np.int8),
+        'dance': np.array([NO_VALUE if d is None else d for d in dance], dtype=np.int8),
+    }
+
+
+def _grouped_percentiles(values, groups, n_groups, percentiles=PERCENTILES):
+    """
+    Percentiles (rango más cercano, por debajo) de `values` dentro de cada grupo:
+    una sola ordenación por (grupo, valor). Matriz (n_groups, len(percentiles)), 0 en grupos vacíos.
+    """
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    sizes = np.bincount(groups, minlength=n_groups)
+    starts = np.cumsum(sizes) - sizes
+    ranks = np.floor(np.outer(np.maximum(sizes - 1, 0), np.asarray(percentiles) / 100)).astype(np.int64)
+    result = np.zeros((n_groups, len(percentiles)), dtype=np.float64)
+    present = sizes > 0
+    if present.any():
+        result[present] = ordered[starts[present, None] + ranks[present]]
+    return result
+
+
+def _histogram(values, low, high, step):
+    counts = np.bincount(((np.clip(values, low, high - 1) - low) // step).astype(np.int64),
+                         minlength=(high - low) // step)
+    return {'min': low, 'step': step, 'counts': counts.tolist()}
+
+
+def _derived_features(bpm):
+    """Energía y bailabilidad estimadas desde el tempo, como vibe.vibe_from_bpm pero por pista"""
+    energy = np.clip((bpm * 0.6).astype(np.int64), 40, 95)
+    dance = np.clip(100 - np.abs(120 - bpm.astype(np.int64)), 45, 90)
+    return energy, dance
+
+
+def _effective_features(bpm, energy, dance):
+    """Rasgos del analizador donde se midieron; si no, estimados del tempo (desconocidos sin BPM)"""
+    derived_energy, derived_dance = _derived_features(bpm)
+    has_bpm = bpm > 0
+    return (np.where(energy >= 0, energy, np.where(has_bpm, derived_energy, NO_VALUE)),
+            np.where(dance >= 0, dance, np.where(has_bpm, derived_dance, NO_VALUE)))
+
+
+def analyze(playlists):
+    """
+    Análisis vectorizado. `playlists`: [(meta, columnas)] con meta {'id', 'name'}.
+    La distribución de la biblioteca cuenta cada pista una vez aunque esté en
+    varias playlists (con lo que se sepa de ella en cualquiera); la comparación
+    usa las pistas distintas de cada playlist.
+    """
+    n_playlists = len(playlists)
+    columns = [cols for _, cols in playlists]
+    sizes = np.array([len(cols['ids']) for cols in columns], dtype=np.int64)
+    pidx = np.repeat(np.arange(n_playlists), sizes)
+    if columns:
+        ids, bpm, key, energy, dance = (np.concatenate([cols[name] for cols in columns])
+                                        for name in ('ids', 'bpm', 'key', 'energy', 'dance'))
+    else:
+        ids = np.empty(0, dtype=np.uint64)
+        bpm = np.empty(0, dtype=np.float32)
+        key, energy, dance = (np.empty(0, dtype=np.int8) for _ in range(3))
+    bpm = bpm.astype(np.float64)
+    key, energy, dance = key.astype(np.int64), energy.astype(np.int64), dance.astype(np.int64)
+
+    # Library: one row per track id, keeping what any of its playlists knows about it
+    unique_ids, inverse = np.unique(ids, return_inverse=True)
+
+    def per_track(values):
+        merged = np.full(len(unique_ids), NO_VALUE, dtype=values.dtype)
+        np.maximum.at(merged, inverse, values)
+        return merged
+
+    lib_bpm, lib_key, lib_energy, lib_dance = (per_track(v) for v in (bpm, key, energy, dance))
+    lib_measured = int((lib_energy >= 0).sum())
+    lib_energy, lib_dance = _effective_features(lib_bpm, lib_energy, lib_dance)
+    lib_bpm, lib_key = lib_bpm[lib_bpm > 0], lib_key[lib_key >= 0]
+    lib_energy, lib_dance = lib_energy[lib_energy >= 0], lib_dance[lib_dance >= 0]
+    key_counts = np.bincount(lib_key, minlength=len(KEYS))
+    camelot_counts = dict.fromkeys(CAMELOT_WHEEL, 0)
+    for i, count in enumerate(key_counts.tolist()):
+        camelot_counts[CAMELOT[i]] += count
+    lib_percentiles = _grouped_percentiles(lib_bpm, np.zeros(len(lib_bpm), dtype=np.int64), 1)[0]
+
+    result = {
+        'playlists': n_playlists,
+        'tracks': len(unique_ids),
+        'with_bpm': int(len(lib_bpm)),
+        'with_key': int(len(lib_key)),
+        'with_features': lib_measured,
+        'bpm': {
+            'mean': round(float(lib_bpm.mean()), 1) if len(lib_bpm) else 0,
+            'percentiles': {f"p{p}": int(v) for p, v in zip(PERCENTILES, lib_percentiles)},
+            'histogram': _histogram(lib_bpm, VibeAggregate.HIST_MIN, VibeAggregate.HIST_MAX, VibeAggregate.HIST_STEP)
+        },
+        'energy': {
+            'mean': round(float(lib_energy.mean())) if len(lib_energy) else 0,
+            'histogram': _histogram(lib_energy, 0, 100, FEATURE_STEP)
+        },
+        'danceability': {
+            'mean': round(float(lib_dance.mean())) if len(lib_dance) else 0,
+            'histogram': _histogram(lib_dance, 0, 100, FEATURE_STEP)
+        },
+        'keys': dict(zip(KEYS, key_counts.tolist())),
+        'camelot': camelot_counts,
+    }
+
+    # Per playlist: grouped sums/counts and percentiles over the concatenated columns
+    has_bpm = bpm > 0
+    energy, dance = _effective_features(bpm, energy, dance)
+    bpm_n = np.bincount(pidx[has_bpm], minlength=n_playlists)
+    bpm_sum = np.bincount(pidx[has_bpm], weights=bpm[has_bpm], minlength=n_playlists)
+    pl_percentiles = _grouped_percentiles(bpm[has_bpm], pidx[has_bpm], n_playlists)
+    energy_n = np.bincount(pidx[energy >= 0], minlength=n_playlists)
+    energy_sum = np.bincount(pidx[energy >= 0], weights=energy[energy >= 0], minlength=n_playlists)
+    dance_n = np.bincount(pidx[dance >= 0], minlength=n_playlists)
+    dance_sum = np.bincount(pidx[dance >= 0], weights=dance[dance >= 0], minlength=n_playlists)
+    known_key = key >= 0
+    key_matrix = np.bincount(pidx[known_key] * len(KEYS) + key[known_key],
+                             minlength=n_playlists * len(KEYS)).reshape(n_playlists, len(KEYS))
+    top_key = key_matrix.argmax(axis=1)
+    has_key = key_matrix.max(axis=1) > 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bpm_mean = np.where(bpm_n > 0, bpm_sum / bpm_n, 0)
+        energy_mean = np.where(energy_n > 0, energy_sum / energy_n, 0)
+        dance_mean = np.where(dance_n > 0, dance_sum / dance_n, 0)
+    median = result['bpm']['percentiles']['p50']
+    p10, p50, p90 = (PERCENTILES.index(p) for p in (10, 50, 90))
+
+    per_playlist = []
+    for i, (meta, cols) in enumerate(playlists):
+        per_playlist.append({
+            'id': meta['id'],
+            'name': meta.get('name'),
+            'tracks': int(sizes[i]),
+            'with_bpm': int(bpm_n[i]),
+            'bpm_mean': round(float(bpm_mean[i]), 1),
+            'bpm_p10': int(pl_percentiles[i, p10]),
+            'bpm_p50': int(pl_percentiles[i, p50]),
+            'bpm_p90': int(pl_percentiles[i, p90]),
+            'bpm_vs_library': int(pl_percentiles[i, p50] - median) if bpm_n[i] and median else 0,
+            'energy': round(float(energy_mean[i])),
+            'danceability': round(float(dance_mean[i])),
+            'top_key': KEYS[top_key[i]] if has_key[i] else None,
+            'top_camelot': CAMELOT[top_key[i]] if has_key[i] else None,
+        })
+    result['per_playlist'] = per_playlist
+    return result
+
+
+class LibraryAnalytics:
+    """
+    Analítica de biblioteca por usuario. Dos cachés en el mismo espacio:
+    columnas de cada playlist por snapshot (solo se recargan las que cambian
+    o cuyo agregado de vibra se enriqueció) y el resultado completo por el
+    conjunto de snapshots de la biblioteca.
+    """
+    TTL = 1800          # Enrichment keeps arriving for the same snapshots: recompute now and then
+    LOAD_WORKERS = 8    # Playlists loaded at once, for all users (each one pages with its own pool)
+    DEADLINE = 15       # Seconds a request waits for cold playlists (gunicorn kills a worker at 30)
+    _loader = None
+
+    def __init__(self):
+        self.cache = TwoTierCache('library-analytics', maxsize=2000, ttl=self.TTL, shared_threshold=5000)
+        self._loading = {}  # (playlist_id, snapshot_id) -> Future, only while the load runs
+        self._loading_guard = threading.Lock()
+        self.computed = 0
+        self.cached = 0
+        self.partial = 0
+        self.playlists_loaded = 0
+        self.last_ms = 0.0
+
+    @staticmethod
+    def library_digest(playlists):
+        """Huella del conjunto de (playlist, snapshot): cambia si cualquier playlist cambia"""
+        pairs = sorted(f"{p['id']}:{p.get('snapshot_id')}" for p in playlists if p)
+        return hashlib.sha1('|'.join(pairs).encode()).hexdigest()
+
+    @staticmethod
+    def aggregate_version(agg):
+        """Huella de los totales del agregado: cambia al añadir BPM o rasgos en el mismo snapshot"""
+        return (agg.tracks, agg.bpm_tracks, agg.bpm_sum, agg.feature_tracks, agg.energy_sum, agg.dance_sum)
+
+    def cached_columns(self, manager, playlist):
+        """Columnas cacheadas si siguen al día con el agregado de vibra (None si hay que cargarlas)"""
+        playlist_id, snapshot_id = playlist['id'], playlist.get('snapshot_id')
+        entry = self.cache.get(f"cols:{playlist_id}:{snapshot_id}")  # (aggregate version, columns)
+        if entry is None:
+            return None
+        agg = manager.playlist_vibe(playlist_id, snapshot_id, build=False)
+        return entry[1] if agg is None or entry[0] == self.aggregate_version(agg) else None
+
+    def load_columns(self, manager, playlist, refresh=False):
+        """
+        Columnas de una playlist, cacheadas por snapshot y reconstruidas si su
+        agregado de vibra cambió desde entonces. Con refresh=True se ignoran y
+        se incorporan al agregado los BPM que hayan llegado a la caché.
+        """
+        playlist_id, snapshot_id = playlist['id'], playlist.get('snapshot_id')
+        if not refresh:
+            cols = self.cached_columns(manager, playlist)
+            if cols is not None:
+                return cols
+
+        agg = manager.playlist_vibe(playlist_id, snapshot_id, build=False)
+        # A failed fetch raises: the playlist stays pending instead of being stored as empty
+        tracks = manager.get_playlist_tracks(playlist_id, snapshot_id=snapshot_id, raise_errors=True)
+        if agg is None:
+            for t in tracks:
+                t['bpm'] = manager.cached_bpm(t['artist'], t['name'], t.get('isrc')) or 0
+            agg = manager.playlist_vibe(playlist_id, snapshot_id, tracks)
+        elif refresh:
+            found = {}
+            for t in tracks:
+                if not agg.bpm_of(t['id']):
+                    bpm = manager.cached_bpm(t['artist'], t['name'], t.get('isrc'))
+                    if bpm:
+                        found[t['id']] = bpm
+            if found:
+                def _enrich(a):
+                    for track_id, bpm in found.items():
+                        a.enrich(track_id, bpm=bpm)
+                agg = manager.update_playlist_vibe(playlist_id, _enrich) or agg
+        keys = {}
+        for t in tracks:
+            name = manager.cached_key(t.get('isrc'))
+            if name:
+                keys[t['id']] = key_index(name)
+        cols = playlist_columns(agg, keys)
+        self.cache.set(f"cols:{playlist_id}:{snapshot_id}", (self.aggregate_version(agg), cols))
+        self.playlists_loaded += 1
+        return cols
+
+    def load_columns_later(self, manager, playlist, refresh=False):
+        """load_columns en el pool de fondo (Future); una sola carga a la vez por playlist y snapshot"""
+        key = (playlist['id'], playlist.get('snapshot_id'))
+        with self._loading_guard:
+            future = self._loading.get(key)
+            started = future is None
+            if started:
+                if LibraryAnalytics._loader is None:
+                    LibraryAnalytics._loader = ThreadPoolExecutor(max_workers=self.LOAD_WORKERS)
+                future = self._loading[key] = LibraryAnalytics._loader.submit(self.load_columns, manager,
+                                                                              playlist, refresh)
+        if started:  # Outside the guard: the callback runs right here if the load already finished
+            future.add_done_callback(lambda f: self._loaded(key, f))
+        return future
+
+    def _loaded(self, key, future):
+        with self._loading_guard:
+            if self._loading.get(key) is future:
+                del self._loading[key]
+
+    def library(self, manager, refresh=False):
+        """
+        Análisis de todas las playlists del usuario (cacheado por sus snapshots).
+        Si alguna no termina de cargar antes de DEADLINE, el resultado es parcial:
+        `pending` cuenta las que faltan y no se cachea.
+        """
+        user_id = (manager.user or {}).get('id')
+        playlists = [p for p in manager.get_user_playlists() if p]
+        cache_key = f"lib:{user_id}:{self.library_digest(playlists)}"
+        if not refresh:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.cached += 1
+                return cached
+
+        # Concurrent requests for the same library share the loads; only the (cheap) analysis is repeated
+        start = time.perf_counter()
+        columns = [None if refresh else self.cached_columns(manager, p) for p in playlists]
+        futures = {i: self.load_columns_later(manager, p, refresh)
+                   for i, (p, cols) in enumerate(zip(playlists, columns)) if cols is None}
+        wait(futures.values(), timeout=self.DEADLINE)
+        for i, future in futures.items():
+            if not future.done():
+                continue
+            try:
+                columns[i] = future.result()
+            except Exception as e:  # Left pending: the next request tries it again
+                log.warning("Error loading playlist %s: %s", playlists[i]['id'], e,
+                            extra={'upstream': 'spotify', 'playlist_id': playlists[i]['id']})
+
+        result = analyze([({'id': p['id'], 'name': p.get('name')}, cols)
+                          for p, cols in zip(playlists, columns) if cols is not None])
+        self.last_ms = round((time.perf_counter() - start) * 1000, 1)
+        result['computed_ms'] = self.last_ms
+        result['pending'] = sum(1 for cols in columns if cols is None)
+        if result['pending']:
+            self.partial += 1
+        else:
+            self.cache.set(cache_key, result)
+            self.computed += 1
+        return result
+
+    def stats(self):
+        return {
+            'computed': self.computed,
+            'cached': self.cached,
+            'partial': self.partial,
+            'loading': len(self._loading),
+            'playlists_loaded': self.playlists_loaded,
+            'last_ms': self.last_ms,
+            'cache': self.cache.stats()
+        }
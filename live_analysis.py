@@ -0,0 +1,140 @@
+from collections import Counter
+
+from log_config import get_logger
+from vibe import vibe_from_bpm
+
+log = get_logger(__name__)
+
+
+class LiveAnalysis:
+    """
+    Análisis incremental para /analyze-live.
+    El estado se indexa por el contenido de cada línea: en cada llamada solo se
+    buscan y enriquecen las líneas nuevas o modificadas; el resto se reutiliza.
+    """
+    MAX_LINES = 200
+
+    def __init__(self, state=None):
+        # {line: {'id', 'artist_ids', 'bpm', 'genres'}} ('id' None if no match)
+        self.state = dict(state or {})
+
+    @staticmethod
+    def split_lines(songs_raw):
+        lines = []
+        seen = set()
+        for s in (songs_raw or '').split('\n'):
+            s = s.strip()
+            if s and s not in seen:
+                seen.add(s)
+                lines.append(s)
+        return lines[:LiveAnalysis.MAX_LINES]
+
+    def update(self, sp_manager, lines):
+        """Procesa solo las líneas nuevas y descarta las que ya no están"""
+        new_lines = [l for l in lines if l not in self.state]
+        if new_lines:
+            self._analyze(sp_manager, new_lines)
+
+        current = set(lines)
+        self.state = {l: v for l, v in self.state.items() if l in current}
+        return len(new_lines)
+
+    def _analyze(self, sp_manager, new_lines):
+        """
+        Busca y enriquece las líneas nuevas. Solo se guardan las que se han
+        completado: si la búsqueda, el BPM o los géneros fallan, la línea se
+        vuelve a intentar en la siguiente llamada en vez de quedarse sin datos.
+        """
+        search_results = sp_manager.search_tracks(new_lines, limit=1)
+
+        entries = {}
+        failed = set()
+        for res in search_results:
+            if res.get('error') or res.get('cancelled'):
+                failed.add(res['query'])
+                continue
+            match = res['matches'][0] if res['matches'] else None
+            entries[res['query']] = {
+                'id': match['id'] if match else None,
+                'artist': match['artist'] if match else None,
+                'name': match['name'] if match else None,
+                'duration_ms': match.get('duration_ms') if match else None,
+                'isrc': match.get('isrc') if match else None,
+                'artist_ids': match['artist_ids'] if match else [],
+                'bpm': 0,
+                'genres': []
+            }
+
+        matched = [(line, e) for line, e in entries.items() if e['id']]
+        from concurrent.futures import ThreadPoolExecutor
+
+        def _enrich(item):
+            line, entry = item
+            try:
+                entry['bpm'] = sp_manager.fetch_bpm(entry['artist'], entry['name'], entry.get('duration_ms'),
+                                                    isrc=entry.get('isrc')) or 0
+            except Exception as e:
+                log.warning("Live Analysis BPM error: %s", e)
+                failed.add(line)
+                return
+            # 0 is only a real "no BPM" if some source answered (then the miss is cached)
+            if not entry['bpm'] and sp_manager.cached_bpm(entry['artist'], entry['name'], entry.get('isrc')) is None:
+                failed.add(line)
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            list(executor.map(_enrich, matched))
+
+        # Genres come from the main artist; one /artists call per 50 new artists
+        artist_ids = list({e['artist_ids'][0] for _, e in matched if e['artist_ids']})
+        genres_by_artist = {}
+        failed_artists = set()
+        for i in range(0, len(artist_ids), 50):
+            try:
+                for a in sp_manager.sp.artists(artist_ids[i:i + 50])['artists']:
+                    if a:
+                        genres_by_artist[a['id']] = a.get('genres', [])
+            except Exception as e:
+                log.warning("Live Analysis genres error: %s", e, extra={'upstream': 'spotify'})
+                failed_artists.update(artist_ids[i:i + 50])
+        for line, e in matched:
+            if e['artist_ids']:
+                if e['artist_ids'][0] in failed_artists:
+                    failed.add(line)
+                e['genres'] = genres_by_artist.get(e['artist_ids'][0], [])
+
+        for line in new_lines:
+            if line in failed:
+                continue
+            entry = entries.get(line, {'id': None, 'artist_ids': [], 'bpm': 0, 'genres': []})
+            entry.pop('artist', None)
+            entry.pop('name', None)
+            self.state[line] = entry
+
+    def summary(self, lines):
+        entries = [self.state[l] for l in lines if l in self.state]
+        matched = [e for e in entries if e['id']]
+        bpms = [e['bpm'] for e in matched if e['bpm'] > 0]
+        vibe = vibe_from_bpm(sum(bpms) / len(bpms) if bpms else 0)
+
+        avg_energy = vibe['energy'] / 100 if bpms else 0
+        avg_val = vibe['valence'] / 100 if bpms else 0
+
+        # Simple Emotion Mapping
+        emotion = "Neutral"
+        if avg_val > 0.6 and avg_energy > 0.6: emotion = "Euphoric / Happy"
+        elif avg_val > 0.6: emotion = "Chill / Positive"
+        elif avg_val < 0.4 and avg_energy > 0.6: emotion = "Dark / Intense"
+        elif avg_val < 0.4 and bpms: emotion = "Sad / Melancholic"
+
+        genres = Counter(g for e in matched for g in e['genres'])
+        return {
+            'success': bool(matched),
+            'energy': vibe['energy'] if bpms else 0,
+            'valence': vibe['valence'] if bpms else 0,
+            'dance': vibe['danceability'] if bpms else 0,
+            'bpm': vibe['bpm'],
+            'emotion': emotion,
+            'genres': [g for g, c in genres.most_common(3)],
+            'matched': len(matched),
+            'total': len(lines)
+        }
@@ -0,0 +1,205 @@
+"""
+Logging sin bloqueo para las rutas calientes: los registros se encolan
+(QueueHandler) y un hilo aparte (QueueListener) los formatea y escribe, así
+una petición nunca espera a stdout. Registros estructurados en JSON con
+request_id, ruta, servicio externo y latencia; los eventos DEBUG ruidosos se
+muestrean y el nivel depende del entorno.
+
+    from log_config import get_logger
+    log = get_logger(__name__)
+    log.warning("Search failed", extra={'upstream': 'spotify', 'latency_ms': 812})
+
+Variables: LOG_LEVEL (por defecto INFO en producción, DEBUG en desarrollo),
+LOG_SAMPLE_RATE (fracción de eventos DEBUG que se conservan, 0.01 en producción),
+LOG_FORMAT ('json' o 'text'; por defecto json en producción).
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+
+try:
+    from flask import g, has_request_context, request
+except ImportError:  # Offline tools (bulk_builder.py, bpm_index.py) work without Flask
+    has_request_context = None
+
+ROOT = 'spotitool'
+# Structured fields copied from `extra=` (and from the request) into every JSON line
+FIELDS = ('request_id', 'route', 'method', 'status', 'upstream', 'latency_ms', 'playlist_id', 'count')
+
+_listener = None
+_queue_handler = None
+
+
+def get_logger(name):
+    """Logger bajo la jerarquía de la app (hereda cola, nivel y filtros)"""
+    if name == '__main__' or not name:
+        return logging.getLogger(ROOT)
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+def request_fields():
+    """request_id/ruta de la petición actual, para pasarlos con `extra=` desde hilos de trabajo"""
+    if has_request_context and has_request_context():
+        return {'request_id': g.get('request_id'),
+                'route': request.url_rule.rule if request.url_rule else request.path}
+    return {}
+
+
+class RequestContextFilter(logging.Filter):
+    """Añade request_id y ruta de la petición Flask en curso (en el hilo que emite)"""
+
+    def filter(self, record):
+        if getattr(record, 'request_id', None) is None and has_request_context and has_request_context():
+            record.request_id = g.get('request_id')
+            record.route = request.url_rule.rule if request.url_rule else request.path
+            record.method = request.method
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar solo una fracción `rate` de los registros por debajo de INFO"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.INFO or self.rate >= 1:
+            return True
+        if random.random() < self.rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Encola una copia lista para otro hilo: mensaje interpolado y traceback en
+    texto, pero sin formatear la línea final (eso lo hace el listener).
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JSONFormatter(logging.Formatter):
+    """Una línea JSON por registro"""
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato legible para desarrollo: los campos estructurados van al final"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s: %(message)s', '%H:%M:%S')
+
+    def format(self, record):
+        line = super().format(record)
+        extras = ' '.join(f"{f}={getattr(record, f)}" for f in FIELDS if getattr(record, f, None) is not None)
+        return f"{line} [{extras}]" if extras else line
+
+
+def setup_logging(env=None, level=None, sample_rate=None, fmt=None, stream=None):
+    """
+    Configura la jerarquía 'spotitool' (idempotente). El hilo del listener es
+    el único que escribe en `stream` (stdout por defecto).
+    """
+    global _listener, _queue_handler
+    production = (env or os.environ.get('FLASK_ENV')) == 'production'
+    level = level or os.environ.get('LOG_LEVEL') or ('INFO' if production else 'DEBUG')
+    if sample_rate is None:
+        sample_rate = float(os.environ.get('LOG_SAMPLE_RATE', 0.01 if production else 1.0))
+    fmt = fmt or os.environ.get('LOG_FORMAT') or ('json' if production else 'text')
+
+    logger = logging.getLogger(ROOT)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+    if _listener is not None:
+        _listener.stop()
+        logger.removeHandler(_queue_handler)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JSONFormatter() if fmt == 'json' else TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = StructuredQueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter(sample_rate))
+    _queue_handler.addFilter(RequestContextFilter())
+    logger.addHandler(_queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    return logger
+
+
+def shutdown_logging():
+    """Vacía la cola (al salir del proceso)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+def sampled_dropped():
+    """Eventos DEBUG descartados por muestreo (para /debug/stats)"""
+    if _queue_handler is None:
+        return 0
+    return sum(f.dropped for f in _queue_handler.filters if isinstance(f, SamplingFilter))
+
+
+def init_request_logging(app, slow_ms=1000):
+    """
+    request_id por petición (X-Request-ID entrante o uno nuevo, devuelto en la
+    respuesta) y una línea por petición: DEBUG (muestreada) o WARNING si es lenta.
+    """
+    log = get_logger('http')
+
+    @app.before_request
+    def _start_request():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:12]
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def _log_request(response):
+        start = g.get('request_start')
+        if start is None:
+            return response
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        response.headers['X-Request-ID'] = g.request_id
+        if latency_ms >= slow_ms:
+            log.warning("Slow request", extra={'status': response.status_code, 'latency_ms': latency_ms})
+        elif log.isEnabledFor(logging.DEBUG):
+            log.debug("Request", extra={'status': response.status_code, 'latency_ms': latency_ms})
+        return response
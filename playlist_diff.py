@@ -0,0 +1,168 @@
+from bisect import bisect_left
+
+# Spotify API limits per request
+MAX_ITEMS_PER_CALL = 100
+
+
+def tag_occurrences(uris):
+    """Convierte [a, b, a] en [(a, 0), (b, 0), (a, 1)] para distinguir duplicados"""
+    seen = {}
+    tagged = []
+    for uri in uris:
+        n = seen.get(uri, 0)
+        seen[uri] = n + 1
+        tagged.append((uri, n))
+    return tagged
+
+
+def longest_increasing_subsequence(values):
+    """Índices de una subsecuencia creciente máxima de `values` (O(n log n))"""
+    tails = []      # Último valor de la mejor subsecuencia de cada longitud
+    tail_idx = []   # Índice en `values` de ese último valor
+    prev = [-1] * len(values)
+    for i, v in enumerate(values):
+        pos = bisect_left(tails, v)
+        if pos == len(tails):
+            tails.append(v)
+            tail_idx.append(i)
+        else:
+            tails[pos] = v
+            tail_idx[pos] = i
+        prev[i] = tail_idx[pos - 1] if pos > 0 else -1
+
+    result = []
+    i = tail_idx[-1] if tail_idx else -1
+    while i != -1:
+        result.append(i)
+        i = prev[i]
+    return result[::-1]
+
+
+def _plan_removes(old, new_set):
+    """Posiciones a borrar, de mayor a menor: cada lote no desplaza a los siguientes"""
+    positions = [i for i, t in enumerate(old) if t not in new_set]
+    positions.reverse()
+    ops = []
+    for c in range(0, len(positions), MAX_ITEMS_PER_CALL):
+        chunk = positions[c:c + MAX_ITEMS_PER_CALL]
+        by_uri = {}
+        for pos in chunk:
+            by_uri.setdefault(old[pos][0], []).append(pos)
+        ops.append({'op': 'remove', 'items': [{'uri': u, 'positions': p} for u, p in by_uri.items()]})
+    return ops
+
+
+def _plan_moves(current, target, limit=None):
+    """
+    Movimientos para llevar `current` al orden de `target` (mismos elementos).
+    Los elementos de la LCS (una LIS sobre sus índices destino) no se mueven;
+    el resto se coloca tras su predecesor en `target`, agrupando rachas contiguas.
+    Cada movimiento cuesta O(n): con `limit`, devuelve None en cuanto hacen falta más.
+    """
+    target_index = {t: i for i, t in enumerate(target)}
+    stay = {current[i] for i in longest_increasing_subsequence([target_index[t] for t in current])}
+
+    cur = list(current)
+    ops = []
+    i = 0
+    while i < len(target):
+        item = target[i]
+        if item in stay:
+            i += 1
+            continue
+        start = cur.index(item)
+        insert_before = cur.index(target[i - 1]) + 1 if i > 0 else 0
+
+        # Racha: siguientes elementos a mover que ya van juntos y en orden
+        length = 1
+        while (i + length < len(target) and start + length < len(cur)
+               and target[i + length] not in stay and cur[start + length] == target[i + length]):
+            length += 1
+
+        if not (start <= insert_before <= start + length):
+            if limit is not None and len(ops) >= limit:
+                return None
+            ops.append({'op': 'reorder', 'range_start': start, 'insert_before': insert_before, 'range_length': length})
+            block = cur[start:start + length]
+            del cur[start:start + length]
+            at = insert_before if insert_before < start else insert_before - length
+            cur[at:at] = block
+        i += length
+    return ops
+
+
+def _plan_adds(new, old_set):
+    """Inserta las rachas nuevas en su posición final, en orden creciente"""
+    ops = []
+    i = 0
+    while i < len(new):
+        if new[i] in old_set:
+            i += 1
+            continue
+        j = i
+        while j < len(new) and new[j] not in old_set and j - i < MAX_ITEMS_PER_CALL:
+            j += 1
+        ops.append({'op': 'add', 'uris': [t[0] for t in new[i:j]], 'position': i})
+        i = j
+    return ops
+
+
+def replace_plan(new_uris):
+    """Plan de reemplazo total: un replace con los 100 primeros y adds para el resto"""
+    ops = [{'op': 'replace', 'uris': new_uris[:MAX_ITEMS_PER_CALL]}]
+    for c in range(MAX_ITEMS_PER_CALL, len(new_uris), MAX_ITEMS_PER_CALL):
+        ops.append({'op': 'add', 'uris': new_uris[c:c + MAX_ITEMS_PER_CALL], 'position': None})
+    return ops
+
+
+def plan_playlist_edit(old_uris, new_uris):
+    """
+    Calcula las llamadas mínimas (remove -> reorder -> add) para pasar de
+    `old_uris` a `new_uris`. Si reemplazar todo es más barato, devuelve ese plan.
+    Los huecos sin URI de `old_uris` (pistas no disponibles) no se pueden borrar
+    ni volver a añadir: se quedan en su posición y no se usa el reemplazo total.
+    """
+    pinned = [i for i, uri in enumerate(old_uris) if uri is None]
+    new_uris = list(new_uris)
+    for i in pinned:  # Increasing order: each one lands on its original position
+        new_uris.insert(min(i, len(new_uris)), None)
+
+    old = tag_occurrences(old_uris)
+    new = tag_occurrences(new_uris)
+    old_set, new_set = set(old), set(new)
+
+    kept = [t for t in old if t in new_set]
+    target = [t for t in new if t in old_set]
+
+    removes, adds = _plan_removes(old, new_set), _plan_adds(new, old_set)
+    if pinned:
+        return removes + _plan_moves(kept, target) + adds
+
+    # Only plan moves while they can still beat the replace plan
+    fallback = replace_plan(new_uris)
+    budget = len(fallback) - len(removes) - len(adds)
+    moves = _plan_moves(kept, target, limit=budget) if budget >= 0 else None
+    if moves is None:
+        return fallback
+    return removes + moves + adds
+
+
+def apply_plan(uris, ops):
+    """Aplica un plan sobre una lista local (simula la API; útil para tests y validación)"""
+    result = list(uris)
+    for op in ops:
+        if op['op'] == 'remove':
+            for pos in sorted((p for item in op['items'] for p in item['positions']), reverse=True):
+                del result[pos]
+        elif op['op'] == 'reorder':
+            start, before, length = op['range_start'], op['insert_before'], op['range_length']
+            block = result[start:start + length]
+            del result[start:start + length]
+            at = before if before < start else before - length
+            result[at:at] = block
+        elif op['op'] == 'add':
+            at = len(result) if op['position'] is None else op['position']
+            result[at:at] = op['uris']
+        elif op['op'] == 'replace':
+            result = list(op['uris'])
+    return result
@@ -0,0 +1,147 @@
+import gzip
+import hashlib
+import os
+import threading
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip is always available
+    brotli = None
+
+
+class ResponseOptimizer:
+    """
+    Compresión (br/gzip), ETags en respuestas JSON y cabeceras de caché
+    para estáticos con URLs versionadas por contenido (?v=<hash>).
+    También lleva la cuenta de bytes enviados por endpoint.
+    """
+    COMPRESSIBLE_TYPES = (
+        'text/html', 'text/css', 'text/plain', 'text/javascript',
+        'application/javascript', 'application/json', 'application/manifest+json',
+        'image/svg+xml'
+    )
+    MIN_SIZE = 500
+    STATIC_MAX_AGE = 365 * 24 * 3600
+
+    def __init__(self, app=None):
+        self._hashes = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.url_defaults(self._add_static_version)
+        app.after_request(self._after_request)
+
+    # --- Static assets ---
+
+    def static_hash(self, filename):
+        """Hash corto del contenido de un estático (cacheado por mtime)"""
+        path = os.path.join(self.app.static_folder, filename)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        cached = self._hashes.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, 'rb') as f:
+            digest = hashlib.md5(f.read()).hexdigest()[:10]
+        self._hashes[path] = (mtime, digest)
+        return digest
+
+    def _add_static_version(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            digest = self.static_hash(values['filename'])
+            if digest:
+                values['v'] = digest
+
+    # --- Response pipeline ---
+
+    def _after_request(self, response):
+        raw_size = None
+        if request.endpoint == 'static':
+            self._cache_static(response)
+        elif response.mimetype == 'application/json' and request.method == 'GET' and response.status_code == 200:
+            # Private data: always revalidate, answer 304 when nothing changed
+            response.add_etag(weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.make_conditional(request)
+
+        if self._should_compress(response):
+            response.direct_passthrough = False
+            data = response.get_data()
+            raw_size = len(data)
+            encoding, compressed = self._compress(data)
+            if encoding:
+                response.set_data(compressed)
+                response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+
+        self._record(response, raw_size)
+        return response
+
+    def _cache_static(self, response):
+        version = request.args.get('v')
+        filename = request.view_args.get('filename') if request.view_args else None
+        if version and filename and version == self.static_hash(filename):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = self.STATIC_MAX_AGE
+            response.cache_control.immutable = True
+
+    def _should_compress(self, response):
+        if response.status_code != 200 or 'Content-Encoding' in response.headers:
+            return False
+        if response.mimetype not in self.COMPRESSIBLE_TYPES:
+            return False
+        if response.is_streamed and not response.direct_passthrough:
+            return False
+        length = response.content_length
+        if length is not None and length < self.MIN_SIZE:
+            return False
+        accepted = request.accept_encodings
+        return bool(accepted['gzip'] or (brotli and accepted['br']))
+
+    def _compress(self, data):
+        if len(data) < self.MIN_SIZE:
+            return None, data
+        accepted = request.accept_encodings
+        if brotli and accepted['br']:
+            return 'br', brotli.compress(data, quality=5)
+        if accepted['gzip']:
+            return 'gzip', gzip.compress(data, compresslevel=6)
+        return None, data
+
+    # --- Bytes-on-the-wire stats ---
+
+    def _record(self, response, raw_size):
+        if response.status_code == 304:
+            sent = 0
+        elif response.is_sequence:
+            sent = len(response.get_data())
+        else:
+            sent = response.content_length or 0
+        if raw_size is None:
+            raw_size = sent
+        key = request.endpoint or 'unknown'
+        with self._lock:
+            s = self._stats.setdefault(key, {'requests': 0, 'not_modified': 0, 'raw_bytes': 0, 'sent_bytes': 0})
+            s['requests'] += 1
+            s['raw_bytes'] += raw_size
+            s['sent_bytes'] += sent
+            if response.status_code == 304:
+                s['not_modified'] += 1
+
+    def stats(self):
+        with self._lock:
+            report = {}
+            for endpoint, s in self._stats.items():
+                report[endpoint] = dict(s)
+                report[endpoint]['avg_sent_bytes'] = s['sent_bytes'] // s['requests']
+                report[endpoint]['ratio'] = round(s['sent_bytes'] / s['raw_bytes'], 3) if s['raw_bytes'] else 1.0
+            return report
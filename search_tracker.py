@@ -0,0 +1,83 @@
+import re
+import threading
+
+from cache_manager import TTLCache, get_shared_backend
+from log_config import get_logger
+
+log = get_logger(__name__)
+
+
+class SearchTicket:
+    """Una búsqueda en curso; sabe si una más reciente del mismo cliente la ha sustituido"""
+
+    def __init__(self, tracker, client_key, seq):
+        self.tracker = tracker
+        self.client_key = client_key
+        self.seq = seq
+
+    def is_superseded(self):
+        return self.tracker.latest_seq(self.client_key) > self.seq
+
+
+class SearchTracker:
+    """
+    Registro "latest-wins" de búsquedas typeahead por cliente (sesión + página).
+    El último `seq` de cada cliente se guarda en memoria y en el backend compartido,
+    así un worker ve las búsquedas nuevas que llegaron a otro.
+    """
+    SEQ_TTL = 300
+    _PAGE_RE = re.compile(r'[^A-Za-z0-9_-]')
+
+    @classmethod
+    def client_key(cls, session_id, scope, page_id=None):
+        """
+        Clave de cliente: sesión, ámbito y la carga concreta de la página. El `seq`
+        vuelve a 0 al recargar o en otra pestaña; sin `page_id` esas búsquedas
+        quedarían por debajo del último seq guardado y se darían por sustituidas.
+        """
+        page = cls._PAGE_RE.sub('', page_id or '')[:32]
+        return f"{session_id}:{scope}:{page}"
+
+    def __init__(self):
+        self._latest = TTLCache(maxsize=10000, ttl=self.SEQ_TTL)
+        self._lock = threading.Lock()
+        self._shared = None
+        self.started = 0
+        self.superseded = 0
+
+    @property
+    def shared(self):
+        if self._shared is None:
+            self._shared = get_shared_backend('search-seq', threshold=5000, default_timeout=self.SEQ_TTL)
+        return self._shared
+
+    def latest_seq(self, client_key):
+        local = self._latest.get(client_key, -1)
+        try:
+            shared = self.shared.get(client_key)
+        except Exception:
+            shared = None
+        return max(local, shared if shared is not None else -1)
+
+    def begin(self, client_key, seq):
+        """Registra una búsqueda nueva y devuelve su ticket"""
+        with self._lock:
+            self.started += 1
+            if seq > self._latest.get(client_key, -1):
+                self._latest.set(client_key, seq)
+                try:
+                    self.shared.set(client_key, seq)
+                except Exception as e:
+                    log.warning("Search tracker shared error: %s", e)
+        return SearchTicket(self, client_key, seq)
+
+    def mark_superseded(self):
+        with self._lock:
+            self.superseded += 1
+
+    def stats(self):
+        return {
+            'started': self.started,
+            'superseded': self.superseded,
+            'clients': len(self._latest)
+        }
@@ -1,5 +1,15 @@
+import threading
+import time
+
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
+from cache_manager import TTLCache, TwoTierCache
+from log_config import get_logger, request_fields
+from track_records import TrackCollection
+from vibe import VibeAggregate
+
+log = get_logger(__name__)
+
 
 class SpotifyManager:
     KEY_MAP = {
@@ -9,6 +19,7 @@ class SpotifyManager:
 
     def __init__(self):
         self.sp = None
+        self.user = None
 
     def authenticate_with_token(self, token_info):
         """
@@ -21,8 +32,31 @@ class SpotifyManager:
         
         # Validar expiración si es posible
         from spotipy import Spotify
-        self.sp = Spotify(auth=token_info['access_token'], requests_timeout=10, retries=3)
-        return self.sp.current_user()
+        self.sp = Spotify(auth=token_info['access_token'], requests_session=self._get_spotify_session(),
+                          requests_timeout=10, retries=3)
+        self.user = self.sp.current_user()
+        return self.user
+
+    def authenticate_with_oauth(self, sp_oauth):
+        """
+        Autentica con un SpotifyOAuth (uso sin navegador, p. ej. bulk_builder.py):
+        spotipy renueva el token solo durante ejecuciones largas.
+        """
+        from spotipy import Spotify
+        self.sp = Spotify(auth_manager=sp_oauth, requests_session=self._get_spotify_session(),
+                          requests_timeout=10, retries=3)
+        self.user = self.sp.current_user()
+        return self.user
+
+    # Shared Spotify session: keeps connections alive and revalidates reads with ETags
+    _spotify_session = None
+
+    @classmethod
+    def _get_spotify_session(cls):
+        if cls._spotify_session is None:
+            from conditional_session import ConditionalSession
+            cls._spotify_session = ConditionalSession(retries=3)
+        return cls._spotify_session
 
     # Shared session for Deezer lookups to reuse SSL handshakes
     _deezer_session = None
@@ -52,36 +86,169 @@ class SpotifyManager:
         name = re.sub(r'[\-\s\(\)\[\]]+$', '', name)
         return name.strip()
 
-    def _fetch_deezer_bpm(self, artist_name, track_name):
+    def _fetch_deezer_bpm(self, artist_name, track_name, duration_ms=None):
         """Helper para buscar BPM en Deezer con búsqueda ultra-agresiva"""
         try:
-            session = self._get_deezer_session()
-            clean_track = self._clean_track_name(track_name)
-            
-            # 1. Búsqueda combinada (Atista + Canción)
-            dq = f"{artist_name} {clean_track}"
-            url = f"https://api.deezer.com/search?q={dq}&limit=5"
-            d_resp = session.get(url, timeout=3.0).json()
-                
-            if d_resp.get('data'):
-                for item in d_resp['data']:
-                    detail = session.get(f"https://api.deezer.com/track/{item['id']}", timeout=2.5).json()
-                    bpm = detail.get('bpm', 0)
-                    if bpm and bpm > 0: return int(float(bpm))
-
-            # 2. Búsqueda desesperada: Solo canción (si la anterior falló)
-            url_only_track = f"https://api.deezer.com/search?q={clean_track}&limit=10"
-            d_resp_alt = session.get(url_only_track, timeout=3.0).json()
-            if d_resp_alt.get('data'):
-                for item in d_resp_alt['data']:
-                    # Verificar si el artista coincide minimamente
-                    if artist_name.lower() in item['artist']['name'].lower() or item['artist']['name'].lower() in artist_name.lower():
-                        detail = session.get(f"https://api.deezer.com/track/{item['id']}", timeout=2.5).json()
-                        bpm = detail.get('bpm', 0)
-                        if bpm and bpm > 0: return int(float(bpm))
+            return self._deezer_bpm_lookup(artist_name, track_name, duration_ms)
         except: pass
         return 0
 
+    def _deezer_json(self, url, timeout):
+        """GET a la API de Deezer; lanza excepción si responde con error (cuota, 5xx...)"""
+        from enrichment import SourceUnavailable
+        data = self._get_deezer_session().get(url, timeout=timeout).json()
+        if 'error' in data:
+            raise SourceUnavailable(f"Deezer: {data['error']}")
+        return data
+
+    # Max candidates whose /track detail is requested in parallel per search
+    DEEZER_DETAIL_FANOUT = 3
+    # Only candidates scoring within this margin of the best one are fetched
+    DEEZER_SCORE_MARGIN = 0.15
+    # Minimum artist similarity to consider a candidate (combined / title-only search)
+    DEEZER_MIN_ARTIST_SIMILARITY = 0.5
+    DEEZER_MIN_ARTIST_SIMILARITY_TITLE_ONLY = 0.6
+    _deezer_pool = None
+
+    @staticmethod
+    def _artist_similarity(artist_name, candidate_artist):
+        """Parecido (0-1) entre el artista de Spotify (puede ser 'A, B') y el de Deezer"""
+        from difflib import SequenceMatcher
+        candidate = (candidate_artist or '').casefold()
+        best = 0.0
+        for name in (artist_name or '').split(','):
+            name = name.strip().casefold()
+            if not name:
+                continue
+            if name in candidate or candidate in name:
+                return 1.0
+            best = max(best, SequenceMatcher(None, name, candidate).ratio())
+        return best
+
+    def _rank_deezer_candidates(self, items, artist_name, duration_ms=None, min_similarity=0.0):
+        """
+        Ordena resultados de búsqueda por parecido de artista y cercanía de duración,
+        y se queda con los pocos que puntúan cerca del mejor.
+        """
+        ranked = []
+        for item in items:
+            similarity = self._artist_similarity(artist_name, (item.get('artist') or {}).get('name'))
+            if similarity < min_similarity:
+                continue
+            score = similarity
+            if duration_ms and item.get('duration'):
+                # 1.0 si coincide, 0 a partir de 30 s de diferencia
+                closeness = max(0.0, 1 - abs(item['duration'] - duration_ms / 1000) / 30)
+                score = 0.6 * similarity + 0.4 * closeness
+            ranked.append((score, item))
+        ranked.sort(key=lambda pair: -pair[0])
+        if not ranked:
+            return []
+        cutoff = ranked[0][0] - self.DEEZER_SCORE_MARGIN
+        return [item for score, item in ranked[:self.DEEZER_DETAIL_FANOUT] if score >= cutoff]
+
+    def _first_deezer_bpm(self, candidates):
+        """
+        Pide /track de los mejores candidatos en paralelo y devuelve el BPM del
+        mejor clasificado que lo tenga; los que aún no han empezado se cancelan.
+        Un candidato que falla cuenta como "sin BPM"; solo se lanza excepción
+        si han fallado todos (eso sí es un fallo de la fuente).
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        if not candidates:
+            return 0
+        if SpotifyManager._deezer_pool is None:
+            SpotifyManager._deezer_pool = ThreadPoolExecutor(max_workers=16)
+
+        futures = [SpotifyManager._deezer_pool.submit(self._deezer_json, f"https://api.deezer.com/track/{c['id']}", 2.5)
+                   for c in candidates]
+        try:
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                # Respuesta utilizable del mejor candidato cuyos predecesores ya han fallado
+                for future in futures:
+                    if not future.done():
+                        break
+                    if future.exception() is not None:
+                        continue
+                    bpm = future.result().get('bpm', 0)
+                    if bpm and bpm > 0:
+                        return int(float(bpm))
+            errors = [f.exception() for f in futures if f.exception() is not None]
+            if len(errors) == len(futures):
+                raise errors[0]
+            return 0
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _deezer_bpm_lookup(self, artist_name, track_name, duration_ms=None):
+        """Como _fetch_deezer_bpm, pero propaga los errores (para el circuit breaker)"""
+        clean_track = self._clean_track_name(track_name)
+
+        # 1. Búsqueda combinada (Artista + Canción)
+        dq = f"{artist_name} {clean_track}"
+        d_resp = self._deezer_json(f"https://api.deezer.com/search?q={dq}&limit=5", timeout=3.0)
+        candidates = self._rank_deezer_candidates(d_resp.get('data') or [], artist_name, duration_ms,
+                                                  min_similarity=self.DEEZER_MIN_ARTIST_SIMILARITY)
+        bpm = self._first_deezer_bpm(candidates)
+        if bpm:
+            return bpm
+
+        # 2. Búsqueda desesperada: Solo canción, con artista mínimamente parecido
+        tried = {c['id'] for c in candidates}
+        d_resp_alt = self._deezer_json(f"https://api.deezer.com/search?q={clean_track}&limit=10", timeout=3.0)
+        candidates = self._rank_deezer_candidates(
+            [i for i in d_resp_alt.get('data') or [] if i['id'] not in tried],
+            artist_name, duration_ms, min_similarity=self.DEEZER_MIN_ARTIST_SIMILARITY_TITLE_ONLY)
+        return self._first_deezer_bpm(candidates)
+
+    # Multi-source BPM pipeline (Deezer, TheAudioDB), shared by all requests of the worker
+    _enrichment = None
+    _bpm_reports = None
+
+    @property
+    def enrichment(self):
+        if SpotifyManager._enrichment is None:
+            from bpm_reports import ReportedSource
+            from enrichment import AudioDBSource, DeezerSource, EnrichmentPipeline
+            SpotifyManager._enrichment = EnrichmentPipeline(
+                [ReportedSource(self.bpm_reports), DeezerSource(SpotifyManager()), AudioDBSource()],
+                index=self._open_bpm_index())
+        return SpotifyManager._enrichment
+
+    @staticmethod
+    def _open_bpm_index():
+        """Índice offline ISRC → BPM (bpm_index.py) si BPM_INDEX_PATH apunta a uno"""
+        from config import Config
+        if not Config.BPM_INDEX_PATH:
+            return None
+        from bpm_index import BPMIndex
+        return BPMIndex(Config.BPM_INDEX_PATH)
+
+    @property
+    def bpm_reports(self):
+        """Resultados del analizador del navegador, compartidos entre usuarios (ver /bpm-report)"""
+        if SpotifyManager._bpm_reports is None:
+            from bpm_reports import BPMReportStore
+            SpotifyManager._bpm_reports = BPMReportStore()
+        return SpotifyManager._bpm_reports
+
+    def fetch_bpm(self, artist_name, track_name, duration_ms=None, isrc=None):
+        """BPM de una pista usando todas las fuentes (índice offline, caché, hedging y circuit breaker)"""
+        return self.enrichment.lookup(artist_name, track_name, duration_ms, isrc=isrc)
+
+    def cached_bpm(self, artist_name, track_name, isrc=None):
+        """BPM solo si ya está en caché o en el índice offline (None si habría que consultarlo)"""
+        return self.enrichment.peek(artist_name, track_name, isrc=isrc)
+
+    def cached_key(self, isrc):
+        """Tonalidad ('F#', 'Am'...) del índice offline, o None si no hay índice o entrada"""
+        index = self.enrichment.index
+        found = index.get(isrc) if index is not None and isrc else None
+        return found[1] if found else None
+
     def _fetch_deezer_preview(self, artist_name, track_name):
         """Helper para buscar preview en Deezer si Spotify no lo tiene"""
         try:
@@ -100,14 +267,111 @@ class SpotifyManager:
         except: pass
         return None
 
-    def search_tracks(self, queries, limit=5, progress_callback=None):
+    # Previews resolved lazily via /previews, shared by all requests of the worker
+    _preview_cache = TTLCache(maxsize=5000, ttl=6 * 3600)
+    PREVIEW_MISS_TTL = 3600
+    PREVIEW_EXPIRY_MARGIN = 120
+
+    def _preview_ttl(self, preview_url):
+        """TTL de caché para una preview de Deezer (URLs firmadas con `exp=`)"""
+        import re
+        import time
+        if not preview_url:
+            return self.PREVIEW_MISS_TTL
+        m = re.search(r'exp=(\d+)', preview_url)
+        if not m:
+            return self._preview_cache.ttl
+        remaining = int(m.group(1)) - time.time() - self.PREVIEW_EXPIRY_MARGIN
+        return max(0, min(remaining, self._preview_cache.ttl))
+
+    def resolve_previews(self, tracks):
         """
-        Searches for a list of queries in parallel (Spotify + Deezer Fallback).
+        Resuelve previews bajo demanda para una lista de {'id', 'artist', 'name'}.
+        Devuelve {track_id: preview_url or None}. Usa caché con conciencia de expiración.
+        """
+        previews = {}
+        pending = []
+        for t in tracks:
+            tid = t.get('id')
+            if not tid or tid in previews:
+                continue
+            cached = self._preview_cache.get(tid, TTLCache.MISSING)
+            if cached is not TTLCache.MISSING:
+                previews[tid] = cached
+            elif t.get('artist') and t.get('name'):
+                previews[tid] = None
+                pending.append(t)
+
+        if pending:
+            def _resolve(t):
+                url = self._fetch_deezer_preview(t['artist'], t['name'])
+                ttl = self._preview_ttl(url)
+                if ttl > 0:
+                    self._preview_cache.set(t['id'], url, ttl=ttl)
+                return t['id'], url
+
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=10) as executor:
+                for tid, url in executor.map(_resolve, pending):
+                    previews[tid] = url
+
+        return previews
+
+    # Search results shared across users and gunicorn workers
+    # '-v3': records now carry isrc for the offline BPM index; older entries in the shared tier lack it
+    _search_cache = TwoTierCache('search-v3', maxsize=2000, ttl=6 * 3600, shared_threshold=20000)
+    prefix_hits = 0
+
+    @staticmethod
+    def normalize_query(query):
+        """Normaliza una búsqueda para la clave de caché (mayúsculas, espacios, unicode)"""
+        import unicodedata
+        q = unicodedata.normalize('NFKC', query or '').casefold()
+        return " ".join(q.split())
+
+    def _search_cache_key(self, query, limit):
+        market = (self.user or {}).get('country') or '-'
+        return f"{market}:{limit}:{self.normalize_query(query)}"
+
+    def _prefix_cached_matches(self, query, limit):
+        """
+        Reutiliza un resultado cacheado de una búsqueda más larga que empieza por `query`
+        (p. ej. "daft pun" desde "daft punk"), filtrando por los términos escritos.
+        """
+        base_key = self._search_cache_key(query, limit)
+        if len(base_key.rsplit(':', 1)[-1]) < 3:
+            return None
+
+        tokens = base_key.rsplit(':', 1)[-1].split()
+        for key in reversed(self._search_cache.local.keys()):
+            if key == base_key or not key.startswith(base_key):
+                continue
+            cached = self._search_cache.local.get(key)
+            if not cached:
+                continue
+            filtered = []
+            for m in cached:
+                words = self.normalize_query(f"{m['name']} {m['artist']}").split()
+                complete_ok = all(t in words for t in tokens[:-1])
+                if complete_ok and any(w.startswith(tokens[-1]) for w in words):
+                    filtered.append(m)
+            if len(filtered) >= min(3, limit):
+                type(self).prefix_hits += 1
+                return filtered
+        return None
+
+    def search_tracks(self, queries, limit=5, progress_callback=None, should_cancel=None, allow_prefix=False,
+                      max_workers=20):
+        """
+        Searches for a list of queries in parallel (previews are resolved lazily).
+        `should_cancel()` lets a superseded typeahead search skip its upstream calls;
+        `allow_prefix` answers from a cached longer query when possible.
         """
         if not self.sp:
             raise Exception("No autenticado")
 
         results = [None] * len(queries)
+        context = request_fields()  # Worker threads have no request context of their own
         
         def _search_single(index, query):
             if progress_callback:
@@ -118,53 +382,160 @@ class SpotifyManager:
                 if not clean_q: 
                     results[index] = {'query': query, 'matches': []}
                     return
+
+                cache_key = self._search_cache_key(clean_q, limit)
+                cached = self._search_cache.get(cache_key)
+                if cached is None and allow_prefix:
+                    cached = self._prefix_cached_matches(clean_q, limit)
+                if cached is not None:
+                    # Copies: callers annotate matches (bpm, key) in place
+                    results[index] = {'query': query, 'matches': [m.copy() for m in cached]}
+                    return
+
+                if should_cancel and should_cancel():
+                    results[index] = {'query': query, 'matches': [], 'cancelled': True}
+                    return
                 
+                start = time.perf_counter()
                 resp = self.sp.search(q=clean_q, limit=limit, type='track')
+                log.debug("Spotify search", extra=dict(context, upstream='spotify',
+                                                        latency_ms=round((time.perf_counter() - start) * 1000, 1)))
                 
-                matches = []
-                for item in resp['tracks']['items']:
-                    image = item['album']['images'][0]['url'] if item['album']['images'] else None
-                    preview_url = item['preview_url']
-
-                    # Fallback to Deezer
-                    if not preview_url:
-                        artist = item['artists'][0]['name']
-                        preview_url = self._fetch_deezer_preview(artist, item['name'])
-
-                    matches.append({
-                        'id': item['id'],
-                        'uri': item['uri'],
-                        'name': item['name'],
-                        'artist': ", ".join([a['name'] for a in item['artists']]),
-                        'artist_ids': [a['id'] for a in item['artists']],
-                        'image': image,
-                        'preview_url': preview_url,
-                        'external_url': item['external_urls']['spotify']
-                    })
+                matches = [self._format_track(item) for item in resp['tracks']['items']]
                 
-                results[index] = {'query': query, 'matches': matches}
+                self._search_cache.set(cache_key, matches)
+                results[index] = {'query': query, 'matches': [m.copy() for m in matches]}
             except Exception as e:
-                print(f"Error searching for {query}: {e}")
-                results[index] = {'query': query, 'matches': []}
+                log.warning("Error searching for %r: %s", query, e, extra=dict(context, upstream='spotify'))
+                results[index] = {'query': query, 'matches': [], 'error': True}
 
         from concurrent.futures import ThreadPoolExecutor
-        with ThreadPoolExecutor(max_workers=20) as executor:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
             for i, q in enumerate(queries):
                 executor.submit(_search_single, i, q)
         
         return [r for r in results if r is not None]
 
-    def create_playlist_with_tracks(self, playlist_name, track_uris):
+    def _format_track(self, item, album=None):
+        """Convierte un track de la API en el registro de 'match' que usan las plantillas"""
+        # Deezer preview fallback is resolved lazily by the page via /previews
+        return TrackCollection.record_from_api(item, album=album)
+
+    # open.spotify.com/{intl-xx/}{embed/}<kind>/<id> or spotify:<kind>:<id>
+    SPOTIFY_LINK_RE = None
+
+    @classmethod
+    def parse_spotify_link(cls, line):
+        """Devuelve (tipo, id) si la línea es un enlace/URI de Spotify, o None"""
+        import re
+        if cls.SPOTIFY_LINK_RE is None:
+            cls.SPOTIFY_LINK_RE = re.compile(
+                r'open\.spotify\.com/(?:intl-[\w-]+/)?(?:embed/)?(track|album|playlist)/([A-Za-z0-9]{22})'
+                r'|spotify:(track|album|playlist):([A-Za-z0-9]{22})')
+        m = cls.SPOTIFY_LINK_RE.search(line or '')
+        if not m:
+            return None
+        return (m.group(1) or m.group(3), m.group(2) or m.group(4))
+
+    def get_tracks_bulk(self, track_ids):
+        """Resuelve IDs de tracks en lotes de 50 (endpoint /tracks). Devuelve {id: match}"""
+        if not self.sp: raise Exception("No autenticado")
+        unique_ids = list(dict.fromkeys(track_ids))
+        resolved = {}
+        for i in range(0, len(unique_ids), 50):
+            batch = unique_ids[i:i + 50]
+            try:
+                items = self.sp.tracks(batch)['tracks']
+            except Exception as e:
+                # One unknown/malformed id fails the whole batch: retry its ids one by one
+                log.warning("Error resolving track batch, retrying one by one: %s", e, extra={'upstream': 'spotify'})
+                items = [self._get_track_or_none(track_id) for track_id in batch]
+            for item in items:
+                if item:
+                    resolved[item['id']] = self._format_track(item)
+        return resolved
+
+    def _get_track_or_none(self, track_id):
+        try:
+            return self.sp.track(track_id)
+        except Exception as e:
+            log.warning("Error resolving track %s: %s", track_id, e, extra={'upstream': 'spotify'})
+            return None
+
+    def _expand_album(self, album_id):
+        """Tracks de un álbum (la primera página viene con el álbum, con su portada)"""
+        album = self.sp.album(album_id)
+        page = album['tracks']
+        matches = [self._format_track(t, album=album) for t in page['items'] if t]
+        while page['next']:
+            page = self.sp.next(page)
+            matches.extend(self._format_track(t, album=album) for t in page['items'] if t)
+        return matches
+
+    def _expand_playlist(self, playlist_id):
+        """Tracks de una playlist, proyectando solo los campos necesarios"""
+        fields = 'items(track(id,uri,name,preview_url,duration_ms,external_urls,artists(id,name),album(images))),next'
+        page = self.sp.playlist_items(playlist_id, limit=100, fields=fields, additional_types=['track'])
+        matches = []
+        while True:
+            matches.extend(self._format_track(i['track']) for i in page['items'] if i and i.get('track') and i['track'].get('id'))
+            if not page.get('next'):
+                break
+            page = self.sp.next(page)
+        return matches
+
+    def resolve_song_lines(self, lines, limit=10, max_workers=20):
+        """
+        Como search_tracks, pero los enlaces/URIs de Spotify se resuelven directamente:
+        tracks en lotes de 50, álbumes y playlists se expanden a sus canciones.
+        Solo las líneas de texto libre pasan por la búsqueda.
+        """
+        if not self.sp: raise Exception("No autenticado")
+
+        parsed = [self.parse_spotify_link(l) for l in lines]
+        track_ids = [p[1] for p in parsed if p and p[0] == 'track']
+        free_text = [l for l, p in zip(lines, parsed) if not p]
+
+        tracks = self.get_tracks_bulk(track_ids) if track_ids else {}
+        searched = {}
+        if free_text:
+            for res in self.search_tracks(free_text, limit=limit, max_workers=max_workers):
+                searched.setdefault(res['query'], res)
+
+        results = []
+        for line, p in zip(lines, parsed):
+            if not p:
+                results.append(searched.get(line, {'query': line, 'matches': []}))
+            elif p[0] == 'track':
+                match = tracks.get(p[1])
+                results.append({'query': line, 'matches': [dict(match)] if match else []})
+            else:
+                try:
+                    expanded = self._expand_album(p[1]) if p[0] == 'album' else self._expand_playlist(p[1])
+                except Exception as e:
+                    log.warning("Error expanding %s %s: %s", p[0], p[1], e, extra={'upstream': 'spotify'})
+                    results.append({'query': line, 'matches': [], 'error': True})
+                    continue
+                if not expanded:
+                    results.append({'query': line, 'matches': []})
+                for m in expanded:
+                    results.append({'query': f"{m['name']} - {m['artist']}", 'matches': [m]})
+        return results
+
+    def create_playlist_with_tracks(self, playlist_name, track_uris, playlist_id=None):
         """
         Crea una playlist con una lista exacta de URIs.
+        Con `playlist_id`, añade las URIs al final de esa playlist en vez de crear otra.
         """
         if not self.sp:
             raise Exception("No autenticado")
 
-        user_id = self.sp.current_user()['id']
-        
-        # 1. Crear playlist
-        playlist = self.sp.user_playlist_create(user_id, playlist_name)
+        # 1. Crear playlist (o usar la existente)
+        if playlist_id:
+            playlist = self.sp.playlist(playlist_id, fields='id,external_urls')
+        else:
+            user_id = self.sp.current_user()['id']
+            playlist = self.sp.user_playlist_create(user_id, playlist_name)
         
         # 2. Añadir canciones (lotes de 100)
         track_uris = [u for u in track_uris if u] # Filtrar vacíos
@@ -173,85 +544,243 @@ class SpotifyManager:
             for i in range(0, len(track_uris), 100):
                 self.sp.playlist_add_items(playlist['id'], track_uris[i:i+100])
         
+        self.invalidate_playlists_cache()
         return {
             'playlist_url': playlist['external_urls']['spotify'],
             'playlist_id': playlist['id'],
             'total_added': len(track_uris)
         }
 
-    def get_user_playlists(self):
+    # Playlist index per user and track lists per playlist snapshot (warmed at login)
+    # '-v3': track records carry isrc, so lists cached before it are never read back
+    _playlists_cache = TwoTierCache('user-playlists', maxsize=1000, ttl=600)
+    _tracks_cache = TwoTierCache('playlist-tracks-v3', maxsize=300, ttl=6 * 3600, shared_threshold=2000)
+
+    def get_user_playlists(self, use_cache=True):
         """Obtiene TODAS las playlists del usuario (sin límite)"""
         if not self.sp: return []
+        user_id = (self.user or {}).get('id')
+        if use_cache and user_id:
+            cached = self._playlists_cache.get(user_id)
+            if cached is not None:
+                return cached
         try:
-            playlists = []
-            results = self.sp.current_user_playlists(limit=50)
-            playlists.extend(results['items'])
-            
-            # Pagination loop
-            while results['next']:
-                results = self.sp.next(results)
-                playlists.extend(results['items'])
-                
+            first_page = self.sp.current_user_playlists(limit=50)
+            playlists = list(first_page['items'])
+
+            # Remaining pages fetched in parallel by offset instead of following `next`
+            offsets = range(50, first_page['total'], 50)
+            if offsets:
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(max_workers=10) as executor:
+                    for page in executor.map(lambda o: self.sp.current_user_playlists(limit=50, offset=o)['items'], offsets):
+                        playlists.extend(page)
+
+            if user_id:
+                self._playlists_cache.set(user_id, playlists)
             return playlists
         except Exception as e:
-            print(f"Error fetching playlists: {e}")
+            log.warning("Error fetching playlists: %s", e, extra={'upstream': 'spotify'})
             return []
 
-    def get_playlist_tracks(self, playlist_id):
-        """Obtiene las canciones de una playlist con Fallback de Audio Paralelo"""
-        if not self.sp: return []
+    PLAYLIST_HEADER_FIELDS = 'id,name,owner(id,display_name),images,external_urls,snapshot_id,tracks(total)'
+    TRACK_PAGE_FIELDS = ('items(track(id,uri,name,preview_url,duration_ms,external_ids(isrc),artists(id,name),'
+                         'album(name,images))),total')
+
+    def get_playlist_page(self, playlist_id, offset=0, limit=100, snapshot_id=None):
+        """
+        Una página de canciones como registros compactos (solo lo que pinta una fila).
+        Devuelve (tracks, total). Las páginas de un snapshot concreto se cachean.
+        """
+        if not self.sp: return [], 0
+        cache_key = f"page:{playlist_id}:{snapshot_id}:{offset}:{limit}" if snapshot_id else None
+        if cache_key:
+            cached = self._tracks_cache.get(cache_key)
+            if cached is not None:
+                return cached[0].copy(), cached[1]
+
+        page = self.sp.playlist_items(playlist_id, limit=limit, offset=offset,
+                                      fields=self.TRACK_PAGE_FIELDS, additional_types=['track'])
+        # Unavailable/local items keep their slot so positions match the playlist
+        tracks = TrackCollection.from_playlist_items(page['items'], image='smallest', keep_unavailable=True)
+        for t in tracks:
+            t['name'] = t['name'] or 'No disponible'
+
+        if cache_key:
+            self._tracks_cache.set(cache_key, (tracks.copy(), page['total']))
+        if offset == 0:
+            self._remember_seeds(playlist_id, tracks)
+        return tracks, page['total']
+
+    def invalidate_playlists_cache(self, playlist_id=None):
+        """El índice de playlists (nombres, nº de canciones) ha cambiado; y las semillas de `playlist_id`"""
+        user_id = (self.user or {}).get('id')
+        if user_id:
+            self._playlists_cache.delete(user_id)
+        if playlist_id:
+            self._tracks_cache.delete(f"seeds:{playlist_id}")
+
+    def get_playlist_tracks(self, playlist_id, snapshot_id=None, raise_errors=False):
+        """
+        Obtiene las canciones de una playlist (previews de Deezer se resuelven bajo demanda).
+        Con `snapshot_id` se sirve de caché: un snapshot no cambia nunca.
+        Si Spotify falla devuelve [], o relanza el error con raise_errors=True
+        (quien guarda algo derivado de la lista no debe confundirlo con una playlist vacía).
+        """
+        if not self.sp:
+            if raise_errors: raise Exception("No autenticado")
+            return []
+        cache_key = f"{playlist_id}:{snapshot_id}" if snapshot_id else None
+        if cache_key:
+            cached = self._tracks_cache.get(cache_key)
+            if cached is not None:
+                return cached.copy()
         try:
             # 1. Fetch from Spotify
-            first_page = self.sp.playlist_items(playlist_id, limit=100, offset=0)
+            first_page = self.sp.playlist_items(playlist_id, limit=100, offset=0, fields=self.TRACK_PAGE_FIELDS)
             total = first_page['total']
-            all_items = first_page['items']
+            # 2. Compact records page by page: raw items are dropped as soon as they are converted
+            tracks = TrackCollection.from_playlist_items(first_page['items'])
+            del first_page
             
             if total > 100:
                 offsets = range(100, total, 100)
                 from concurrent.futures import ThreadPoolExecutor
                 with ThreadPoolExecutor(max_workers=10) as executor:
-                    results = executor.map(lambda o: self.sp.playlist_items(playlist_id, limit=100, offset=o)['items'], offsets)
-                    for page_items in results: all_items.extend(page_items)
-            
-            # 2. Extract basic data
-            tracks = []
-            for item in all_items:
-                if not item or not item.get('track'): continue
-                t = item['track']
-                img = t['album']['images'][0]['url'] if t['album'].get('images') else None
-                tracks.append({
-                    'id': t['id'], 'name': t['name'], 'artist': t['artists'][0]['name'],
-                    'album': t['album']['name'], 'image': img, 'uri': t['uri'],
-                    'preview_url': t['preview_url'] # Original from Spotify
-                })
-
-            # 3. Parallel Fallback for missing previews
-            missing_indices = [i for i, t in enumerate(tracks) if not t['preview_url']]
-            if missing_indices:
-                from concurrent.futures import ThreadPoolExecutor
-                def _repair(idx):
-                    t = tracks[idx]
-                    tracks[idx]['preview_url'] = self._fetch_deezer_preview(t['artist'], t['name'])
+                    results = executor.map(lambda o: TrackCollection.from_playlist_items(
+                        self.sp.playlist_items(playlist_id, limit=100, offset=o, fields=self.TRACK_PAGE_FIELDS)['items']), offsets)
+                    for page_tracks in results: tracks.extend(page_tracks)
 
-                with ThreadPoolExecutor(max_workers=10) as executor:
-                    executor.map(_repair, missing_indices)
-            
+            if cache_key:
+                self._tracks_cache.set(cache_key, tracks.copy())
+            self._remember_seeds(playlist_id, tracks)
             return tracks
         except Exception as e:
-            print(f"Error fetching tracks: {e}")
+            log.warning("Error fetching tracks: %s", e, extra={'upstream': 'spotify', 'playlist_id': playlist_id})
+            if raise_errors:
+                raise
             return []
 
+    # Vibe aggregate per playlist, stored next to its tracks and kept current on add/remove/enrich.
+    # The lock only serializes the read-modify-write within one process: across gunicorn workers
+    # the last write wins, so a concurrent update from another worker can be lost. That is
+    # tolerable because edits re-stamp the aggregate only when it matches the snapshot they
+    # started from (anything else drops it), and a lost enrichment is only a missing BPM.
+    _vibe_lock = threading.Lock()
+
+    def playlist_vibe(self, playlist_id, snapshot_id=None, tracks=None, build=True):
+        """
+        Agregado de vibra (VibeAggregate) de la playlist. Solo se reconstruye
+        si no existe o es de otro snapshot: con `tracks` si se pasan, si no
+        con la lista (cacheada por snapshot) y los BPM ya conocidos.
+        Con build=False devuelve None en vez de reconstruirlo.
+        """
+        key = f"vibe:{playlist_id}"
+        agg = self._tracks_cache.get(key)
+        if agg is not None and (snapshot_id is None or agg.snapshot_id == snapshot_id):
+            return agg
+        if not build:
+            return None
+        if tracks is None:
+            tracks = self.get_playlist_tracks(playlist_id, snapshot_id=snapshot_id, raise_errors=True)
+            for t in tracks:
+                t['bpm'] = self.cached_bpm(t['artist'], t['name'], t.get('isrc')) or 0
+        agg = VibeAggregate.from_tracks(tracks, snapshot_id)
+        with self._vibe_lock:
+            self._tracks_cache.set(key, agg)
+        return agg
+
+    def update_playlist_vibe(self, playlist_id, update, snapshot_id=None, previous_snapshot=None):
+        """
+        Aplica `update(agg)` al agregado guardado (si lo hay) y lo vuelve a guardar.
+        Tras una edición (`snapshot_id` nuevo y `previous_snapshot`, el de antes de
+        editar) solo se actualiza si el agregado era de `previous_snapshot`; si no
+        (la playlist cambió por otro lado) se descarta y se reconstruirá al verla.
+        """
+        key = f"vibe:{playlist_id}"
+        with self._vibe_lock:
+            agg = self._tracks_cache.get(key)
+            if agg is None:
+                return None
+            if snapshot_id or previous_snapshot:
+                if not snapshot_id or not previous_snapshot or agg.snapshot_id != previous_snapshot:
+                    self._tracks_cache.delete(key)
+                    return None
+                agg.snapshot_id = snapshot_id
+            update(agg)
+            self._tracks_cache.set(key, agg)
+            return agg
+
+    def _snapshot_before_edit(self, playlist_id):
+        """snapshot_id actual, solo si hay un agregado de vibra que mantener (si no, sin llamar a Spotify)"""
+        if self._tracks_cache.get(f"vibe:{playlist_id}") is None:
+            return None
+        try:
+            return self.sp.playlist(playlist_id, fields='snapshot_id')['snapshot_id']
+        except Exception as e:
+            log.debug("Snapshot check failed: %s", e, extra={'upstream': 'spotify', 'playlist_id': playlist_id})
+            return None
+
     def section_add_remove(self): pass # Marker
 
     def add_track_to_playlist(self, playlist_id, track_uri):
         """Añade una canción a la playlist"""
         if not self.sp: raise Exception("No autenticado")
-        self.sp.playlist_add_items(playlist_id, [track_uri])
+        previous = self._snapshot_before_edit(playlist_id)
+        resp = self.sp.playlist_add_items(playlist_id, [track_uri])
+        self.invalidate_playlists_cache(playlist_id)
+        self.update_playlist_vibe(playlist_id, lambda agg: agg.add(track_uri.split(':')[-1]),
+                                  (resp or {}).get('snapshot_id'), previous)
 
     def remove_track_from_playlist(self, playlist_id, track_uri):
         """Elimina una canción de la playlist"""
         if not self.sp: raise Exception("No autenticado")
-        self.sp.playlist_remove_all_occurrences_of_items(playlist_id, [track_uri])
+        previous = self._snapshot_before_edit(playlist_id)
+        resp = self.sp.playlist_remove_all_occurrences_of_items(playlist_id, [track_uri])
+        self.invalidate_playlists_cache(playlist_id)
+        self.update_playlist_vibe(playlist_id, lambda agg: agg.remove(track_uri.split(':')[-1]),
+                                  (resp or {}).get('snapshot_id'), previous)
+
+    def apply_track_mutations(self, playlist_id, ops):
+        """
+        Aplica en orden una cola de altas/bajas [{'op': 'add'|'remove', 'uri': ...}].
+        Las operaciones consecutivas del mismo tipo se agrupan en lotes de 100.
+        Devuelve un resultado por operación: {'op', 'uri', 'success', 'error'}.
+        """
+        if not self.sp: raise Exception("No autenticado")
+        results = []
+        previous = self._snapshot_before_edit(playlist_id)
+        snapshot_id = None
+        i = 0
+        while i < len(ops):
+            kind = ops[i]['op']
+            j = i
+            while j < len(ops) and ops[j]['op'] == kind and j - i < 100:
+                j += 1
+            uris = [o['uri'] for o in ops[i:j]]
+            try:
+                if kind == 'add':
+                    resp = self.sp.playlist_add_items(playlist_id, uris)
+                else:
+                    resp = self.sp.playlist_remove_all_occurrences_of_items(playlist_id, uris)
+                snapshot_id = (resp or {}).get('snapshot_id', snapshot_id)
+                error = None
+            except Exception as e:
+                log.warning("Batch %s error: %s", kind, e,
+                            extra={'upstream': 'spotify', 'playlist_id': playlist_id, 'count': len(uris)})
+                error = str(e)
+            results.extend({'op': kind, 'uri': u, 'success': error is None, 'error': error} for u in uris)
+            i = j
+        self.invalidate_playlists_cache(playlist_id)
+
+        def _apply(agg):
+            for r in results:
+                if r['success']:
+                    track_id = r['uri'].split(':')[-1]
+                    agg.add(track_id) if r['op'] == 'add' else agg.remove(track_id)
+        if snapshot_id:
+            self.update_playlist_vibe(playlist_id, _apply, snapshot_id, previous)
+        return results
 
     def get_audio_features(self, track_ids):
         """Obtiene energía, bailabilidad, etc. para una lista de IDs"""
@@ -269,23 +798,56 @@ class SpotifyManager:
             results = {f['id']: f for f in features_list if f}
             return results
         except Exception as e:
-            import traceback
-            print(f"Error fetching audio features: {e}")
-            print(f"Full traceback: {traceback.format_exc()}")
+            # Blocked (403) for most apps: expected, so the traceback is only kept at DEBUG
+            log.warning("Error fetching audio features: %s", e, extra={'upstream': 'spotify', 'count': len(track_ids)})
+            log.debug("Audio features traceback", exc_info=True)
             return {}
 
     def delete_playlist(self, playlist_id):
         """Elimina (deja de seguir) una playlist"""
         if not self.sp: raise Exception("No autenticado")
         self.sp.current_user_unfollow_playlist(playlist_id)
+        self.invalidate_playlists_cache(playlist_id)
+
+    def get_playlist_uris(self, playlist_id):
+        """URIs actuales de una playlist (en orden; None en las pistas no disponibles) y su snapshot_id"""
+        if not self.sp: raise Exception("No autenticado")
+        snapshot_id = self.sp.playlist(playlist_id, fields='snapshot_id')['snapshot_id']
+        page = self.sp.playlist_items(playlist_id, limit=100, fields='items(track(uri)),next', additional_types=['track'])
+        uris = []
+        while True:
+            uris.extend((i.get('track') or {}).get('uri') for i in page['items'])
+            if not page.get('next'):
+                break
+            page = self.sp.next(page)
+        return uris, snapshot_id
 
     def reorder_playlist(self, playlist_id, track_uris):
-        """Reemplaza completamente el orden de una playlist"""
+        """
+        Deja la playlist con exactamente `track_uris`, en ese orden.
+        Aplica el diff mínimo (remove/reorder/add) encadenando snapshot_id, así
+        las ediciones pequeñas cuestan un par de llamadas y se conservan las fechas de alta.
+        """
         if not self.sp: raise Exception("No autenticado")
-        
-        # Spotify API: replace_playlist_items replaces ALL items
-        # It's safer to use this for a full reorder than reorder_playlist_items in a loop
-        self.sp.playlist_replace_items(playlist_id, track_uris)
+        from playlist_diff import plan_playlist_edit
+
+        old_uris, snapshot_id = self.get_playlist_uris(playlist_id)
+        ops = plan_playlist_edit(old_uris, list(track_uris))
+
+        for op in ops:
+            if op['op'] == 'remove':
+                resp = self.sp.playlist_remove_specific_occurrences_of_items(playlist_id, op['items'], snapshot_id=snapshot_id)
+            elif op['op'] == 'reorder':
+                resp = self.sp.playlist_reorder_items(playlist_id, op['range_start'], op['insert_before'],
+                                                      range_length=op['range_length'], snapshot_id=snapshot_id)
+            elif op['op'] == 'add':
+                resp = self.sp.playlist_add_items(playlist_id, op['uris'], position=op['position'])
+            else:
+                resp = self.sp.playlist_replace_items(playlist_id, op['uris'])
+            snapshot_id = (resp or {}).get('snapshot_id', snapshot_id)
+        if ops:
+            self.invalidate_playlists_cache(playlist_id)
+        return len(ops)
 
     def update_playlist_details(self, playlist_id, name=None, description=None):
         """Actualiza metadatos de la playlist"""
@@ -296,13 +858,22 @@ class SpotifyManager:
         
         if data:
             self.sp.playlist_change_details(playlist_id, **data)
+            self.invalidate_playlists_cache()
+
+    # Recommendations per seed set (order-independent); failures are remembered briefly
+    _recs_cache = TwoTierCache('recommendations', maxsize=500, ttl=3600)
+    RECS_ERROR_TTL = 60
 
     def get_recommendations(self, seed_track_ids, limit=10):
-        """Obtiene recomendaciones basadas en tracks semilla"""
+        """Obtiene recomendaciones basadas en tracks semilla (cacheadas por conjunto de semillas)"""
         if not self.sp or not seed_track_ids: return []
+        # Max 5 seeds allowed by Spotify
+        seeds = seed_track_ids[:5]
+        cache_key = f"{','.join(sorted(seeds))}:{limit}"
+        cached = self._recs_cache.get(cache_key)
+        if cached is not None:
+            return [dict(r) for r in cached]
         try:
-            # Max 5 seeds allowed by Spotify
-            seeds = seed_track_ids[:5]
             results = self.sp.recommendations(seed_tracks=seeds, limit=limit)
             
             recs = []
@@ -317,11 +888,33 @@ class SpotifyManager:
                     'preview_url': track['preview_url'],
                     'external_url': track['external_urls']['spotify']
                 })
-            return recs
+            self._recs_cache.set(cache_key, recs)
+            return [dict(r) for r in recs]
         except Exception as e:
-            print(f"Error fetching recommendations: {e}")
+            log.warning("Error fetching recommendations: %s", e, extra={'upstream': 'spotify'})
+            self._recs_cache.set(cache_key, [], ttl=self.RECS_ERROR_TTL)
             return []
 
+    SEED_FIELDS = 'items(track(id))'
+
+    def get_seed_track_ids(self, playlist_id, count=5):
+        """
+        Primeras `count` canciones de la playlist como semillas: de la lista ya
+        cargada si la hay, si no con una sola página mínima (solo ids).
+        """
+        if not self.sp: return []
+        cached = self._tracks_cache.get(f"seeds:{playlist_id}")
+        if cached is not None:
+            return cached[:count]
+        page = self.sp.playlist_items(playlist_id, limit=count, fields=self.SEED_FIELDS, additional_types=['track'])
+        return self._remember_seeds(playlist_id, [i['track'] for i in page['items'] if i and i.get('track')])[:count]
+
+    def _remember_seeds(self, playlist_id, tracks):
+        """Guarda los ids de cabecera de una lista recién cargada (semillas de recomendación)"""
+        seeds = [t['id'] for t in tracks[:10] if t and t['id']][:5]
+        self._tracks_cache.set(f"seeds:{playlist_id}", seeds)
+        return seeds
+
     def upload_playlist_cover(self, playlist_id, image_b64):
         """Sube una imagen de portada (base64) a la playlist"""
         if not self.sp: raise Exception("No autenticado")
@@ -329,7 +922,7 @@ class SpotifyManager:
             self.sp.playlist_upload_cover_image(playlist_id, image_b64)
             return True
         except Exception as e:
-            print(f"Error uploading cover: {e}")
+            log.warning("Error uploading cover: %s", e, extra={'upstream': 'spotify', 'playlist_id': playlist_id})
             return False
 
     def play_track(self, uri):
@@ -0,0 +1,58 @@
+import os
+import tempfile
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from cache_manager import TTLCache
+from track_records import TrackRecord
+
+# Fields that affect how a track row renders
+FRAGMENT_FIELDS = ('id', 'uri', 'name', 'artist', 'album', 'image', 'preview_url', 'bpm', 'key')
+
+
+def fragment_state(tracks):
+    """
+    Firma del estado de enriquecimiento de una pista (o lista de pistas),
+    usada como parte de la clave de caché de un fragmento.
+    """
+    if tracks is None:
+        return ()
+    if isinstance(tracks, (dict, TrackRecord)):
+        return tuple(tracks.get(f) for f in FRAGMENT_FIELDS)
+    return tuple(fragment_state(t) for t in tracks)
+
+
+class FragmentCacheExtension(Extension):
+    """
+    {% cache 'nombre', clave1, clave2 %} ... {% endcache %}
+    Guarda el HTML renderizado del bloque, indexado por la tupla de claves.
+    """
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=TTLCache(maxsize=20000, ttl=3600))
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = parser.parse_tuple()
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache_support', [key]), [], [], body).set_lineno(lineno)
+
+    def _cache_support(self, key, caller):
+        cache = self.environment.fragment_cache
+        rv = cache.get(key)
+        if rv is None:
+            rv = caller()
+            cache.set(key, rv)
+        return rv
+
+
+def init_template_cache(app):
+    """Activa la caché de bytecode de Jinja y la caché de fragmentos"""
+    cache_dir = app.config.get('JINJA_BYTECODE_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'spotitool-jinja')
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.globals['fragment_state'] = fragment_state
@@ -0,0 +1,83 @@
+import json
+import os
+import tempfile
+
+from bpm_index import BPMIndex, build_index, decode_key, encode_key
+from cache_manager import TTLCache
+from enrichment import EnrichmentPipeline, EnrichmentSource
+
+
+def _dumps(directory):
+    csv_path = os.path.join(directory, "dump.csv")
+    with open(csv_path, "w") as f:
+        f.write("ISRC,Tempo,Key,Mode\n")
+        f.write("GBAHT1901299,103.0,11,0\n")
+        f.write("us-rc1-17-00001,128.4,C#,1\n")
+        f.write("bad,120,1,1\n")
+        f.write("USRC11700002,,1,1\n")
+    jsonl_path = os.path.join(directory, "dump.jsonl")
+    with open(jsonl_path, "w") as f:
+        f.write(json.dumps({'isrc': "GBAHT1901299", 'bpm': 104, 'key': "Bm"}) + "\n")  # Later dump wins
+        f.write(json.dumps({'isrc': "QZES82000001", 'bpm': 90.5}) + "\n")
+    return [csv_path, jsonl_path]
+
+
+def test_build_and_lookup():
+    directory = tempfile.mkdtemp()
+    output = os.path.join(directory, "index.bin")
+    stats = build_index(_dumps(directory), output, run_size=2)  # Several runs: exercises the merge
+    assert stats == {'rows': 4, 'rejected': 2, 'records': 3}
+    index = BPMIndex(output)
+    assert len(index) == 3
+    assert index.get("GBAHT1901299") == (104.0, "Bm")
+    assert index.get("US-RC1-17-00001") == (128.4, "C#")
+    assert index.bpm("QZES82000001") == 90  # round(90.5) like the online sources' ints
+    assert index.get("QZES82000002") is None and index.get(None) is None
+    assert not [f for f in os.listdir(directory) if f.endswith((".run", ".tmp"))]
+
+
+def test_key_encoding():
+    assert decode_key(encode_key(9, 0)) == "Am"
+    assert decode_key(encode_key("Eb")) == "D#"
+    assert decode_key(encode_key(-1)) is None and decode_key(encode_key("H")) is None
+
+
+def test_atomic_swap_is_picked_up():
+    directory = tempfile.mkdtemp()
+    output = os.path.join(directory, "index.bin")
+    dumps = _dumps(directory)
+    build_index(dumps[:1], output)
+    index = BPMIndex(output)
+    index.CHECK_INTERVAL = 0
+    assert index.get("QZES82000001") is None
+    build_index(dumps, output)
+    assert index.bpm("QZES82000001") == 90
+    assert index.reloads == 1
+
+
+class CountingSource(EnrichmentSource):
+    name = 'counting'
+
+    def fetch(self, artist, name, duration_ms=None):
+        return 77
+
+
+def test_index_answers_before_online_sources():
+    directory = tempfile.mkdtemp()
+    output = os.path.join(directory, "index.bin")
+    build_index(_dumps(directory), output)
+    source = CountingSource()
+    pipeline = EnrichmentPipeline([source], index=BPMIndex(output))
+    pipeline.cache = TTLCache(maxsize=100, ttl=3600)
+    assert pipeline.peek("Dua Lipa", "Levitating", isrc="GBAHT1901299") == 104
+    assert pipeline.lookup("Dua Lipa", "Levitating", isrc="GBAHT1901299") == 104
+    assert source.calls == 0
+    assert pipeline.lookup("Other", "Song", isrc="QZES82000009") == 77  # Not in the index: online
+    assert source.calls == 1
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
@@ -0,0 +1,95 @@
+from bpm_reports import BPMReportStore, ReportedSource
+from cache_manager import TTLCache
+from enrichment import EnrichmentPipeline, EnrichmentSource, SourceUnavailable
+from track_records import TrackRecord
+
+TRACK_ID = "4uLU6hMCjMI75M1A2tKUQC"
+
+
+def _store():
+    store = BPMReportStore()
+    store.cache = TTLCache(maxsize=1000, ttl=3600)  # In-process only: no shared state between runs
+    return store
+
+
+def _report(bpm, track_id=TRACK_ID):
+    return {'id': track_id, 'bpm': bpm, 'energy': 60, 'danceability': 70}
+
+
+def test_validate_rejects_bad_reports():
+    assert BPMReportStore.validate(_report(120))['bpm'] == 120
+    assert BPMReportStore.validate(_report(250)) is None
+    assert BPMReportStore.validate(_report("abc")) is None
+    assert BPMReportStore.validate(_report(120, track_id="../etc")) is None
+    assert BPMReportStore.validate(dict(_report(120), energy=400)) is None
+
+
+def test_needs_agreement_from_distinct_clients():
+    store = _store()
+    assert store.add_reports("a", [_report(120)]) == {}
+    assert store.add_reports("a", [_report(121)]) == {}  # Same client again: replaces its report
+    assert store.add_reports("b", [_report(90)]) == {}   # Outlier
+    assert store.add_reports("c", [_report(119)]) == {}
+    accepted = store.add_reports("d", [_report(120)])
+    assert accepted[TRACK_ID]['bpm'] == 120
+    assert store.features([TRACK_ID]) == {TRACK_ID: {'energy': 60, 'danceability': 70}}
+    assert store.add_reports("e", [_report(60)]) == {}   # Already settled
+    assert store.rejected == 1
+
+
+def test_one_user_with_many_sessions_is_one_client():
+    store = _store()
+    user = {'id': 'spotify-user-1'}
+    for _ in range(3):  # Three browser sessions, same account
+        assert store.add_reports(BPMReportStore.client_for(user), [_report(150)]) == {}
+    assert store.features([TRACK_ID]) == {}
+    assert BPMReportStore.client_for({}) is None
+    store.add_reports(BPMReportStore.client_for({'id': 'spotify-user-2'}), [_report(150)])
+    accepted = store.add_reports(BPMReportStore.client_for({'id': 'spotify-user-3'}), [_report(150)])
+    assert accepted[TRACK_ID]['bpm'] == 150
+
+
+def test_client_budget():
+    store = _store()
+    store.MAX_REPORTS_PER_CLIENT = 2
+    ids = [f"{i:022d}" for i in range(3)]
+    store.add_reports("a", [_report(100, track_id=i) for i in ids])
+    assert store.rejected == 1
+
+
+def test_publish_feeds_enrichment_without_overwriting():
+    store = _store()
+    pipeline = EnrichmentPipeline([ReportedSource(store)])
+    pipeline.cache = TTLCache(maxsize=1000, ttl=3600)
+    pipeline.cache.set(pipeline.cache_key("Other", "Known"), 95)
+    tracks = {
+        TRACK_ID: TrackRecord(id=TRACK_ID, name="Song", artist="Main, Feat"),
+        "1" * 22: TrackRecord(id="1" * 22, name="Known", artist="Other"),
+    }
+    store.publish(pipeline, tracks, {TRACK_ID: {'bpm': 124}, "1" * 22: {'bpm': 140}})
+    assert pipeline.peek("Main", "Song") == 124
+    assert pipeline.peek("Main, Feat", "Song") == 124
+    assert pipeline.peek("Other", "Known") == 95
+    pipeline.cache = TTLCache(maxsize=1000, ttl=3600)  # Expired: the reported source still answers
+    assert pipeline.lookup("Main", "Song") == 124
+
+
+class DownSource(EnrichmentSource):
+    name = 'down'
+
+    def fetch(self, artist, name, duration_ms=None):
+        raise SourceUnavailable("HTTP 503")
+
+
+def test_no_report_is_not_an_answer():
+    pipeline = EnrichmentPipeline([ReportedSource(_store()), DownSource()])
+    pipeline.cache = TTLCache(maxsize=1000, ttl=3600)
+    assert pipeline.lookup("Main", "Song") == 0
+    assert pipeline.peek("Main", "Song") is None  # No miss cached while the real sources are down
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
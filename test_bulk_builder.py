@@ -0,0 +1,115 @@
+import io
+import json
+import os
+import tempfile
+
+from bulk_builder import BulkBuilder, Checkpoint, read_lines
+from spotify_manager import SpotifyManager
+
+ALBUM = "https://open.spotify.com/album/" + "A" * 22
+
+
+class FakeManager:
+    """Resuelve "Artista - Canción" sin red y registra las llamadas"""
+    parse_spotify_link = SpotifyManager.parse_spotify_link
+    SPOTIFY_LINK_RE = None
+
+    def __init__(self, fail_on_add=None, fail_on=None):
+        self.searched = []
+        self.fail_on = fail_on
+        self.added = []
+        self.fail_on_add = fail_on_add
+
+    def resolve_song_lines(self, lines, limit=10, max_workers=20):
+        results = []
+        if self.fail_on in lines:
+            raise RuntimeError("http status: 500")
+        for line in lines:
+            self.searched.append(line)
+            if line == ALBUM:
+                results.extend({'query': n, 'matches': [self._track(n)]} for n in ("Album - One", "Album - Two"))
+            elif "missing" in line:
+                results.append({'query': line, 'matches': []})
+            elif "timeout" in line:
+                results.append({'query': line, 'matches': [], 'error': True})
+            else:
+                results.append({'query': line, 'matches': [self._track(line)]})
+        return results
+
+    @staticmethod
+    def _track(line):
+        track_id = line.replace(" ", "").replace("-", "")[:22]
+        return {'uri': f"spotify:track:{track_id}", 'id': track_id, 'name': line.split(" - ")[-1],
+                'artist': line.split(" - ")[0], 'duration_ms': 1000}
+
+    def fetch_bpm(self, artist, name, duration_ms=None, isrc=None):
+        return 120 if name != "Two" else 0
+
+    def create_playlist_with_tracks(self, name, uris, playlist_id=None):
+        if self.fail_on_add is not None and len(self.added) >= self.fail_on_add:
+            raise KeyboardInterrupt
+        self.added.append((playlist_id, list(uris)))
+        return {'playlist_id': playlist_id or "new-playlist"}
+
+
+def _build(manager, path, lines, chunk_size=2):
+    checkpoint = Checkpoint(path)
+    builder = BulkBuilder(manager, checkpoint, workers=2, chunk_size=chunk_size, out=io.StringIO())
+    try:
+        builder.run(read_lines(io.StringIO("\n".join(lines))), "Set", total=len(lines))
+    finally:
+        checkpoint.close()
+    return builder
+
+
+def test_resolves_enriches_and_adds_in_chunks():
+    path = os.path.join(tempfile.mkdtemp(), "cp.jsonl")
+    manager = FakeManager()
+    builder = _build(manager, path, ["A - Uno", "", "A - Uno", "B - missing", ALBUM, "C - Tres"])
+    assert builder.found == 3 and builder.with_bpm == 3
+    assert [pid for pid, _ in manager.added] == [None, "new-playlist"]  # Created once, then extended
+    assert sum(len(uris) for _, uris in manager.added) == 4
+    records = [json.loads(l) for l in open(path)]
+    assert records[-1] == {'playlist_id': "new-playlist", 'added': 4}
+
+
+def test_resume_skips_searched_lines_and_pending_adds():
+    path = os.path.join(tempfile.mkdtemp(), "cp.jsonl")
+    lines = [f"Artist - Song {i}" for i in range(5)]
+    first = FakeManager(fail_on_add=1)
+    try:
+        _build(first, path, lines)
+    except KeyboardInterrupt:
+        pass
+    with open(path, "a") as f:
+        f.write('{"line": "torn')  # Killed mid-write
+
+    second = FakeManager()
+    _build(second, path, lines)
+    assert not set(second.searched) & set(first.searched)
+    assert second.added[0][0] == "new-playlist"  # Resolved-but-unadded URIs go to the same playlist
+    added = [u for _, uris in first.added + second.added for u in uris]
+    assert len(added) == len(set(added)) == 5
+    assert Checkpoint(path).added == 5
+
+
+def test_failed_lines_are_retried_on_resume():
+    path = os.path.join(tempfile.mkdtemp(), "cp.jsonl")
+    lines = ["A - Uno", "B - Dos", "C - Tres", "D - Cuatro", "E - timeout"]
+    first = FakeManager(fail_on="B - Dos")
+    builder = _build(first, path, lines)
+    assert builder.failed == 3 and builder.found == 2 and builder.resolved == 5
+    assert sum(len(uris) for _, uris in first.added) == 2  # The next chunk still went in
+    assert "Error" in builder.out.getvalue()
+    assert set(Checkpoint(path).lines) == {"C - Tres", "D - Cuatro"}
+
+    second = FakeManager()
+    _build(second, path, lines)
+    assert sorted(second.searched) == ["A - Uno", "B - Dos", "E - timeout"]
+    assert Checkpoint(path).lines["A - Uno"] and "E - timeout" not in Checkpoint(path).lines
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
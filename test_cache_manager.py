@@ -0,0 +1,34 @@
+import time
+
+import cachelib
+
+from cache_manager import TwoTierCache
+
+
+def _worker(shared):
+    cache = TwoTierCache('test', ttl=3600)
+    cache._shared = shared  # Stands in for the backend shared between workers
+    return cache
+
+
+def test_shared_hit_is_promoted_briefly():
+    shared = cachelib.SimpleCache()
+    writer, reader = _worker(shared), _worker(shared)
+    writer.set("error-marker", [], ttl=60)
+    assert reader.get("error-marker") == [] and reader.shared_hits == 1
+    _, expires_at = reader.local._data["error-marker"]
+    assert expires_at <= time.time() + TwoTierCache.PROMOTE_TTL
+
+
+def test_local_set_keeps_its_ttl():
+    cache = _worker(cachelib.SimpleCache())
+    cache.set("k", 1)
+    _, expires_at = cache.local._data["k"]
+    assert expires_at > time.time() + 3000
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
@@ -0,0 +1,90 @@
+import json
+
+import requests
+from spotipy import Spotify
+
+from cache_manager import TTLCache
+from conditional_session import ConditionalSession
+
+
+class FakeSpotifyAdapter(requests.adapters.BaseAdapter):
+    """Responde como la API: ETag por recurso y 304 si If-None-Match coincide"""
+
+    def __init__(self):
+        super().__init__()
+        self.bodies = {
+            '/v1/me/': {'id': 'user1', 'display_name': 'User'},
+            '/v1/playlists/abc': {'id': 'abc', 'name': 'Mix', 'tracks': {'total': 1}},
+        }
+        self.seen = []
+
+    def send(self, request, **kwargs):
+        path = request.path_url.split('?')[0]
+        body = json.dumps(self.bodies[path]).encode()
+        etag = f'"{hash(body)}"'
+        self.seen.append((path, request.headers.get('If-None-Match'), request.headers.get('Authorization')))
+
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.headers['ETag'] = etag
+        if request.headers.get('If-None-Match') == etag:
+            response.status_code = 304
+            response._content = b''
+        else:
+            response.status_code = 200
+            response.headers['Content-Type'] = 'application/json'
+            response._content = body
+        return response
+
+    def close(self):
+        pass
+
+
+def _session():
+    session = ConditionalSession(retries=0)
+    session.store = TTLCache(maxsize=100, ttl=3600)
+    adapter = FakeSpotifyAdapter()
+    session.mount('https://api.spotify.com', adapter)
+    return session, adapter
+
+
+def test_revalidates_and_serves_stored_body():
+    session, adapter = _session()
+    sp = Spotify(auth='token-1', requests_session=session)
+    assert sp.playlist('abc')['name'] == 'Mix'
+    assert sp.playlist('abc')['name'] == 'Mix'
+    assert adapter.seen[1][1] is not None  # Second read was conditional
+    assert session.not_modified == 1 and session.bytes_saved > 0
+
+    adapter.bodies['/v1/playlists/abc']['name'] = 'Renamed'
+    assert sp.playlist('abc')['name'] == 'Renamed'  # Changed upstream: new ETag, full body
+
+
+def test_entries_are_per_user_and_survive_token_refresh():
+    session, adapter = _session()
+    assert Spotify(auth='token-1', requests_session=session).current_user()['id'] == 'user1'
+    Spotify(auth='token-1', requests_session=session).playlist('abc')
+
+    # Same user after a token refresh: once /me maps the token, stored entries are reused
+    refreshed = Spotify(auth='token-2', requests_session=session)
+    refreshed.current_user()
+    refreshed.playlist('abc')
+    assert adapter.seen[-1][1] is not None
+
+    # Another user's token never sees them until its own /me
+    Spotify(auth='token-3', requests_session=session).playlist('abc')
+    assert adapter.seen[-1][1] is None
+
+
+def test_writes_are_not_cached():
+    session, adapter = _session()
+    assert not session.CACHEABLE_RE.match('https://api.spotify.com/v1/search')
+    assert session.CACHEABLE_RE.match('https://api.spotify.com/v1/playlists/abc/items')
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
@@ -0,0 +1,58 @@
+import base64
+import io
+
+from PIL import Image
+
+from cover_engine import CoverEngine, encode_jpeg, is_cover_url, recompress
+
+
+def test_only_spotify_cdn_urls_are_fetched():
+    assert is_cover_url("https://i.scdn.co/image/ab67616d0000b273abcdef")
+    assert is_cover_url("https://mosaic.scdn.co/640/ab67616d0000b273abc")
+    assert is_cover_url("https://image-cdn-ak.spotifycdn.com/image/ab67706c0000da84abc")
+    for url in ("http://i.scdn.co/image/abc",                  # Not https
+                "https://169.254.169.254/latest/meta-data",
+                "https://localhost:5000/debug/stats",
+                "https://i.scdn.co.evil.com/image/abc",
+                "https://i.scdn.co:8443/image/abc",
+                "https://user@i.scdn.co/image/abc",
+                "file:///etc/passwd", "", None):
+        assert not is_cover_url(url), url
+
+
+def test_fetch_skips_rejected_urls():
+    # Nothing allowed is left, so no request is made at all
+    assert CoverEngine().fetch_thumbnails(["http://127.0.0.1/", "https://internal.local/x.jpg"]) == []
+
+
+def test_recompress_rejects_decompression_bombs():
+    buf = io.BytesIO()
+    Image.new('1', (5000, 5000)).save(buf, 'PNG')  # Tiny file, 25M pixels once decoded
+    try:
+        recompress(base64.b64encode(buf.getvalue()))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("oversized image was decoded")
+
+    buf = io.BytesIO()
+    Image.new('RGB', (800, 800), (200, 10, 10)).save(buf, 'PNG')
+    assert recompress(base64.b64encode(buf.getvalue()))[:2] == b'\xff\xd8'
+
+
+def test_encode_jpeg_fails_clearly_when_nothing_fits():
+    noise = Image.effect_noise((640, 640), 100).convert('RGB')
+    assert len(encode_jpeg(noise)) * 4 / 3 <= 256 * 1024
+    try:
+        encode_jpeg(noise, max_b64_bytes=200)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("an image over the budget must not come back as None")
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
@@ -0,0 +1,140 @@
+import threading
+import time
+
+from cache_manager import TTLCache
+from enrichment import EnrichmentPipeline, EnrichmentSource, SourceUnavailable
+from spotify_manager import SpotifyManager
+
+
+class FakeSource(EnrichmentSource):
+    def __init__(self, name, bpm=120, delay=0.0, fail=False):
+        super().__init__()
+        self.name = name
+        self.bpm = bpm
+        self.delay = delay
+        self.fail = fail
+        self.fetches = 0
+        self._count_lock = threading.Lock()
+
+    def fetch(self, artist, name, duration_ms=None):
+        with self._count_lock:
+            self.fetches += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise SourceUnavailable("HTTP 503")
+        return self.bpm
+
+
+def _pipeline(*sources):
+    pipeline = EnrichmentPipeline(sources, max_workers=8)
+    pipeline.cache = TTLCache(maxsize=100, ttl=3600)  # The shared tier persists between runs
+    return pipeline
+
+
+def _open(source):
+    source.fail = True
+    for _ in range(source.FAILURE_THRESHOLD):
+        source.call("A", "B")
+    source.fail = False
+
+
+def test_circuit_opens_after_consecutive_failures():
+    source = FakeSource('s')
+    _open(source)
+    assert not source.available() and source.stats()['circuit_open']
+    assert source.call("A", "B") is None
+    assert source.fetches == source.FAILURE_THRESHOLD  # Open: no upstream call
+
+
+def test_half_open_lets_one_probe_through():
+    source = FakeSource('s', delay=0.2)
+    _open(source)
+    source.open_until = time.time() - 1  # Cooldown over
+    assert source.available()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(source.call("A", "B"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert source.fetches == source.FAILURE_THRESHOLD + 1
+    assert sorted(results, key=str) == [120] + [None] * 7
+    # The probe succeeded: closed again, everyone passes
+    assert source.open_until == 0 and source.available()
+    assert source.call("A", "B") == 120
+
+
+def test_failed_probe_reopens():
+    source = FakeSource('s')
+    _open(source)
+    source.open_until = time.time() - 1
+    source.fail = True
+    assert source.call("A", "B") is None
+    assert not source.available() and source.open_until > time.time()
+
+
+def test_slow_primary_is_hedged():
+    primary, secondary = FakeSource('slow', bpm=100, delay=0.5), FakeSource('fast', bpm=128)
+    primary.DEFAULT_P90 = 0.05  # Hedge after 50 ms without an answer
+    pipeline = _pipeline(primary, secondary)
+    start = time.perf_counter()
+    assert pipeline.lookup("A", "B") == 128
+    assert time.perf_counter() - start < 0.4
+    assert (pipeline.hedges, pipeline.hedge_wins) == (1, 1)
+
+
+def test_fast_primary_is_not_hedged():
+    primary, secondary = FakeSource('p', bpm=100), FakeSource('s', bpm=128)
+    pipeline = _pipeline(primary, secondary)
+    assert pipeline.lookup("A", "B") == 100
+    assert secondary.fetches == 0 and pipeline.hedges == 0
+
+
+def test_concurrent_lookups_share_one_upstream_call():
+    source = FakeSource('s', delay=0.2)
+    pipeline = _pipeline(source)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pipeline.lookup("A", "B"))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [120] * 5
+    assert source.fetches == 1 and pipeline.coalesced == 4
+
+
+def _deezer(details):
+    """SpotifyManager cuyo /track de Deezer responde desde `details` ({id: bpm o excepción})"""
+    manager = SpotifyManager()
+
+    def fake_json(url, timeout):
+        value = details[int(url.rsplit('/', 1)[-1])]
+        if isinstance(value, Exception):
+            raise value
+        return {'bpm': value}
+
+    manager._deezer_json = fake_json
+    return manager
+
+
+def test_failed_candidate_falls_through_to_next():
+    manager = _deezer({1: SourceUnavailable("timeout"), 2: 0, 3: 124})
+    assert manager._first_deezer_bpm([{'id': 1}, {'id': 2}, {'id': 3}]) == 124
+    assert _deezer({1: SourceUnavailable("timeout"), 2: 0})._first_deezer_bpm([{'id': 1}, {'id': 2}]) == 0
+
+
+def test_all_candidates_failing_raises():
+    manager = _deezer({1: SourceUnavailable("quota"), 2: SourceUnavailable("quota")})
+    try:
+        manager._first_deezer_bpm([{'id': 1}, {'id': 2}])
+    except SourceUnavailable:
+        pass
+    else:
+        raise AssertionError("a source-wide failure must reach the circuit breaker")
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
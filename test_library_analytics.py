@@ -0,0 +1,196 @@
+import threading
+
+from cache_manager import TTLCache
+from library_analytics import CAMELOT, KEYS, LibraryAnalytics, analyze, key_index, playlist_columns
+from spotify_manager import SpotifyManager
+from vibe import VibeAggregate
+
+
+def _agg(tracks):
+    """tracks: [(id, bpm)] o [(id, bpm, energy, danceability)]"""
+    agg = VibeAggregate()
+    for t in tracks:
+        agg.add(t[0], t[1])
+        if len(t) == 4:
+            agg.enrich(t[0], energy=t[2], danceability=t[3])
+    return agg
+
+
+class FakeManager:
+    def __init__(self, library):
+        self.user = {'id': 'u1'}
+        self.library = library  # {playlist_id: (snapshot_id, [(id, bpm, key)])}
+        self.track_loads = []
+        self.vibes = {}
+        self.gates = {}  # {playlist_id: threading.Event} holding its track load until set
+        self.failing = set()
+
+    def get_user_playlists(self, use_cache=True):
+        return [{'id': pid, 'name': pid.upper(), 'snapshot_id': snap} for pid, (snap, _) in self.library.items()]
+
+    def get_playlist_tracks(self, playlist_id, snapshot_id=None, raise_errors=False):
+        self.track_loads.append(playlist_id)
+        if playlist_id in self.failing:
+            if raise_errors:
+                raise RuntimeError("http status: 429")
+            return []
+        if playlist_id in self.gates:
+            self.gates[playlist_id].wait(5)
+        return [{'id': i, 'artist': 'A', 'name': i, 'isrc': f"ISRC{i}"} for i, _, _ in self.library[playlist_id][1]]
+
+    def playlist_vibe(self, playlist_id, snapshot_id=None, tracks=None, build=True):
+        agg = self.vibes.get(playlist_id)
+        if agg is not None and agg.snapshot_id == snapshot_id:
+            return agg
+        if tracks is None:
+            return None
+        agg = self.vibes[playlist_id] = VibeAggregate.from_tracks(tracks, snapshot_id)
+        return agg
+
+    def update_playlist_vibe(self, playlist_id, update, snapshot_id=None, previous_snapshot=None):
+        agg = self.vibes.get(playlist_id)
+        if agg is not None:
+            update(agg)
+        return agg
+
+    def cached_bpm(self, artist, name, isrc=None):
+        return {i: bpm for _, tracks in self.library.values() for i, bpm, _ in tracks}[name]
+
+    def cached_key(self, isrc):
+        return {f"ISRC{i}": key for _, tracks in self.library.values() for i, _, key in tracks}.get(isrc)
+
+
+def _analytics():
+    analytics = LibraryAnalytics()
+    analytics.cache = TTLCache(maxsize=100, ttl=3600)  # The shared tier persists between runs
+    return analytics
+
+
+def test_camelot_wheel():
+    assert [CAMELOT[key_index(k)] for k in ('C', 'Am', 'G', 'Em', 'B', 'F#m', 'F', 'Dm')] == \
+        ['8B', '8A', '9B', '9A', '1B', '11A', '7B', '7A']
+    assert key_index('Bbm') == KEYS.index('A#m') and key_index('?') == -1
+
+
+def test_library_counts_each_track_once():
+    a = playlist_columns(_agg([('t1', 100), ('t2', 120), ('t3', 0)]), {'t1': key_index('Am')})
+    b = playlist_columns(_agg([('t2', 120), ('t4', 140, 80, 70), ('t5', 180)]), {'t2': key_index('C')})
+    result = analyze([({'id': 'a'}, a), ({'id': 'b'}, b)])
+
+    assert result['tracks'] == 5 and result['with_bpm'] == 4
+    assert result['bpm']['mean'] == (100 + 120 + 140 + 180) / 4
+    assert result['bpm']['percentiles']['p50'] == 120
+    assert sum(result['bpm']['histogram']['counts']) == 4
+    assert result['keys']['Am'] == 1 and result['camelot']['8A'] == 1 and result['camelot']['8B'] == 1
+    assert result['with_features'] == 1
+
+    pa, pb = result['per_playlist']
+    assert (pa['tracks'], pa['with_bpm'], pa['bpm_p50']) == (3, 2, 100)
+    assert pb['bpm_mean'] == round((120 + 140 + 180) / 3, 1)
+    assert pb['bpm_p10'] == 120 and pb['bpm_p90'] == 140 and pb['bpm_vs_library'] == 140 - 120
+    assert pa['top_camelot'] == '8A' and pb['top_key'] == 'C'
+
+
+def test_empty_library():
+    result = analyze([({'id': 'empty'}, playlist_columns(VibeAggregate()))])
+    assert result['tracks'] == 0 and result['bpm']['percentiles']['p50'] == 0
+    assert result['per_playlist'][0]['top_key'] is None
+
+
+def test_cached_by_snapshot_set():
+    manager = FakeManager({'p1': ('s1', [('t1', 100, 'Am'), ('t2', 124, None)]),
+                           'p2': ('s1', [('t2', 124, None), ('t3', 128, 'G')])})
+    analytics = _analytics()
+    first = analytics.library(manager)
+    assert first['tracks'] == 3 and first['with_key'] == 2
+    assert analytics.library(manager) is first
+    assert sorted(manager.track_loads) == ['p1', 'p2']
+
+    # One playlist changed: only its columns are rebuilt
+    manager.library['p2'] = ('s2', [('t3', 128, 'G'), ('t4', 90, 'Em')])
+    second = analytics.library(manager)
+    assert second['tracks'] == 4 and second['camelot']['9A'] == 1
+    assert sorted(manager.track_loads) == ['p1', 'p2', 'p2']
+    assert analytics.stats()['computed'] == 2 and analytics.stats()['cached'] == 1
+
+
+def test_new_bpms_on_the_same_snapshot():
+    manager = FakeManager({'p1': ('s1', [('t1', 100, None), ('t2', 0, None)])})
+    analytics = _analytics()
+    assert analytics.library(manager)['with_bpm'] == 1
+
+    # Enrichment found t2 afterwards: refresh folds it in instead of reusing the columns
+    manager.library['p1'] = ('s1', [('t1', 100, None), ('t2', 124, None)])
+    assert analytics.library(manager)['with_bpm'] == 1
+    assert analytics.library(manager, refresh=True)['with_bpm'] == 2
+    assert manager.vibes['p1'].bpm_of('t2') == 124
+
+    # A report enriches the stored aggregate: its columns are rebuilt even without refresh
+    manager.update_playlist_vibe('p1', lambda agg: agg.enrich('t1', bpm=98))
+    assert analytics.load_columns(manager, {'id': 'p1', 'snapshot_id': 's1'})['bpm'].tolist() == [98, 124]
+    assert manager.track_loads == ['p1'] * 3
+
+
+def test_cold_library_answers_by_the_deadline():
+    manager = FakeManager({'p1': ('s1', [('t1', 100, None)]), 'p2': ('s1', [('t2', 124, None)])})
+    manager.gates['p2'] = threading.Event()
+    analytics = _analytics()
+    analytics.DEADLINE = 0.1
+
+    partial = analytics.library(manager)
+    assert partial['pending'] == 1 and [p['id'] for p in partial['per_playlist']] == ['p1']
+    assert analytics.library(manager)['pending'] == 1  # Not cached, and p2 is not loaded twice
+    assert manager.track_loads == ['p1', 'p2']
+
+    manager.gates['p2'].set()
+    for future in list(analytics._loading.values()):
+        future.result()
+    full = analytics.library(manager)
+    assert full['pending'] == 0 and full['tracks'] == 2
+    assert analytics.library(manager) is full
+    assert analytics.stats()['partial'] == 2 and analytics.stats()['loading'] == 0
+
+
+def test_failed_track_fetch_stays_pending():
+    manager = FakeManager({'p1': ('s1', [('t1', 100, None)]), 'p2': ('s1', [('t2', 124, None)])})
+    manager.failing.add('p2')
+    analytics = _analytics()
+    partial = analytics.library(manager)
+    assert partial['pending'] == 1 and partial['tracks'] == 1
+    assert 'p2' not in manager.vibes and analytics.cache.get("cols:p2:s1") is None
+    assert analytics.stats()['computed'] == 0
+
+    manager.failing.clear()
+    assert analytics.library(manager)['pending'] == 0 and analytics.stats()['computed'] == 1
+
+
+class FailingSpotify:
+    def playlist_items(self, playlist_id, **kwargs):
+        raise RuntimeError("http status: 429, rate limited")
+
+
+def test_spotify_error_is_not_stored_as_an_empty_playlist():
+    shared_cache = SpotifyManager._tracks_cache
+    SpotifyManager._tracks_cache = TTLCache(maxsize=100, ttl=3600)  # No shared state between runs
+    try:
+        manager = SpotifyManager()
+        manager.sp = FailingSpotify()
+        analytics = _analytics()
+        try:
+            analytics.load_columns(manager, {'id': 'p1', 'snapshot_id': 's1'})
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("a failed fetch must not load as an empty playlist")
+        assert manager.playlist_vibe('p1', 's1', build=False) is None
+        assert analytics.cache.get("cols:p1:s1") is None
+        assert manager.get_playlist_tracks('p1', 's1') == []  # Callers that render keep the old contract
+    finally:
+        SpotifyManager._tracks_cache = shared_cache
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
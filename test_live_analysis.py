@@ -0,0 +1,78 @@
+from live_analysis import LiveAnalysis
+
+
+class FakeArtists:
+    def __init__(self):
+        self.fail = False
+
+    def artists(self, ids):
+        if self.fail:
+            raise RuntimeError("Spotify 503")
+        return {'artists': [{'id': i, 'genres': ['pop']} for i in ids]}
+
+
+class FakeManager:
+    def __init__(self):
+        self.sp = FakeArtists()
+        self.failing_searches = set()
+        self.failing_bpm = set()
+        self.searches = []
+        self.bpm_cache = {}
+
+    def search_tracks(self, queries, limit=5):
+        self.searches.extend(queries)
+        results = []
+        for q in queries:
+            if q in self.failing_searches:
+                results.append({'query': q, 'matches': [], 'error': True})
+            elif q.startswith('nothing'):
+                results.append({'query': q, 'matches': []})
+            else:
+                results.append({'query': q, 'matches': [{'id': f"id-{q}", 'artist': 'A', 'name': q,
+                                                         'artist_ids': [f"a-{q}"], 'isrc': None}]})
+        return results
+
+    def fetch_bpm(self, artist, name, duration_ms=None, isrc=None):
+        if name in self.failing_bpm:
+            return 0  # No source answered: nothing is cached
+        self.bpm_cache[name] = 120
+        return 120
+
+    def cached_bpm(self, artist, name, isrc=None):
+        return self.bpm_cache.get(name)
+
+
+def test_failed_lookups_are_retried():
+    manager = FakeManager()
+    manager.failing_searches.add("down")
+    manager.failing_bpm.add("slow")
+    analysis = LiveAnalysis()
+    lines = ["ok", "down", "slow", "nothing here"]
+    assert analysis.update(manager, lines) == 4
+    assert set(analysis.state) == {"ok", "nothing here"}   # Real no-match is kept
+    assert analysis.state["ok"]['bpm'] == 120 and analysis.state["ok"]['genres'] == ['pop']
+
+    manager.failing_searches.clear()
+    manager.failing_bpm.clear()
+    manager.searches.clear()
+    assert analysis.update(manager, lines) == 2
+    assert sorted(manager.searches) == ["down", "slow"]
+    assert analysis.summary(lines)['matched'] == 3
+
+
+def test_genre_errors_are_retried():
+    manager = FakeManager()
+    manager.sp.fail = True
+    analysis = LiveAnalysis()
+    analysis.update(manager, ["ok"])
+    assert analysis.state == {}
+    manager.sp.fail = False
+    analysis.update(manager, ["ok"])
+    assert analysis.state["ok"]['genres'] == ['pop']
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
@@ -0,0 +1,64 @@
+import io
+import json
+import logging
+
+from flask import Flask
+
+from log_config import get_logger, init_request_logging, setup_logging, shutdown_logging
+
+
+def _lines(stream):
+    shutdown_logging()  # Stops the listener after it drains the queue
+    return [json.loads(l) for l in stream.getvalue().splitlines()]
+
+
+def test_structured_records_carry_request_context():
+    stream = io.StringIO()
+    setup_logging(level='DEBUG', sample_rate=1.0, fmt='json', stream=stream)
+    app = Flask(__name__)
+    init_request_logging(app)
+    log = get_logger('test')
+
+    @app.route('/items/<item_id>')
+    def item(item_id):
+        log.warning("Upstream failed: %s", "timeout", extra={'upstream': 'spotify', 'latency_ms': 12.5})
+        return "ok"
+
+    response = app.test_client().get('/items/1', headers={'X-Request-ID': 'abc123'})
+    assert response.headers['X-Request-ID'] == 'abc123'
+    warning, access = _lines(stream)
+    assert warning['msg'] == "Upstream failed: timeout"
+    assert (warning['request_id'], warning['route'], warning['upstream']) == ('abc123', '/items/<item_id>', 'spotify')
+    assert access['level'] == 'DEBUG' and access['status'] == 200 and 'latency_ms' in access
+
+
+def test_tracebacks_are_rendered_before_queueing():
+    stream = io.StringIO()
+    setup_logging(level='INFO', fmt='json', stream=stream)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        get_logger('test').error("Failed", exc_info=True)
+    (record,) = _lines(stream)
+    assert "ValueError: boom" in record['exc']
+
+
+def test_levels_and_sampling():
+    stream = io.StringIO()
+    logger = setup_logging(env='production', level=None, sample_rate=0.0, fmt='json', stream=stream)
+    assert logger.level == logging.INFO
+    log = get_logger('test')
+    log.debug("dropped by level")
+    logger.setLevel(logging.DEBUG)
+    for _ in range(100):
+        log.debug("dropped by sampling")
+    log.info("kept")
+    assert [r['msg'] for r in _lines(stream)] == ["kept"]
+    setup_logging()  # Back to the defaults for the rest of the run
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
@@ -0,0 +1,94 @@
+import random
+import time
+
+from playlist_diff import apply_plan, longest_increasing_subsequence, plan_playlist_edit
+
+
+def _uris(n, prefix="t"):
+    return [f"spotify:track:{prefix}{i}" for i in range(n)]
+
+
+def test_lis():
+    values = [3, 1, 4, 1, 5, 9, 2, 6]
+    idx = longest_increasing_subsequence(values)
+    picked = [values[i] for i in idx]
+    assert len(picked) == 4
+    assert picked == sorted(picked)
+
+
+def test_small_edit_on_large_playlist():
+    old = _uris(3000)
+    new = list(old)
+    new.remove(old[1500])                     # Quitar una
+    new.insert(10, new.pop(2500))             # Mover una
+    new.insert(200, "spotify:track:nueva")    # Añadir una
+    ops = plan_playlist_edit(old, new)
+    assert apply_plan(old, ops) == new
+    assert len(ops) == 3
+    assert [op['op'] for op in ops] == ['remove', 'reorder', 'add']
+
+
+def test_duplicates_remove_specific_occurrence():
+    old = ["a", "b", "a", "c", "a"]
+    new = ["a", "b", "a", "c"]
+    ops = plan_playlist_edit(old, new)
+    assert apply_plan(old, ops) == new
+    assert ops == [{'op': 'remove', 'items': [{'uri': 'a', 'positions': [4]}]}]
+
+
+def test_contiguous_block_is_one_move():
+    old = _uris(500)
+    new = old[100:150] + old[:100] + old[150:]
+    ops = plan_playlist_edit(old, new)
+    assert apply_plan(old, ops) == new
+    assert len(ops) == 1
+
+
+def test_chunks_respect_api_limits():
+    old = _uris(50)
+    new = old + _uris(250, prefix="n")
+    ops = plan_playlist_edit(old, new)
+    assert apply_plan(old, ops) == new
+    assert all(len(op.get('uris', [])) <= 100 for op in ops)
+
+
+def test_falls_back_to_replace_when_cheaper():
+    old = _uris(300)
+    new = _uris(30, prefix="n")
+    ops = plan_playlist_edit(old, new)
+    assert apply_plan(old, ops) == new
+    assert [op['op'] for op in ops] == ['replace']
+
+
+def test_full_reshuffle_skips_move_planning():
+    old = _uris(10000)
+    new = list(old)
+    random.Random(3).shuffle(new)
+    start = time.perf_counter()
+    ops = plan_playlist_edit(old, new)
+    assert time.perf_counter() - start < 1.0
+    assert ops[0]['op'] == 'replace' and apply_plan(old, ops) == new
+
+
+def test_unavailable_tracks_stay_in_place():
+    old = ["a", None, "b", "c", None, "d"]
+    ops = plan_playlist_edit(old, ["d", "c", "b", "x"])
+    assert apply_plan(old, ops) == ["d", None, "c", "b", None, "x"]
+    assert all(item['uri'] for op in ops if op['op'] == 'remove' for item in op['items'])
+    assert all(op['op'] != 'replace' for op in ops)
+
+
+def test_random_edits_roundtrip():
+    rnd = random.Random(7)
+    for _ in range(200):
+        pool = _uris(40)
+        old = [rnd.choice(pool) for _ in range(rnd.randint(0, 60))]
+        new = [rnd.choice(pool) for _ in range(rnd.randint(0, 60))]
+        assert apply_plan(old, plan_playlist_edit(old, new)) == new
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
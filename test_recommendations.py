@@ -0,0 +1,69 @@
+from cache_manager import TTLCache
+from spotify_manager import SpotifyManager
+
+
+class FakeSpotify:
+    def __init__(self):
+        self.calls = []
+
+    def playlist_items(self, playlist_id, limit=100, offset=0, fields=None, additional_types=None):
+        self.calls.append(('playlist_items', limit, fields))
+        return {'items': [{'track': {'id': f"t{i}"}} for i in range(limit)]}
+
+    def recommendations(self, seed_tracks, limit=10):
+        self.calls.append(('recommendations', tuple(seed_tracks)))
+        return {'tracks': [{'id': 'r1', 'uri': 'spotify:track:r1', 'name': 'Rec', 'artists': [{'name': 'A'}],
+                            'album': {'images': []}, 'preview_url': None,
+                            'external_urls': {'spotify': 'https://open.spotify.com/track/r1'}}]}
+
+
+def _manager():
+    manager = SpotifyManager()
+    manager.sp = FakeSpotify()
+    return manager
+
+
+def _isolated(fn):
+    """Cachés solo en proceso durante el test (el nivel compartido persiste entre ejecuciones)"""
+    def wrapper():
+        saved = SpotifyManager._tracks_cache, SpotifyManager._recs_cache
+        SpotifyManager._tracks_cache = TTLCache(maxsize=100, ttl=3600)
+        SpotifyManager._recs_cache = TTLCache(maxsize=100, ttl=3600)
+        try:
+            fn()
+        finally:
+            SpotifyManager._tracks_cache, SpotifyManager._recs_cache = saved
+    wrapper.__name__ = fn.__name__
+    return wrapper
+
+
+@_isolated
+def test_seeds_need_one_small_page_then_none():
+    manager = _manager()
+    assert manager.get_seed_track_ids("p1") == ["t0", "t1", "t2", "t3", "t4"]
+    assert manager.sp.calls == [('playlist_items', 5, SpotifyManager.SEED_FIELDS)]
+    manager.get_seed_track_ids("p1")
+    assert len(manager.sp.calls) == 1
+
+    manager.invalidate_playlists_cache("p1")  # Edited: the first tracks may have changed
+    manager.get_seed_track_ids("p1")
+    assert len(manager.sp.calls) == 2
+
+
+@_isolated
+def test_recommendations_cached_per_seed_set():
+    manager = _manager()
+    first = manager.get_recommendations(["b", "a"], limit=12)
+    assert manager.get_recommendations(["a", "b"], limit=12) == first
+    assert [c[0] for c in manager.sp.calls] == ['recommendations']
+    first[0]['bpm'] = 120  # Callers may annotate results without touching the cache
+    assert 'bpm' not in manager.get_recommendations(["a", "b"], limit=12)[0]
+    manager.get_recommendations(["a", "c"], limit=12)
+    assert len(manager.sp.calls) == 2
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
@@ -0,0 +1,39 @@
+import cachelib
+
+from search_tracker import SearchTracker
+
+
+def _tracker():
+    tracker = SearchTracker()
+    tracker._shared = cachelib.SimpleCache()  # The shared tier persists between runs
+    return tracker
+
+
+def test_newer_seq_supersedes():
+    tracker = _tracker()
+    key = SearchTracker.client_key("sid", "p1", "page-a")
+    first = tracker.begin(key, 1)
+    second = tracker.begin(key, 2)
+    assert first.is_superseded() and not second.is_superseded()
+
+
+def test_reloaded_page_starts_fresh():
+    tracker = _tracker()
+    old_page = SearchTracker.client_key("sid", "p1", "page-a")
+    for seq in range(1, 16):
+        tracker.begin(old_page, seq)
+    # Reload or second tab: seq starts again at 1 under a new page id
+    assert not tracker.begin(SearchTracker.client_key("sid", "p1", "page-b"), 1).is_superseded()
+    assert tracker.begin(old_page, 1).is_superseded()
+
+
+def test_page_id_is_sanitized():
+    assert SearchTracker.client_key("sid", "new", "a:b/" + "x" * 50) == "sid:new:ab" + "x" * 30
+    assert SearchTracker.client_key("sid", "new") == "sid:new:"
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
@@ -0,0 +1,79 @@
+from cache_manager import TTLCache
+from spotify_manager import SpotifyManager
+
+GOOD = "4uLU6hMCjMI75M1A2tKUQC"
+BAD = "0000000000000000000000"
+
+
+def _item(track_id):
+    return {'id': track_id, 'uri': f"spotify:track:{track_id}", 'name': f"Song {track_id[:4]}",
+            'artists': [{'id': 'a1', 'name': 'Artist'}], 'album': {'name': 'Album', 'images': []},
+            'duration_ms': 200000, 'preview_url': None}
+
+
+class FakeSpotify:
+    def __init__(self):
+        self.calls = []
+
+    def tracks(self, ids):
+        self.calls.append(('tracks', len(ids)))
+        if BAD in ids:
+            raise RuntimeError("http status: 400, invalid id")
+        return {'tracks': [_item(i) for i in ids]}
+
+    def track(self, track_id):
+        self.calls.append(('track', track_id))
+        if track_id == BAD:
+            raise RuntimeError("http status: 404, non existing id")
+        return _item(track_id)
+
+    def search(self, q, limit=10, type='track'):
+        return {'tracks': {'items': [_item(GOOD)]}}
+
+
+def _manager():
+    manager = SpotifyManager()
+    manager.sp = FakeSpotify()
+    return manager
+
+
+def test_parse_spotify_link():
+    parse = SpotifyManager.parse_spotify_link
+    assert parse(f"https://open.spotify.com/track/{GOOD}?si=abc") == ('track', GOOD)
+    assert parse(f"https://open.spotify.com/intl-es/track/{GOOD}") == ('track', GOOD)
+    assert parse(f"https://open.spotify.com/embed/album/{GOOD}") == ('album', GOOD)
+    assert parse(f"spotify:playlist:{GOOD}") == ('playlist', GOOD)
+    assert parse("Daft Punk - One More Time") is None
+    assert parse("https://open.spotify.com/track/tooShort") is None
+    assert parse(None) is None
+
+
+def test_bad_id_only_fails_its_own_line():
+    manager = _manager()
+    saved, SpotifyManager._search_cache = SpotifyManager._search_cache, TTLCache(maxsize=100, ttl=3600)
+    try:
+        _check_bad_id(manager)
+    finally:
+        SpotifyManager._search_cache = saved
+
+
+def _check_bad_id(manager):
+    lines = [f"spotify:track:{GOOD}", f"https://open.spotify.com/track/{BAD}", "Artist - Song"]
+    results = manager.resolve_song_lines(lines, limit=1)
+    assert [len(r['matches']) for r in results] == [1, 0, 1]
+    assert results[0]['matches'][0]['id'] == GOOD
+    # The batch failed once, then each id was looked up on its own
+    assert manager.sp.calls[:3] == [('tracks', 2), ('track', GOOD), ('track', BAD)]
+
+
+def test_good_batch_is_one_call():
+    manager = _manager()
+    assert set(manager.get_tracks_bulk([GOOD, GOOD])) == {GOOD}
+    assert manager.sp.calls == [('tracks', 1)]
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
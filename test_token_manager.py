@@ -0,0 +1,97 @@
+import threading
+import time
+import uuid
+
+from cachelib import SimpleCache
+
+from token_manager import TokenManager
+
+
+class FakeOAuth:
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def refresh_access_token(self, refresh_token):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return {'access_token': f"new-{uuid.uuid4().hex}", 'refresh_token': refresh_token,
+                'expires_at': int(time.time()) + 3600}
+
+
+def _token(expires_in):
+    return {'access_token': 'old', 'refresh_token': uuid.uuid4().hex, 'expires_at': int(time.time()) + expires_in}
+
+
+def _manager(oauth, shared=None):
+    """TokenManager con el nivel compartido en memoria (el de disco persiste entre ejecuciones)"""
+    manager = TokenManager(lambda: oauth)
+    manager.store._shared = shared if shared is not None else SimpleCache()
+    return manager
+
+
+def test_concurrent_expired_requests_refresh_once():
+    oauth = FakeOAuth()
+    manager = _manager(oauth)
+    token = _token(-10)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.get_token(token))) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert oauth.calls == 1
+    assert len({r['access_token'] for r in results}) == 1
+    assert manager.coalesced == 9
+
+
+def test_refreshed_token_is_shared_with_stale_sessions():
+    oauth = FakeOAuth(delay=0)
+    token = _token(-10)
+    shared = SimpleCache()
+    first = _manager(oauth, shared).get_token(token)
+    # Another worker (own process-local state) still holding the stale session token
+    other = _manager(oauth, shared)
+    assert other.get_token(token)['access_token'] == first['access_token']
+    assert oauth.calls == 1
+
+
+def test_proactive_refresh_does_not_block():
+    oauth = FakeOAuth(delay=0.3)
+    manager = _manager(oauth)
+    token = _token(120)  # Inside the proactive window, still valid
+    start = time.perf_counter()
+    assert manager.get_token(token) is token
+    assert manager.get_token(token) is token
+    assert time.perf_counter() - start < 0.1
+    time.sleep(0.5)
+    assert oauth.calls == 1
+    assert manager.get_token(token)['access_token'].startswith('new-')
+
+
+def test_valid_token_untouched():
+    oauth = FakeOAuth()
+    manager = _manager(oauth)
+    token = _token(3000)
+    assert manager.get_token(token) is token
+    assert oauth.calls == 0
+
+
+def test_fallback_refresh_keeps_other_workers_lock():
+    oauth = FakeOAuth(delay=0)
+    manager = _manager(oauth)
+    manager.LOCK_TIMEOUT, manager.WAIT_STEP = 1, 0.05
+    token = _token(-10)
+    lock_key = f"lock:{manager.key_for(token)}"
+    manager.store.shared.add(lock_key, "other-worker", timeout=60)  # Held by a stuck worker
+    assert manager.get_token(token)['access_token'].startswith('new-')
+    assert manager.store.shared.get(lock_key) == "other-worker"
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
@@ -0,0 +1,67 @@
+import json
+import pickle
+
+from track_records import TrackCollection, TrackJSONProvider, TrackRecord
+
+
+def _item(i, artist="Artist", album="Album"):
+    return {'track': {
+        'id': f"id{i}", 'uri': f"spotify:track:id{i}", 'name': f"Song {i}", 'preview_url': None,
+        'duration_ms': 200000, 'artists': [{'id': 'a1', 'name': artist}, {'id': 'a2', 'name': 'Feat'}],
+        'album': {'name': album, 'images': [{'url': 'big', 'width': 640}, {'url': 'mid', 'width': 300},
+                                            {'url': 'small', 'width': 64}]}
+    }}
+
+
+def test_record_behaves_like_a_dict():
+    t = TrackRecord(id="x", name="Song", artist="A")
+    assert t['name'] == "Song" and t.name == "Song"
+    assert t['bpm'] == 0 and t.get('key') == '?'
+    assert t.get('preview_url', '') == ''
+    assert t['external_url'] == "https://open.spotify.com/track/x"
+    t['bpm'] = 120
+    assert t.bpm == 120
+    try:
+        t['unknown'] = 1
+        assert False, "unknown keys must be rejected"
+    except KeyError:
+        pass
+    assert not hasattr(t, '__dict__')
+
+
+def test_playlist_items_share_strings():
+    items = [json.loads(json.dumps(_item(i))) for i in range(3)]  # Distinct string objects, as from the API
+    tracks = TrackCollection.from_playlist_items(items + [None, {'track': None}])
+    assert len(tracks) == 3
+    assert tracks[0].artist == "Artist"  # Playlist views keep only the main artist
+    assert tracks[0].artist is tracks[2].artist
+    assert tracks[0].image == "big"
+
+
+def test_pages_keep_unavailable_slots_and_small_images():
+    tracks = TrackCollection.from_playlist_items([_item(0), {'track': None}], image='smallest', keep_unavailable=True)
+    assert [t.name for t in tracks] == ["Song 0", "No disponible"]
+    assert tracks[0].image == "small"
+
+
+def test_copies_are_independent():
+    tracks = TrackCollection.from_playlist_items([_item(0)])
+    copy = tracks.copy()
+    copy[0]['bpm'] = 99
+    assert tracks[0]['bpm'] == 0
+    assert copy[0].name is tracks[0].name
+
+
+def test_pickle_and_json():
+    t = TrackCollection.record_from_api(_item(1)['track'])
+    assert t.artist == "Artist, Feat" and t.artist_ids == ('a1', 'a2')
+    assert pickle.loads(pickle.dumps(t)) == t
+    data = json.loads(json.dumps(t, default=TrackJSONProvider.default))
+    assert data['name'] == "Song 1" and 'preview_url' not in data
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
@@ -0,0 +1,65 @@
+from cache_manager import TTLCache
+from spotify_manager import SpotifyManager
+from vibe import VibeAggregate, vibe_from_bpm
+
+
+def _tracks(*bpms):
+    return [{'id': f"t{i}", 'bpm': bpm} for i, bpm in enumerate(bpms)]
+
+
+def test_summary_matches_full_recompute():
+    agg = VibeAggregate.from_tracks(_tracks(100, 120, 0, 140), snapshot_id="s1")
+    summary = agg.summary()
+    assert summary['bpm'] == vibe_from_bpm(120)['bpm']
+    assert summary['tracks'] == 4 and summary['with_bpm'] == 3
+    assert summary['bpm_p10'] < summary['bpm_p50'] < summary['bpm_p90']
+    assert sum(summary['histogram']['counts']) == 3
+
+
+def test_add_remove_enrich_are_incremental():
+    agg = VibeAggregate.from_tracks(_tracks(100, 120))
+    agg.add("t0")                      # Duplicate: counts twice, removed together
+    agg.add("new")                     # No BPM yet
+    assert agg.summary()['with_bpm'] == 3
+    agg.enrich("new", 160)
+    agg.remove("t0")
+    fresh = VibeAggregate.from_tracks([{'id': "t1", 'bpm': 120}, {'id': "new", 'bpm': 160}])
+    assert agg.summary() == fresh.summary()
+    agg.remove("missing")              # Unknown ids are ignored
+    agg.enrich("missing", 90)
+    assert agg.tracks == 2
+
+
+def test_analyzer_features_override_tempo_guess():
+    agg = VibeAggregate.from_tracks(_tracks(120, 120))
+    agg.enrich("t0", energy=20, danceability=40)
+    agg.enrich("t1", energy=30, danceability=50)
+    summary = agg.summary()
+    assert (summary['energy'], summary['danceability'], summary['valence']) == (25, 45, 35)
+    assert summary['bpm'] == 120
+    agg.add("t2", 120)                 # Not analyzed: its share falls back to the tempo guess
+    assert agg.summary()['energy'] == round((25 * 2 + vibe_from_bpm(120)['energy']) / 3)
+
+
+def test_manager_updates_stored_aggregate_only():
+    shared_cache = SpotifyManager._tracks_cache
+    SpotifyManager._tracks_cache = TTLCache(maxsize=100, ttl=3600)  # No shared state between runs
+    try:
+        manager = SpotifyManager()
+        assert manager.update_playlist_vibe("p1", lambda agg: agg.add("x")) is None
+        manager.playlist_vibe("p1", "s1", tracks=_tracks(100))
+        manager.update_playlist_vibe("p1", lambda agg: agg.add("x"), snapshot_id="s2", previous_snapshot="s1")
+        assert manager.playlist_vibe("p1", "s2", build=False).tracks == 2
+        assert manager.playlist_vibe("p1", "s3", build=False) is None
+        # Edited elsewhere since it was built (s2 -> s3 outside the app): dropped, not re-stamped
+        assert manager.update_playlist_vibe("p1", lambda agg: agg.add("y"), snapshot_id="s4",
+                                            previous_snapshot="s3") is None
+        assert manager.playlist_vibe("p1", build=False) is None
+    finally:
+        SpotifyManager._tracks_cache = shared_cache
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: OK")
@@ -0,0 +1,167 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_manager import TwoTierCache
+from log_config import get_logger
+
+log = get_logger(__name__)
+
+
+class TokenManager:
+    """
+    Refresco de tokens OAuth coalescido por usuario, entre hilos y workers.
+    El último token de cada concesión (clave: hash del refresh token) se
+    comparte por la caché de dos niveles. Cerca de caducar se renueva en
+    segundo plano, así las peticiones concurrentes no esperan al refresco.
+    """
+    REFRESH_MARGIN = 60        # Segundos: por debajo, hay que renovar antes de usarlo
+    PROACTIVE_WINDOW = 300     # Segundos: por debajo, se renueva en segundo plano
+    LOCK_TIMEOUT = 15          # Lock entre workers (por si el que lo tiene muere)
+    WAIT_STEP = 0.1
+
+    def __init__(self, oauth_factory):
+        self.oauth_factory = oauth_factory
+        self.store = TwoTierCache('oauth-tokens', maxsize=5000, ttl=24 * 3600)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._scheduled = set()
+        self._background = ThreadPoolExecutor(max_workers=2)
+        self.refreshes = 0
+        self.coalesced = 0
+        self.proactive = 0
+        self.failures = 0
+
+    @staticmethod
+    def key_for(token_info):
+        return hashlib.sha256(token_info['refresh_token'].encode()).hexdigest()[:32]
+
+    @staticmethod
+    def remaining(token_info):
+        return token_info.get('expires_at', 0) - time.time()
+
+    def _latest(self, key, token_info):
+        """El token más reciente conocido: el de la sesión, el local o el compartido"""
+        candidates = [token_info, self.store.local.get(key)]
+        try:
+            candidates.append(self.store.shared.get(key))
+        except Exception as e:
+            log.warning("Shared cache error (oauth-tokens): %s", e)
+        return max((c for c in candidates if c), key=lambda c: c.get('expires_at', 0))
+
+    def _lock_for(self, key):
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get_token(self, token_info):
+        """
+        Token válido para usar ya. Devuelve el mismo dict si no ha cambiado;
+        lanza excepción si hacía falta renovarlo y no se ha podido.
+        """
+        if not token_info.get('refresh_token'):
+            return token_info
+        key = self.key_for(token_info)
+        current = self._latest(key, token_info)
+        remaining = self.remaining(current)
+        if remaining > self.PROACTIVE_WINDOW:
+            return current
+        if remaining > self.REFRESH_MARGIN:
+            self._schedule(key, current)
+            return current
+        return self._refresh(key, current)
+
+    def _schedule(self, key, token_info):
+        with self._locks_guard:
+            if key in self._scheduled:
+                return
+            self._scheduled.add(key)
+
+        def run():
+            try:
+                self._refresh(key, token_info)
+                self.proactive += 1
+            except Exception as e:
+                log.warning("Background token refresh error: %s", e, extra={'upstream': 'spotify'})
+            finally:
+                with self._locks_guard:
+                    self._scheduled.discard(key)
+
+        self._background.submit(run)
+
+    def _refresh(self, key, token_info):
+        with self._lock_for(key):
+            # Another thread may have refreshed while we waited for the lock
+            latest = self._latest(key, token_info)
+            if self.remaining(latest) > self.PROACTIVE_WINDOW:
+                self.coalesced += 1
+                return latest
+
+            lock_key = f"lock:{key}"
+            acquired = self._acquire_shared(lock_key)
+            if not acquired:
+                refreshed = self._wait_for_other_worker(key, latest)
+                if refreshed:
+                    self.coalesced += 1
+                    return refreshed
+                # The other worker is slow or gone: refresh ourselves (its lock is not ours to drop)
+
+            try:
+                sp_oauth = self.oauth_factory()
+                if sp_oauth is None:
+                    return latest
+                new_token = sp_oauth.refresh_access_token(latest['refresh_token'])
+            except Exception:
+                self.failures += 1
+                raise
+            finally:
+                if acquired:
+                    self._release_shared(lock_key)
+
+            new_token.setdefault('refresh_token', latest['refresh_token'])
+            self.store.set(key, new_token)
+            new_key = self.key_for(new_token)
+            if new_key != key:  # Rotated refresh token: sessions holding the old one still find it
+                self.store.set(new_key, new_token)
+            self.refreshes += 1
+            return new_token
+
+    def _acquire_shared(self, lock_key):
+        try:
+            shared = self.store.shared
+            if shared.add(lock_key, time.time(), timeout=self.LOCK_TIMEOUT):
+                return True
+            # Expired lock files are only dropped on read (FileSystemCache)
+            return shared.get(lock_key) is None and shared.add(lock_key, time.time(), timeout=self.LOCK_TIMEOUT)
+        except Exception as e:
+            log.warning("Shared cache error (oauth-tokens): %s", e)
+            return True
+
+    def _release_shared(self, lock_key):
+        try:
+            self.store.shared.delete(lock_key)
+        except Exception as e:
+            log.warning("Shared cache error (oauth-tokens): %s", e)
+
+    def _wait_for_other_worker(self, key, token_info):
+        """Espera a que otro worker publique el token renovado (None si no llega a tiempo)"""
+        deadline = time.time() + self.LOCK_TIMEOUT
+        while time.time() < deadline:
+            time.sleep(self.WAIT_STEP)
+            latest = self._latest(key, token_info)
+            if self.remaining(latest) > self.PROACTIVE_WINDOW:
+                return latest
+            try:
+                if self.store.shared.get(f"lock:{key}") is None:
+                    return None
+            except Exception:
+                return None
+        return None
+
+    def stats(self):
+        return {
+            'refreshes': self.refreshes,
+            'coalesced': self.coalesced,
+            'proactive': self.proactive,
+            'failures': self.failures
+        }
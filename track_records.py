@@ -0,0 +1,150 @@
+import sys
+
+from flask.json.provider import DefaultJSONProvider
+
+
+class TrackRecord:
+    """
+    Registro compacto de una pista (__slots__, sin dict por instancia).
+    Se usa como un dict (`t['bpm']`, `t.get(...)`, `'id' in t`) y como objeto
+    en las plantillas (`t.name`). Artista, álbum e imagen se internan: en una
+    playlist grande se repiten mucho y así comparten una sola copia.
+    """
+    __slots__ = ('id', 'uri', 'name', 'artist', 'artist_ids', 'album', 'image', 'preview_url',
+                 'duration_ms', 'bpm', 'key', 'is_duplicate', 'isrc')
+
+    def __init__(self, id=None, uri=None, name=None, artist=None, artist_ids=(), album=None, image=None,
+                 preview_url=None, duration_ms=None, bpm=0, key='?', is_duplicate=False, isrc=None):
+        self.id = id
+        self.uri = uri
+        self.name = name
+        self.artist = sys.intern(artist) if artist else artist
+        self.artist_ids = tuple(sys.intern(a) for a in artist_ids) if artist_ids else ()
+        self.album = sys.intern(album) if album else album
+        self.image = sys.intern(image) if image else image
+        self.preview_url = preview_url
+        self.duration_ms = duration_ms
+        self.bpm = bpm
+        self.key = key
+        self.is_duplicate = is_duplicate
+        self.isrc = isrc  # Key of the offline BPM index (bpm_index.py)
+
+    @property
+    def external_url(self):
+        return f"https://open.spotify.com/track/{self.id}" if self.id else None
+
+    # --- Interfaz de dict ---
+
+    def __getitem__(self, name):
+        if name == 'external_url':
+            return self.external_url
+        if name not in self.__slots__:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __setitem__(self, name, value):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        setattr(self, name, value)
+
+    def __contains__(self, name):
+        return name in self.__slots__ or name == 'external_url'
+
+    def get(self, name, default=None):
+        value = self[name] if name in self else None
+        return default if value is None else value
+
+    def keys(self):
+        return self.__slots__
+
+    def items(self):
+        return ((name, getattr(self, name)) for name in self.__slots__)
+
+    def to_dict(self):
+        """Para JSON: sin los campos vacíos"""
+        return {name: value for name, value in self.items() if value is not None}
+
+    def copy(self):
+        """Copia superficial: comparte las cadenas, solo duplica los slots"""
+        clone = object.__new__(TrackRecord)
+        clone.__setstate__(self.__getstate__())
+        return clone
+
+    def __getstate__(self):
+        return (self.id, self.uri, self.name, self.artist, self.artist_ids, self.album, self.image,
+                self.preview_url, self.duration_ms, self.bpm, self.key, self.is_duplicate, self.isrc)
+
+    def __setstate__(self, state):
+        (self.id, self.uri, self.name, self.artist, self.artist_ids, self.album, self.image,
+         self.preview_url, self.duration_ms, self.bpm, self.key, self.is_duplicate, self.isrc) = state
+
+    def __eq__(self, other):
+        return isinstance(other, TrackRecord) and self.__getstate__() == other.__getstate__()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"TrackRecord({self.id!r}, {self.name!r} - {self.artist!r})"
+
+
+class TrackCollection(list):
+    """Lista de TrackRecord con los constructores a partir de respuestas de la API"""
+
+    @staticmethod
+    def smallest_image(images, min_width=64):
+        """La portada más pequeña que aún cubre `min_width` px (las filas pintan 48 px)"""
+        sized = [i for i in images or [] if (i.get('width') or 0) >= min_width]
+        if sized:
+            return min(sized, key=lambda i: i['width'])['url']
+        return images[0]['url'] if images else None
+
+    @classmethod
+    def record_from_api(cls, t, album=None, image='largest', first_artist=False):
+        """
+        TrackRecord desde un objeto track de la API (`album` para los tracks de un álbum).
+        `first_artist`: solo el artista principal (las vistas de playlist y su caché de BPM).
+        """
+        album = album or t.get('album') or {}
+        images = album.get('images')
+        if image == 'smallest':
+            image_url = cls.smallest_image(images)
+        else:
+            image_url = images[0]['url'] if images else None
+        artists = t.get('artists') or []
+        if first_artist:
+            artists = artists[:1]
+        return TrackRecord(
+            id=t.get('id'), uri=t.get('uri'), name=t.get('name'),
+            artist=", ".join(a['name'] for a in artists if a.get('name')),
+            artist_ids=tuple(a['id'] for a in artists if a.get('id')),
+            album=album.get('name'), image=image_url,
+            preview_url=t.get('preview_url'), duration_ms=t.get('duration_ms'),
+            isrc=(t.get('external_ids') or {}).get('isrc'))
+
+    @classmethod
+    def from_playlist_items(cls, items, image='largest', keep_unavailable=False):
+        """
+        Registros desde los `items` de playlist_items. Los vacíos se descartan, o se
+        conservan como hueco si `keep_unavailable` (la paginación necesita las posiciones).
+        """
+        records = cls()
+        for item in items:
+            t = (item or {}).get('track')
+            if t:
+                records.append(cls.record_from_api(t, image=image, first_artist=True))
+            elif keep_unavailable:
+                records.append(TrackRecord(name='No disponible', artist=''))
+        return records
+
+    def copy(self):
+        return TrackCollection(t.copy() for t in self)
+
+
+class TrackJSONProvider(DefaultJSONProvider):
+    """jsonify() de Flask que sabe serializar TrackRecord"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, TrackRecord):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
@@ -0,0 +1,128 @@
+def vibe_from_bpm(avg_bpm):
+    """
+    Métricas aproximadas de "vibra" a partir del BPM medio (0-100).
+    Spotify Audio Features está bloqueado (403), así que derivamos del tempo.
+    """
+    vibe = {'energy': 50, 'danceability': 50, 'valence': 50, 'bpm': 0}
+    if not avg_bpm:
+        return vibe
+    avg_bpm = int(avg_bpm)
+    vibe['bpm'] = avg_bpm
+    # Pseudo-logic: higher BPM usually correlates with higher energy
+    vibe['energy'] = min(95, max(40, int(avg_bpm * 0.6)))
+    # Pseudo-logic: danceability often peaks around 110-130 BPM
+    vibe['danceability'] = min(90, max(45, 100 - abs(120 - avg_bpm)))
+    vibe['valence'] = (vibe['energy'] + vibe['danceability']) // 2
+    return vibe
+
+
+class VibeAggregate:
+    """
+    Resumen de vibra de una playlist mantenido de forma incremental: sumas y
+    conteos por pista más un histograma de BPM (percentiles), de modo que
+    añadir, quitar o enriquecer una pista es O(1) y no hace falta la lista.
+    """
+    HIST_MIN, HIST_MAX, HIST_STEP = 60, 200, 5
+
+    def __init__(self, snapshot_id=None):
+        self.snapshot_id = snapshot_id
+        self.members = {}       # track_id -> [occurrences, bpm, energy, danceability]
+        self.tracks = 0
+        self.bpm_tracks = 0
+        self.bpm_sum = 0
+        self.feature_tracks = 0
+        self.energy_sum = 0
+        self.dance_sum = 0
+        self.histogram = [0] * ((self.HIST_MAX - self.HIST_MIN) // self.HIST_STEP)
+
+    @classmethod
+    def from_tracks(cls, tracks, snapshot_id=None):
+        agg = cls(snapshot_id)
+        for t in tracks:
+            agg.add(t['id'], t.get('bpm') or 0)
+        return agg
+
+    def _bucket(self, bpm):
+        index = (int(bpm) - self.HIST_MIN) // self.HIST_STEP
+        return min(len(self.histogram) - 1, max(0, index))
+
+    def _account(self, member, sign):
+        """Suma (sign=1) o resta (sign=-1) la contribución de `member` a los agregados"""
+        count, bpm, energy, dance = member
+        self.tracks += sign * count
+        if bpm:
+            self.bpm_tracks += sign * count
+            self.bpm_sum += sign * count * bpm
+            self.histogram[self._bucket(bpm)] += sign * count
+        if energy is not None:
+            self.feature_tracks += sign * count
+            self.energy_sum += sign * count * energy
+            self.dance_sum += sign * count * dance
+
+    def add(self, track_id, bpm=0):
+        member = self.members.get(track_id)
+        if member:
+            self._account(member, -1)
+            member[0] += 1
+        else:
+            member = self.members[track_id] = [1, int(bpm or 0), None, None]
+        self._account(member, 1)
+
+    def remove(self, track_id, all_occurrences=True):
+        member = self.members.get(track_id)
+        if not member:
+            return
+        self._account(member, -1)
+        member[0] = 0 if all_occurrences else member[0] - 1
+        if member[0] > 0:
+            self._account(member, 1)
+        else:
+            del self.members[track_id]
+
+    def enrich(self, track_id, bpm=None, energy=None, danceability=None):
+        """Nuevo BPM (y rasgos del analizador) de una pista ya presente"""
+        member = self.members.get(track_id)
+        if not member:
+            return
+        self._account(member, -1)
+        if bpm:
+            member[1] = int(bpm)
+        if energy is not None and danceability is not None:
+            member[2], member[3] = int(energy), int(danceability)
+        self._account(member, 1)
+
+    def bpm_of(self, track_id):
+        member = self.members.get(track_id)
+        return member[1] if member else 0
+
+    def percentile(self, p):
+        """Percentil aproximado del BPM (centro del cubo del histograma)"""
+        if not self.bpm_tracks:
+            return 0
+        target = p / 100 * self.bpm_tracks
+        seen = 0
+        for i, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= target:
+                return self.HIST_MIN + i * self.HIST_STEP + self.HIST_STEP // 2
+        return self.HIST_MAX
+
+    def summary(self):
+        vibe = vibe_from_bpm(self.bpm_sum / self.bpm_tracks if self.bpm_tracks else 0)
+        if self.feature_tracks:
+            # Analyzer features (energy/danceability) replace the tempo-derived guess
+            # in proportion to the tracks they cover
+            weight = self.feature_tracks / max(self.bpm_tracks, self.feature_tracks)
+            vibe['energy'] = round(weight * self.energy_sum / self.feature_tracks + (1 - weight) * vibe['energy'])
+            vibe['danceability'] = round(weight * self.dance_sum / self.feature_tracks + (1 - weight) * vibe['danceability'])
+            vibe['valence'] = (vibe['energy'] + vibe['danceability']) // 2
+        vibe.update({
+            'tracks': self.tracks,
+            'with_bpm': self.bpm_tracks,
+            'bpm_p10': self.percentile(10),
+            'bpm_p50': self.percentile(50),
+            'bpm_p90': self.percentile(90),
+            'histogram': {'min': self.HIST_MIN, 'step': self.HIST_STEP, 'counts': list(self.histogram)},
+            'snapshot_id': self.snapshot_id
+        })
+        return vibe
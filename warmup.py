@@ -0,0 +1,101 @@
+import re
+import threading
+
+from cache_manager import TTLCache
+from log_config import get_logger
+from spotify_manager import SpotifyManager
+
+log = get_logger(__name__)
+
+
+class PlaylistWarmer:
+    """
+    Calienta las cachés tras el login: índice de playlists, canciones de las
+    playlists recientes y de las enlazadas en el historial, y su BPM.
+    Todo en un hilo de fondo y con un presupuesto por usuario.
+    """
+    MAX_PLAYLISTS = 6
+    MAX_TRACKS = 1500
+    MAX_BPM_LOOKUPS = 300
+    COOLDOWN = 1800  # No repetir el warm-up del mismo usuario en 30 min
+
+    _PLAYLIST_URL_RE = re.compile(r'playlist/([A-Za-z0-9]{22})')
+
+    def __init__(self, history_mgr):
+        self.history_mgr = history_mgr
+        self._recent = TTLCache(maxsize=10000, ttl=self.COOLDOWN)
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.playlists_warmed = 0
+        self.tracks_warmed = 0
+        self.bpm_warmed = 0
+
+    def start(self, token_info):
+        """Lanza el warm-up en segundo plano (no bloquea el /callback)"""
+        thread = threading.Thread(target=self._run, args=(token_info,), daemon=True)
+        thread.start()
+        return thread
+
+    def pick_playlists(self, playlists):
+        """Las enlazadas en el historial primero, luego las más recientes del índice"""
+        history_ids = []
+        for entry in self.history_mgr.get_history():
+            m = self._PLAYLIST_URL_RE.search(entry.get('playlist_url') or '')
+            if m:
+                history_ids.append(m.group(1))
+        by_id = {p['id']: p for p in playlists if p}
+        ordered = [by_id[pid] for pid in dict.fromkeys(history_ids) if pid in by_id]
+        picked = {p['id'] for p in ordered}
+        ordered += [p for p in playlists if p and p['id'] not in picked]
+        return ordered[:self.MAX_PLAYLISTS]
+
+    def _run(self, token_info):
+        try:
+            sp = SpotifyManager()
+            user = sp.authenticate_with_token(token_info)
+            with self._lock:
+                if user['id'] in self._recent:
+                    return
+                self._recent.set(user['id'], True)
+                self.jobs += 1
+
+            playlists = sp.get_user_playlists(use_cache=False)
+
+            track_budget = self.MAX_TRACKS
+            to_enrich = []
+            for playlist in self.pick_playlists(playlists):
+                total = (playlist.get('tracks') or {}).get('total', 0)
+                if total > track_budget:
+                    continue
+                tracks = sp.get_playlist_tracks(playlist['id'], snapshot_id=playlist.get('snapshot_id'))
+                track_budget -= len(tracks)
+                to_enrich.extend(tracks)
+                with self._lock:
+                    self.playlists_warmed += 1
+                    self.tracks_warmed += len(tracks)
+
+            # BPM: deduplicated, capped; fills the enrichment cache used by playlist_detail
+            seen = set()
+            targets = []
+            for t in to_enrich:
+                if t['id'] not in seen:
+                    seen.add(t['id'])
+                    targets.append(t)
+            targets = targets[:self.MAX_BPM_LOOKUPS]
+
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                found = sum(1 for bpm in executor.map(
+                    lambda t: sp.fetch_bpm(t['artist'], t['name'], t.get('duration_ms'), isrc=t.get('isrc')), targets) if bpm)
+            with self._lock:
+                self.bpm_warmed += found
+        except Exception as e:
+            log.warning("Warm-up error: %s", e)
+
+    def stats(self):
+        return {
+            'jobs': self.jobs,
+            'playlists': self.playlists_warmed,
+            'tracks': self.tracks_warmed,
+            'bpm': self.bpm_warmed
+        }